@@ -14,6 +14,48 @@ MANAGER_USER_ID = 2  # ID=2
 WEBAPP_URL = "https://6v7876sr-6000.euw.devtunnels.ms/"
 USE_WEBAPP = True  
 
+# Кэш справочников (секунды жизни по моделям)
+REFERENCE_CACHE_TTL = {
+    'sports.center': 3600,
+    'tennis.court': 3600,
+    'training.type': 3600,
+    'hr.employee': 900,
+}
+REFERENCE_CACHE_MAX_ENTRIES = 1000
+REFERENCE_CACHE_VERSION_CHECK_INTERVAL = 300
+
+# Сколько секунд список свободных слотов переиспользуется между шагами записи
+SLOT_CACHE_TTL = 60
+
+# Хранилище состояний диалогов и связей пользователь → партнёр:
+# 'sqlite' (файл, по умолчанию), 'redis' (общее для нескольких процессов бота) или 'memory'
+STORAGE_BACKEND = "sqlite"
+STORAGE_SQLITE_PATH = "bot_state.sqlite3"
+STORAGE_REDIS_URL = "redis://localhost:6379/0"
+STORAGE_FLUSH_INTERVAL = 1.0  # секунды между пакетными сбросами в SQLite
+STORAGE_FLUSH_BATCH_SIZE = 500
+STORAGE_CACHE_MAX_ENTRIES = 10000
+STORAGE_PARTNER_CACHE_TTL = 60  # через сколько секунд связь пользователь → партнёр перечитывается из SQLite
+
+# Режим получения апдейтов: 'polling' (один процесс) или 'webhook' (несколько экземпляров за балансировщиком)
+BOT_MODE = "polling"
+WEBHOOK_BASE_URL = ""  # публичный https-адрес балансировщика
+WEBHOOK_PATH = "/telegram/webhook"
+WEBHOOK_SECRET = ""
+WEBHOOK_HOST = "0.0.0.0"
+WEBHOOK_PORT = 8080
+WEBHOOK_WORKERS = 32  # параллельно обрабатываемых чатов на экземпляр
+WEBHOOK_MAX_PENDING = 1000  # сверх этого Telegram получает 503 и повторяет доставку
+WEBHOOK_MAX_CONNECTIONS = 40
+WEBHOOK_SET_ON_STARTUP = True
+WEBHOOK_SHUTDOWN_TIMEOUT = 10
+
+# Метрики Prometheus отдаются отдельным сервером на METRICS_HOST:METRICS_PORT (не публичным webhook)
+METRICS_ENABLED = True
+METRICS_PATH = "/metrics"
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9101
+
 def load_config():
     return {
         'TELEGRAM_BOT_TOKEN': TELEGRAM_BOT_TOKEN,
@@ -26,6 +68,32 @@ def load_config():
         'MANAGER_USER_ID': MANAGER_USER_ID,
         'WEBAPP_URL': WEBAPP_URL,
         'USE_WEBAPP': USE_WEBAPP,
+        'REFERENCE_CACHE_TTL': REFERENCE_CACHE_TTL,
+        'REFERENCE_CACHE_MAX_ENTRIES': REFERENCE_CACHE_MAX_ENTRIES,
+        'REFERENCE_CACHE_VERSION_CHECK_INTERVAL': REFERENCE_CACHE_VERSION_CHECK_INTERVAL,
+        'SLOT_CACHE_TTL': SLOT_CACHE_TTL,
+        'STORAGE_BACKEND': STORAGE_BACKEND,
+        'STORAGE_SQLITE_PATH': STORAGE_SQLITE_PATH,
+        'STORAGE_REDIS_URL': STORAGE_REDIS_URL,
+        'STORAGE_FLUSH_INTERVAL': STORAGE_FLUSH_INTERVAL,
+        'STORAGE_FLUSH_BATCH_SIZE': STORAGE_FLUSH_BATCH_SIZE,
+        'STORAGE_CACHE_MAX_ENTRIES': STORAGE_CACHE_MAX_ENTRIES,
+        'STORAGE_PARTNER_CACHE_TTL': STORAGE_PARTNER_CACHE_TTL,
+        'BOT_MODE': BOT_MODE,
+        'WEBHOOK_BASE_URL': WEBHOOK_BASE_URL,
+        'WEBHOOK_PATH': WEBHOOK_PATH,
+        'WEBHOOK_SECRET': WEBHOOK_SECRET,
+        'WEBHOOK_HOST': WEBHOOK_HOST,
+        'WEBHOOK_PORT': WEBHOOK_PORT,
+        'WEBHOOK_WORKERS': WEBHOOK_WORKERS,
+        'WEBHOOK_MAX_PENDING': WEBHOOK_MAX_PENDING,
+        'WEBHOOK_MAX_CONNECTIONS': WEBHOOK_MAX_CONNECTIONS,
+        'WEBHOOK_SET_ON_STARTUP': WEBHOOK_SET_ON_STARTUP,
+        'WEBHOOK_SHUTDOWN_TIMEOUT': WEBHOOK_SHUTDOWN_TIMEOUT,
+        'METRICS_ENABLED': METRICS_ENABLED,
+        'METRICS_PATH': METRICS_PATH,
+        'METRICS_HOST': METRICS_HOST,
+        'METRICS_PORT': METRICS_PORT,
     }
 
 
@@ -36,5 +104,9 @@ def validate_config(cfg: dict) -> None:
     ]
     if missing:
         raise RuntimeError(f"Missing required config values: {', '.join(missing)}")
+    if cfg.get('BOT_MODE') not in ('polling', 'webhook'):
+        raise RuntimeError(f"Unknown BOT_MODE: {cfg.get('BOT_MODE')}")
+    if cfg['BOT_MODE'] == 'webhook' and not cfg.get('WEBHOOK_BASE_URL'):
+        raise RuntimeError("BOT_MODE = 'webhook' requires WEBHOOK_BASE_URL")
 
 
@@ -0,0 +1,411 @@
+"""Нагрузочный прогон диалогов бота.
+
+Запускает роутер из main.py на N виртуальных пользователях против локальных
+заглушек Odoo (JSON-RPC с задержками из файла замеров) и Telegram Bot API и
+печатает пропускную способность и p50/p95/p99 по каждому обработчику.
+
+    python loadtest.py --users 200 --latency-file latencies.json
+
+Файл задержек — JSON вида {"training.booking.get_available_slots": [0.012, ...],
+"*": [...]}: для каждого вызова берётся случайный замер по ключу
+"модель.метод", иначе по "*".
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import TelegramObject
+
+import config
+
+
+DEFAULT_LATENCIES = {
+    '*': [0.004, 0.006, 0.008, 0.010, 0.015, 0.025],
+    'training.booking.get_available_slots': [0.020, 0.030, 0.045, 0.060, 0.120],
+    'training.booking.book_slot': [0.040, 0.060, 0.080, 0.150, 0.300],
+    'res.partner.create': [0.030, 0.040, 0.060, 0.100],
+}
+
+WORK_START, WORK_END = 8, 22
+
+
+def _domain_value(domain: list, field: str) -> Any:
+    for leaf in domain or []:
+        if isinstance(leaf, (list, tuple)) and len(leaf) == 3 and leaf[0] == field:
+            return leaf[2]
+    return None
+
+
+def _pick(records: list, fields: Optional[list]) -> list:
+    if not fields:
+        return [dict(rec) for rec in records]
+    return [{'id': rec['id'], **{f: rec.get(f) for f in fields}} for rec in records]
+
+
+class FakeOdoo:
+    """Заглушка Odoo /jsonrpc с минимальным состоянием (партнёры, занятые часы)."""
+
+    def __init__(self, latencies: dict, centers: int = 3, courts_per_center: int = 4,
+                 trainers_per_center: int = 3):
+        self.latencies = latencies
+        self.calls: Counter = Counter()
+        self.centers = [
+            {'id': c, 'name': f"Центр {c}", 'work_start_time': float(WORK_START),
+             'work_end_time': float(WORK_END), 'total_courts': courts_per_center,
+             'write_date': '2024-01-01 00:00:00'}
+            for c in range(1, centers + 1)
+        ]
+        court_ids = itertools.count(1)
+        self.courts = [
+            {'id': next(court_ids), 'name': f"Корт {c}.{n}", 'sports_center_id': c,
+             'surface_type': 'hard', 'capacity': 4, 'has_lighting': True, 'has_roof': False,
+             'state': 'available'}
+            for c in range(1, centers + 1) for n in range(1, courts_per_center + 1)
+        ]
+        trainer_ids = itertools.count(1)
+        self.trainers = [
+            {'id': next(trainer_ids), 'name': f"Тренер {c}.{n}", 'sports_center_id': c,
+             'image_1920': False, 'write_date': '2024-01-01 00:00:00'}
+            for c in range(1, centers + 1) for n in range(1, trainers_per_center + 1)
+        ]
+        self.types = [
+            {'id': 1, 'name': 'Индивидуальная', 'category': 'individual'},
+            {'id': 2, 'name': 'Сплит', 'category': 'split'},
+            {'id': 3, 'name': 'Групповая', 'category': 'group'},
+        ]
+        self.partners: dict[int, dict] = {}
+        self._partner_ids = itertools.count(1)
+        self._booking_ids = itertools.count(1)
+        self.busy: dict[tuple, set] = defaultdict(set)
+
+    def _latency(self, key: str) -> float:
+        samples = self.latencies.get(key) or self.latencies.get('*') or [0.0]
+        return random.choice(samples)
+
+    def _free_hours(self, court_id: int, day: str) -> list[int]:
+        return [h for h in range(WORK_START, WORK_END) if h not in self.busy[(court_id, day)]]
+
+    def _reference(self, model: str) -> Optional[list]:
+        return {
+            'sports.center': self.centers,
+            'tennis.court': self.courts,
+            'hr.employee': self.trainers,
+            'training.type': self.types,
+        }.get(model)
+
+    def execute(self, model: str, method: str, args: list, kwargs: dict) -> Any:
+        records = self._reference(model)
+        if method == 'search_count':
+            return len(records or [])
+        if method == 'search_read':
+            domain = args[0] if args else []
+            fields = args[1] if len(args) > 1 else kwargs.get('fields')
+            if records is None:
+                return []
+            center_id = _domain_value(domain, 'sports_center_id')
+            if center_id is not None:
+                records = [rec for rec in records if rec.get('sports_center_id') == center_id]
+            return _pick(records[:kwargs.get('limit') or None], fields)
+        if method == 'read':
+            ids, fields = args[0], (args[1] if len(args) > 1 else kwargs.get('fields'))
+            if model == 'res.partner':
+                records = list(self.partners.values())
+            return _pick([rec for rec in records or [] if rec['id'] in ids], fields)
+        if model == 'res.partner' and method == 'create':
+            partner_id = next(self._partner_ids)
+            self.partners[partner_id] = dict(args[0], id=partner_id)
+            return partner_id
+        if method == 'write':
+            if model == 'res.partner':
+                for partner_id in args[0]:
+                    self.partners.get(partner_id, {}).update(args[1])
+            return True
+        if model == 'res.partner' and method == 'send_bot_request':
+            return {'success': True, 'message_id': 1, 'activity_id': 1, 'error': None}
+        if model == 'training.booking' and method == 'get_available_slots':
+            court_id, day = args[0], args[1]
+            free = self._free_hours(court_id, day)
+            slots = []
+            for hour in free:
+                ends, end = [], hour + 1
+                while True:
+                    ends.append({'value': float(end), 'label': f"{end:02d}:00"})
+                    if end not in free:
+                        break
+                    end += 1
+                slots.append({'value': float(hour), 'label': f"{hour:02d}:00", 'ends': ends})
+            return slots
+        if model == 'training.booking' and method == 'book_slot':
+            center_id, court_id, day, start, end, partner_id, type_id = args
+            hours = set(range(int(start), int(end)))
+            if hours & self.busy[(court_id, day)]:
+                return {'success': False, 'error_code': 'slot_taken',
+                        'error': 'Выбранное время уже занято. Выберите другое время.'}
+            self.busy[(court_id, day)] |= hours
+            price = 1000.0 * (end - start)
+            partner = self.partners.get(partner_id, {})
+            partner['balance'] = partner.get('balance', 0.0) - price
+            booking_id = next(self._booking_ids)
+            return {
+                'success': True, 'booking_id': booking_id, 'name': f"TB{booking_id:05d}",
+                'booking_date': day, 'start_time': start, 'end_time': end,
+                'start_time_display': f"{int(start):02d}:00", 'end_time_display': f"{int(end):02d}:00",
+                'court': f"Корт {court_id}", 'trainer': '', 'total_price': price,
+                'balance': partner.get('balance', 0.0), 'state': 'confirmed',
+            }
+        return [] if method.startswith('search') else False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        params = payload['params']
+        if params['service'] == 'common':
+            key, result = 'common.authenticate', 2
+        else:
+            model, method, args = params['args'][3], params['args'][4], params['args'][5]
+            kwargs = params['args'][6] if len(params['args']) > 6 else {}
+            key = f"{model}.{method}"
+            result = self.execute(model, method, args, kwargs)
+        self.calls[key] += 1
+        await asyncio.sleep(self._latency(key))
+        return web.json_response({'jsonrpc': '2.0', 'id': payload.get('id'), 'result': result})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/jsonrpc', self.handle)
+        return app
+
+
+class FakeTelegram:
+    """Заглушка Bot API: отвечает успехом и запоминает последнюю клавиатуру чата."""
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self.alerts: Counter = Counter()
+        self.keyboards: dict[int, list] = {}
+        self._message_ids = itertools.count(1000)
+
+    def _message(self, chat_id: int, **extra: Any) -> dict:
+        return {'message_id': next(self._message_ids), 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'}, **extra}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] += 1
+        form = await request.post()
+        chat_id = int(form.get('chat_id') or 0)
+        markup = form.get('reply_markup')
+        if chat_id and markup:
+            inline = json.loads(markup).get('inline_keyboard')
+            if inline:
+                self.keyboards[chat_id] = [b.get('callback_data') for row in inline for b in row]
+        if method == 'answerCallbackQuery':
+            if form.get('show_alert') == 'true':
+                self.alerts[form.get('text') or ''] += 1
+            result: Any = True
+        elif method == 'sendMediaGroup':
+            media = json.loads(form.get('media') or '[]')
+            result = [self._message(chat_id, photo=[{'file_id': f"f{i}", 'file_unique_id': f"u{i}",
+                                                     'width': 1, 'height': 1}])
+                      for i, _ in enumerate(media)]
+        elif method.startswith(('send', 'edit')):
+            result = self._message(chat_id, text=form.get('text') or '')
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
+
+
+class LatencyRecorder(BaseMiddleware):
+    """Сохраняет длительность каждого вызова обработчика для точных перцентилей."""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        name = getattr(getattr(data.get('handler'), 'callback', None), '__name__', 'unknown')
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.samples[name].append(time.perf_counter() - started)
+
+
+class SimulatedUser:
+    """Пользователь Telegram, проходящий регистрацию, просмотр центров, запись и /my_balance."""
+
+    _update_ids = itertools.count(1)
+
+    def __init__(self, user_id: int, dp: Dispatcher, bot: Bot, telegram: FakeTelegram,
+                 odoo: FakeOdoo, think_time: float):
+        self.user_id = user_id
+        self.dp = dp
+        self.bot = bot
+        self.telegram = telegram
+        self.odoo = odoo
+        self.think_time = think_time
+        self.user = {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"}
+        self.chat = {'id': user_id, 'type': 'private'}
+
+    async def _feed(self, **event: Any) -> None:
+        await self.dp.feed_raw_update(self.bot, {'update_id': next(self._update_ids), **event})
+        if self.think_time:
+            await asyncio.sleep(random.uniform(0, 2 * self.think_time))
+
+    async def send(self, text: Optional[str] = None, **extra: Any) -> None:
+        message = {'message_id': next(self._update_ids), 'date': int(time.time()),
+                   'chat': self.chat, 'from': self.user, **extra}
+        if text is not None:
+            message['text'] = text
+            if text.startswith('/'):
+                message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+        await self._feed(message=message)
+
+    async def press(self, data: str) -> None:
+        await self._feed(callback_query={
+            'id': str(next(self._update_ids)), 'from': self.user, 'chat_instance': str(self.user_id),
+            'data': data,
+            'message': {'message_id': 1, 'date': int(time.time()), 'chat': self.chat, 'text': '-'},
+        })
+
+    async def press_any(self, prefix: str) -> bool:
+        """Нажимает случайную кнопку с заданным префиксом из последней клавиатуры."""
+        buttons = [b for b in self.telegram.keyboards.get(self.user_id, []) if b and b.startswith(prefix)]
+        if not buttons:
+            return False
+        await self.press(random.choice(buttons))
+        return True
+
+    async def run(self, main_module: Any) -> None:
+        await self.send('/start')
+        await self.send(f"Пользователь {self.user_id}")
+        await self.send(contact={'phone_number': f"+7900{self.user_id:07d}", 'first_name': 'User',
+                                 'user_id': self.user_id})
+        await self.send('-')
+
+        await self.press('centers:list')
+        if not await self.press_any('centers:detail:'):
+            return
+        await self.press_any('centers:book:')
+        # В текущем меню нет кнопки перехода к выбору типа (choosing_type), поэтому
+        # ставим это состояние напрямую и дальше идём по обычной цепочке до choose_end
+        context = self.dp.fsm.get_context(self.bot, chat_id=self.user_id, user_id=self.user_id)
+        await context.set_state(main_module.BookingStates.choosing_type)
+        await self.press(f"book:type:{random.choice(self.odoo.types)['id']}")
+        for prefix in ('book:court:', 'book:trainer:', 'book:date:', 'book:start:', 'book:end:'):
+            if not await self.press_any(prefix):
+                break
+
+        await self.send('/my_balance')
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def print_report(recorder: LatencyRecorder, odoo: FakeOdoo, telegram: FakeTelegram,
+                 users: int, elapsed: float) -> None:
+    total = sum(len(v) for v in recorder.samples.values())
+    print(f"\nПользователей: {users}, время: {elapsed:.2f} с, "
+          f"обработано апдейтов: {total} ({total / elapsed:.1f}/с), "
+          f"диалогов в секунду: {users / elapsed:.2f}")
+    print(f"\n{'обработчик':<34}{'вызовов':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+    for name, samples in sorted(recorder.samples.items(), key=lambda item: -percentile(item[1], 95)):
+        print(f"{name:<34}{len(samples):>8}"
+              f"{percentile(samples, 50) * 1000:>10.1f}{percentile(samples, 95) * 1000:>10.1f}"
+              f"{percentile(samples, 99) * 1000:>10.1f}{max(samples) * 1000:>10.1f}")
+    print(f"\nВызовы Odoo ({sum(odoo.calls.values())}, на пользователя {sum(odoo.calls.values()) / users:.1f}):")
+    for key, count in odoo.calls.most_common():
+        print(f"  {key:<45}{count:>8}")
+    if telegram.alerts:
+        print("\nВсплывающие ошибки пользователям:")
+        for text, count in telegram.alerts.most_common():
+            print(f"  {count:>6}  {text}")
+
+
+async def run(args: argparse.Namespace) -> None:
+    latencies = DEFAULT_LATENCIES
+    if args.latency_file:
+        with open(args.latency_file, encoding='utf-8') as f:
+            latencies = json.load(f)
+    odoo = FakeOdoo(latencies)
+    telegram = FakeTelegram()
+
+    runners = []
+    for app, port in ((odoo.app(), args.odoo_port), (telegram.app(), args.telegram_port)):
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        runners.append(runner)
+
+    # main.py читает настройки при импорте: подменяем их до импорта
+    config.ODOO_URL = f"http://127.0.0.1:{args.odoo_port}"
+    config.STORAGE_BACKEND = 'memory'
+    config.ADMIN_CHAT_ID = ''
+    import main as main_module
+    logging.getLogger().setLevel(args.log_level)
+
+    recorder = LatencyRecorder()
+    main_module.router.message.middleware(recorder)
+    main_module.router.callback_query.middleware(recorder)
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.include_router(main_module.router)
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{args.telegram_port}"))
+    bot = Bot(token='123456:LOADTEST', session=session)
+
+    users = [SimulatedUser(100000 + i, dp, bot, telegram, odoo, args.think_time) for i in range(args.users)]
+
+    async def start_user(index: int, user: SimulatedUser) -> None:
+        if args.ramp_up:
+            await asyncio.sleep(args.ramp_up * index / len(users))
+        await user.run(main_module)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(start_user(i, u) for i, u in enumerate(users)), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    failures = [r for r in results if isinstance(r, Exception)]
+    for failure in failures[:5]:
+        print(f"Сбой сценария: {failure!r}", file=sys.stderr)
+
+    print_report(recorder, odoo, telegram, args.users, elapsed)
+    await bot.session.close()
+    await main_module.odoo.close()
+    for runner in runners:
+        await runner.cleanup()
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон диалогов Telegram-бота")
+    parser.add_argument('--users', type=int, default=100, help="число виртуальных пользователей")
+    parser.add_argument('--ramp-up', type=float, default=0.0, help="за сколько секунд подключить всех пользователей")
+    parser.add_argument('--think-time', type=float, default=0.0, help="средняя пауза пользователя между шагами, с")
+    parser.add_argument('--latency-file', help="JSON с замерами задержек Odoo по 'модель.метод'")
+    parser.add_argument('--odoo-port', type=int, default=18069)
+    parser.add_argument('--telegram-port', type=int, default=18081)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--log-level', default='WARNING')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    random.seed(arguments.seed)
+    asyncio.run(run(arguments))
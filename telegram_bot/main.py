@@ -2,6 +2,7 @@ import logging
 import base64
 import asyncio
 import json
+import time
 import urllib.parse
 from typing import Optional
 
@@ -9,17 +10,19 @@ from aiogram import Bot, Dispatcher, Router, types
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
 
-from xmlrpc import client as xmlrpc_client
-
 from config import load_config, validate_config
+from odoo_client import OdooClient
+from reference_cache import ReferenceCache
+from storage import create_storage
+from media_cache import FileIdCache
+from webhook import run_webhook
+from metrics import HandlerMetricsMiddleware, run_metrics_server
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-user_partner_map: dict[int, int] = {}
 
 
 class RegistrationStates(StatesGroup):
@@ -39,1008 +42,12 @@ class BookingStates(StatesGroup):
     choosing_end = State()
 
 
-class OdooClient:
-    def __init__(self, url: str, db: str, username: str, password: str):
-        self.url = url.rstrip('/')
-        self.db = db
-        self.username = username
-        self.password = password
-        self.uid: Optional[int] = None
-        self.common_proxy = xmlrpc_client.ServerProxy(f"{self.url}/xmlrpc/2/common")
-        self.object_proxy = xmlrpc_client.ServerProxy(f"{self.url}/xmlrpc/2/object")
-
-    def authenticate(self) -> int:
-        try:
-            logger.info(f"Attempting to authenticate to Odoo: db={self.db}, username={self.username}, url={self.url}")
-            uid = self.common_proxy.authenticate(self.db, self.username, self.password, {})
-            logger.info(f"Authentication result: uid={uid} (type: {type(uid)})")
-            if not uid:
-                logger.error(f"Authentication failed: uid={uid}, db={self.db}, username={self.username}")
-                raise RuntimeError(f"Failed to authenticate to Odoo: invalid credentials or user doesn't exist (db={self.db}, username={self.username})")
-            self.uid = uid
-            logger.info(f"Successfully authenticated: uid={uid}")
-            return uid
-        except Exception as e:
-            logger.exception(f"Exception during authentication: {e}")
-            raise
-
-    def create_partner(self, vals: dict) -> int:
-        if self.uid is None:
-            self.authenticate()
-        partner_id = self.object_proxy.execute_kw(
-            self.db,
-            self.uid,
-            self.password,
-            'res.partner',
-            'create',
-            [vals],
-        )
-        return partner_id
-
-    def write_partner(self, partner_id: int, vals: dict) -> None:
-        if not vals:
-            return
-        if self.uid is None:
-            self.authenticate()
-        self.object_proxy.execute_kw(
-            self.db,
-            self.uid,
-            self.password,
-            'res.partner',
-            'write',
-            [[partner_id], vals],
-        )
-
-    def find_partner_by_phone(self, phone_number: str) -> Optional[dict]:
-        if self.uid is None:
-            self.authenticate()
-        domain = ['|', ('phone', '=', phone_number), ('mobile', '=', phone_number)]
-        partners = self.object_proxy.execute_kw(
-            self.db,
-            self.uid,
-            self.password,
-            'res.partner',
-            'search_read',
-            [domain, ['id', 'name', 'phone', 'mobile', 'email', 'balance', 'telegram_chat_id']],
-            {'limit': 1},
-        )
-        return partners[0] if partners else None
-
-    def read_partner_balance(self, partner_id: int) -> float:
-        if self.uid is None:
-            self.authenticate()
-        res = self.object_proxy.execute_kw(
-            self.db,
-            self.uid,
-            self.password,
-            'res.partner',
-            'read',
-            [[partner_id], ['balance']],
-        )
-        if res and isinstance(res, list):
-            return float(res[0].get('balance') or 0.0)
-        return 0.0
-
-    def get_partner_info(self, partner_id: int) -> Optional[dict]:
-        """Получает информацию о партнере: ФИО и баланс"""
-        if self.uid is None:
-            self.authenticate()
-        res = self.object_proxy.execute_kw(
-            self.db,
-            self.uid,
-            self.password,
-            'res.partner',
-            'read',
-            [[partner_id], ['name', 'balance']],
-        )
-        if res and isinstance(res, list):
-            return res[0]
-        return None
-
-    def get_partner_trainings(self, partner_id: int) -> list:
-        """Получает список тренировок партнера: завершенные и не начатые"""
-        if self.uid is None:
-            self.authenticate()
-        from datetime import date
-        today = date.today().isoformat()
-        completed = self.object_proxy.execute_kw(
-            self.db,
-            self.uid,
-            self.password,
-            'training.booking',
-            'search_read',
-            [[('customer_id', '=', partner_id), ('state', '=', 'completed')]],
-            {
-                'fields': ['name', 'booking_date', 'start_time', 'end_time', 'training_type_id', 'trainer_id', 'court_id', 'state'],
-                'order': 'booking_date desc, start_time desc',
-                'limit': 50,
-            },
-        )
-        not_started = self.object_proxy.execute_kw(
-            self.db,
-            self.uid,
-            self.password,
-            'training.booking',
-            'search_read',
-            [[('customer_id', '=', partner_id), ('state', 'in', ['draft', 'confirmed']), ('booking_date', '>=', today)]],
-            {
-                'fields': ['name', 'booking_date', 'start_time', 'end_time', 'training_type_id', 'trainer_id', 'court_id', 'state'],
-                'order': 'booking_date asc, start_time asc',
-                'limit': 50,
-            },
-        )
-
-        trainings = []
-        for training in completed + not_started:
-            # Форматируем время
-            start_hour = int(training.get('start_time', 0))
-            start_min = int((training.get('start_time', 0) - start_hour) * 60)
-            end_hour = int(training.get('end_time', 0))
-            end_min = int((training.get('end_time', 0) - end_hour) * 60)
-            
-            training_type_name = training.get('training_type_id', [False, ''])[1] if training.get('training_type_id') else 'Не указан'
-            trainer_name = training.get('trainer_id', [False, ''])[1] if training.get('trainer_id') else 'Не указан'
-            court_name = training.get('court_id', [False, ''])[1] if training.get('court_id') else 'Не указан'
-            
-            trainings.append({
-                'id': training.get('id'),
-                'name': training.get('name', 'Без номера'),
-                'date': training.get('booking_date', ''),
-                'start_time': f"{start_hour:02d}:{start_min:02d}",
-                'end_time': f"{end_hour:02d}:{end_min:02d}",
-                'training_type': training_type_name,
-                'trainer': trainer_name,
-                'court': court_name,
-                'state': training.get('state', 'draft'),
-            })
-        
-        return trainings
-
-    def send_booking_request_to_manager(self, partner_id: int, sports_center_id: int) -> bool:
-        """Отправляет сообщение менеджеру о необходимости записать пользователя на тренировку"""
-        if self.uid is None:
-            self.authenticate()
-        try:
-            # Получаем информацию о клиенте
-            partner_info = self.object_proxy.execute_kw(
-                self.db,
-                self.uid,
-                self.password,
-                'res.partner',
-                'read',
-                [[partner_id], ['name', 'phone', 'mobile', 'email']],
-            )
-            if not partner_info:
-                return False
-            
-            partner = partner_info[0]
-            partner_name = partner.get('name', 'Неизвестный клиент')
-            
-            # Получаем информацию о спортивном центре и его менеджере
-            center_info = self.object_proxy.execute_kw(
-                self.db,
-                self.uid,
-                self.password,
-                'sports.center',
-                'read',
-                [[sports_center_id], ['name', 'manager_id']],
-            )
-            if not center_info:
-                logger.error(f"Sports center {sports_center_id} not found")
-                return False
-            
-            center = center_info[0]
-            center_name = center.get('name', 'Неизвестный центр')
-            
-            if not center.get('manager_id'):
-                logger.error(f"Sports center {sports_center_id} ({center_name}) has no manager")
-                return False
-            
-            manager_employee_id = center['manager_id'][0]
-            logger.info(f"Found manager employee ID: {manager_employee_id} for center {center_name}")
-            
-            # Получаем информацию о менеджере (user_id)
-            manager_info = self.object_proxy.execute_kw(
-                self.db,
-                self.uid,
-                self.password,
-                'hr.employee',
-                'read',
-                [[manager_employee_id], ['user_id', 'name']],
-            )
-            if not manager_info or not manager_info[0].get('user_id'):
-                logger.error(f"Manager employee {manager_employee_id} not found or has no user_id")
-                return False
-            
-            manager_user_id = manager_info[0]['user_id'][0]
-            manager_name = manager_info[0].get('name', 'Менеджер')
-            logger.info(f"Found manager user ID: {manager_user_id}, name: {manager_name}")
-            
-            # Получаем partner_id менеджера
-            manager_user_info = self.object_proxy.execute_kw(
-                self.db,
-                self.uid,
-                self.password,
-                'res.users',
-                'read',
-                [[manager_user_id], ['partner_id', 'name']],
-            )
-            if not manager_user_info or not manager_user_info[0].get('partner_id'):
-                logger.error(f"Manager user {manager_user_id} not found or has no partner_id")
-                return False
-            
-            manager_partner_id = manager_user_info[0]['partner_id'][0]
-            logger.info(f"Found manager partner ID: {manager_partner_id}")
-            
-            # Формируем URL для перехода на карточку клиента
-            base_url = self.url.rstrip('/')
-            partner_url = f"{base_url}/web#id={partner_id}&model=res.partner&view_type=form"
-            
-            # Формируем текст сообщения
-            message_body = f"""📝 Необходимо записать на тренировку пользователя
-
-Клиент: {partner_name} (ID: {partner_id})
-Спортивный центр: {center_name}
-Телефон: {partner.get('phone') or partner.get('mobile') or '-'}
-Email: {partner.get('email') or '-'}
-
-{partner_url}
-
-[Открыть карточку клиента]"""
-            
-            # Добавляем менеджера как follower к партнеру
-            try:
-                self.object_proxy.execute_kw(
-                    self.db,
-                    self.uid,
-                    self.password,
-                    'res.partner',
-                    'message_subscribe',
-                    [[partner_id], [manager_partner_id]],
-                )
-                logger.info(f"Added manager {manager_name} as follower to partner {partner_id}")
-            except Exception as e:
-                logger.warning(f"Failed to add manager as follower: {e}")
-            
-            # Создаем сообщение через message_post
-            message_id = None
-            try:
-                # Получаем res_model_id для res.partner
-                res_model_ids = self.object_proxy.execute_kw(
-                    self.db,
-                    self.uid,
-                    self.password,
-                    'ir.model',
-                    'search',
-                    [[('model', '=', 'res.partner')]],
-                    {'limit': 1},
-                )
-                res_model_id = res_model_ids[0] if res_model_ids else None
-                
-                if not res_model_id:
-                    logger.error("Could not find res_model_id for res.partner")
-                    return False
-                
-                # Получаем partner_id текущего пользователя (от имени бота)
-                current_user_info = self.object_proxy.execute_kw(
-                    self.db,
-                    self.uid,
-                    self.password,
-                    'res.users',
-                    'read',
-                    [[self.uid], ['partner_id']],
-                )
-                current_partner_id = current_user_info[0]['partner_id'][0] if current_user_info and current_user_info[0].get('partner_id') else None
-                
-                # Создаем сообщение напрямую через mail.message
-                message_vals = {
-                    'model': 'res.partner',
-                    'res_id': partner_id,
-                    'message_type': 'notification',
-                    'body': message_body,
-                    'subject': f'📝 Необходимо записать на тренировку пользователя {partner_name}',
-                    'partner_ids': [[6, 0, [manager_partner_id]]],
-                }
-                if current_partner_id:
-                    message_vals['author_id'] = current_partner_id
-                
-                message_id = self.object_proxy.execute_kw(
-                    self.db,
-                    self.uid,
-                    self.password,
-                    'mail.message',
-                    'create',
-                    [message_vals],
-                )
-                
-                logger.info(f"Created booking request message: message_id={message_id}")
-                
-            except Exception as e:
-                logger.error(f"Failed to create message: {e}")
-                # Пробуем через message_post как fallback
-                try:
-                    message_id = self.object_proxy.execute_kw(
-                        self.db,
-                        self.uid,
-                        self.password,
-                        'res.partner',
-                        'message_post',
-                        [partner_id],
-                        {
-                            'body': message_body,
-                            'subject': f'📝 Необходимо записать на тренировку пользователя {partner_name}',
-                            'message_type': 'notification',
-                            'partner_ids': [manager_partner_id],
-                        },
-                    )
-                    
-                    if isinstance(message_id, (list, tuple)):
-                        message_id = message_id[0] if message_id else None
-                    
-                    logger.info(f"Created message via message_post (fallback): message_id={message_id}")
-                except Exception as e2:
-                    logger.error(f"Failed to create message via message_post fallback: {e2}")
-                    return False
-            
-            # Принудительно создаем уведомление в Inbox для менеджера
-            if message_id:
-                try:
-                    # Проверяем, существует ли уже уведомление для этого сообщения и партнера
-                    existing_notification = self.object_proxy.execute_kw(
-                        self.db,
-                        self.uid,
-                        self.password,
-                        'mail.notification',
-                        'search',
-                        [[('mail_message_id', '=', message_id), ('res_partner_id', '=', manager_partner_id)]],
-                        {'limit': 1},
-                    )
-                    
-                    if not existing_notification:
-                        # Создаем уведомление для Inbox
-                        try:
-                            notification_id = self.object_proxy.execute_kw(
-                                self.db,
-                                self.uid,
-                                self.password,
-                                'mail.notification',
-                                'create',
-                                [{
-                                    'mail_message_id': message_id,
-                                    'res_partner_id': manager_partner_id,
-                                    'notification_type': 'inbox',
-                                    'notification_status': 'ready',
-                                    'is_read': False,
-                                }],
-                            )
-                            logger.info(f"Created inbox notification: notification_id={notification_id}")
-                        except Exception as create_error:
-                            # Если уведомление уже существует (дубликат), это нормально
-                            error_str = str(create_error)
-                            if 'duplicate key' in error_str.lower() or 'unique constraint' in error_str.lower():
-                                logger.info("Notification already exists (created automatically)")
-                            else:
-                                logger.warning(f"Could not create notification: {create_error}")
-                    else:
-                        logger.info(f"Notification already exists for manager (notification_id: {existing_notification[0] if existing_notification else 'N/A'})")
-                        # Убеждаемся, что уведомление имеет правильный тип
-                        try:
-                            self.object_proxy.execute_kw(
-                                self.db,
-                                self.uid,
-                                self.password,
-                                'mail.notification',
-                                'write',
-                                [existing_notification, {
-                                    'notification_type': 'inbox',
-                                    'notification_status': 'ready',
-                                    'is_read': False,
-                                }],
-                            )
-                            logger.info("Updated notification to ensure it's in inbox")
-                        except Exception as update_error:
-                            logger.warning(f"Could not update notification: {update_error}")
-                            
-                except Exception as e:
-                    logger.warning(f"Could not create/check notification: {e}")
-            
-            # Создаем Activity (задачу) для менеджера
-            try:
-                from datetime import datetime, timedelta
-                activity_type_id = self.object_proxy.execute_kw(
-                    self.db,
-                    self.uid,
-                    self.password,
-                    'mail.activity.type',
-                    'search',
-                    [[('name', 'ilike', 'call')]],
-                    {'limit': 1},
-                )
-                if not activity_type_id:
-                    activity_type_id = self.object_proxy.execute_kw(
-                        self.db,
-                        self.uid,
-                        self.password,
-                        'mail.activity.type',
-                        'search',
-                        [[]],
-                        {'limit': 1},
-                    )
-                
-                if activity_type_id:
-                    activity_type_id = activity_type_id[0]
-                else:
-                    activity_type_id = 1
-                
-                res_model_ids = self.object_proxy.execute_kw(
-                    self.db,
-                    self.uid,
-                    self.password,
-                    'ir.model',
-                    'search',
-                    [[('model', '=', 'res.partner')]],
-                    {'limit': 1},
-                )
-                res_model_id = res_model_ids[0] if res_model_ids else None
-                
-                if res_model_id:
-                    activity_id = self.object_proxy.execute_kw(
-                        self.db,
-                        self.uid,
-                        self.password,
-                        'mail.activity',
-                        'create',
-                        [{
-                            'res_id': partner_id,
-                            'res_model_id': res_model_id,
-                            'activity_type_id': activity_type_id,
-                            'user_id': manager_user_id,
-                            'summary': f'📝 Необходимо записать на тренировку пользователя {partner_name}',
-                            'note': message_body,
-                            'date_deadline': (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d'),
-                        }],
-                    )
-                    logger.info(f"Created activity for manager: activity_id={activity_id}")
-            except Exception as e:
-                logger.warning(f"Could not create activity: {e}")
-            
-            logger.info(f"Successfully sent booking request message to manager {manager_name} (user_id: {manager_user_id}, partner_id: {manager_partner_id})")
-            return True
-            
-        except Exception as e:
-            logger.exception(f"Failed to send booking request to manager: {e}")
-            return False
-
-    def get_trainer_availability_dates(self, trainer_id: int, sports_center_id: int) -> list:
-        """Получает даты, когда тренер работает в текущем месяце"""
-        if self.uid is None:
-            self.authenticate()
-        try:
-            from datetime import date, datetime, timedelta
-            
-            today = date.today()
-            month_start = today.replace(day=1)
-            next_month = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
-            month_end = next_month - timedelta(days=1)
-            
-            # Получаем доступности тренера
-            availabilities = self.object_proxy.execute_kw(
-                self.db,
-                self.uid,
-                self.password,
-                'trainer.availability',
-                'search_read',
-                [[
-                    ('employee_id', '=', trainer_id),
-                    ('sports_center_id', '=', sports_center_id),
-                    ('start_datetime', '<=', datetime.combine(month_end, datetime.max.time()).isoformat()),
-                    ('end_datetime', '>=', datetime.combine(month_start, datetime.min.time()).isoformat()),
-                ]],
-                {'fields': ['start_datetime', 'end_datetime'], 'order': 'start_datetime asc'},
-            )
-            
-            # Собираем уникальные даты работы
-            working_dates = set()
-            for avail in availabilities:
-                try:
-                    # Odoo возвращает дату в формате 'YYYY-MM-DD HH:MM:SS'
-                    start_str = avail['start_datetime']
-                    end_str = avail['end_datetime']
-                    
-                    # Парсим дату
-                    if 'T' in start_str:
-                        start_dt = datetime.fromisoformat(start_str.replace('Z', '+00:00').split('+')[0])
-                    else:
-                        start_dt = datetime.strptime(start_str.split('.')[0], '%Y-%m-%d %H:%M:%S')
-                    
-                    if 'T' in end_str:
-                        end_dt = datetime.fromisoformat(end_str.replace('Z', '+00:00').split('+')[0])
-                    else:
-                        end_dt = datetime.strptime(end_str.split('.')[0], '%Y-%m-%d %H:%M:%S')
-                    
-                    current_date = start_dt.date()
-                    end_date = end_dt.date()
-                    
-                    while current_date <= end_date and current_date <= month_end:
-                        if current_date >= month_start:
-                            working_dates.add(current_date)
-                        current_date += timedelta(days=1)
-                except Exception as e:
-                    logger.warning(f"Failed to parse date from availability: {e}")
-                    continue
-            
-            # Сортируем даты
-            return sorted(list(working_dates))
-        except Exception as e:
-            logger.exception(f"Failed to get trainer availability dates: {e}")
-            return []
-
-    def send_booking_request_to_trainer(self, partner_id: int, trainer_id: int, sports_center_id: int) -> bool:
-        """Отправляет сообщение тренеру о желании клиента записаться к нему"""
-        if self.uid is None:
-            self.authenticate()
-        try:
-            # Получаем информацию о клиенте
-            partner_info = self.object_proxy.execute_kw(
-                self.db,
-                self.uid,
-                self.password,
-                'res.partner',
-                'read',
-                [[partner_id], ['name', 'phone', 'mobile', 'email']],
-            )
-            if not partner_info:
-                return False
-            
-            partner = partner_info[0]
-            partner_name = partner.get('name', 'Неизвестный клиент')
-            
-            # Получаем информацию о тренере
-            trainer_info = self.object_proxy.execute_kw(
-                self.db,
-                self.uid,
-                self.password,
-                'hr.employee',
-                'read',
-                [[trainer_id], ['user_id', 'name']],
-            )
-            if not trainer_info or not trainer_info[0].get('user_id'):
-                logger.error(f"Trainer {trainer_id} not found or has no user_id")
-                return False
-            
-            trainer_user_id = trainer_info[0]['user_id'][0]
-            trainer_name = trainer_info[0].get('name', 'Тренер')
-            
-            # Получаем partner_id тренера
-            trainer_user_info = self.object_proxy.execute_kw(
-                self.db,
-                self.uid,
-                self.password,
-                'res.users',
-                'read',
-                [[trainer_user_id], ['partner_id', 'name']],
-            )
-            if not trainer_user_info or not trainer_user_info[0].get('partner_id'):
-                logger.error(f"Trainer user {trainer_user_id} not found or has no partner_id")
-                return False
-            
-            trainer_partner_id = trainer_user_info[0]['partner_id'][0]
-            
-            # Получаем информацию о спортивном центре
-            center_info = self.object_proxy.execute_kw(
-                self.db,
-                self.uid,
-                self.password,
-                'sports.center',
-                'read',
-                [[sports_center_id], ['name']],
-            )
-            center_name = center_info[0].get('name', 'Неизвестный центр') if center_info else 'Неизвестный центр'
-            
-            # Формируем текст сообщения
-            message_body = f"""🎾 Клиент хочет записаться к Вам на тренировку
-Клиент: {partner_name} (ID: {partner_id})
-Спортивный центр: {center_name}
-Телефон: {partner.get('phone') or partner.get('mobile') or '-'}
-Email: {partner.get('email') or '-'}"""
-            
-            # Добавляем тренера как follower к партнеру
-            try:
-                self.object_proxy.execute_kw(
-                    self.db,
-                    self.uid,
-                    self.password,
-                    'res.partner',
-                    'message_subscribe',
-                    [[partner_id], [trainer_partner_id]],
-                )
-                logger.info(f"Added trainer {trainer_name} as follower to partner {partner_id}")
-            except Exception as e:
-                logger.warning(f"Failed to add trainer as follower: {e}")
-            
-            # Создаем сообщение напрямую через mail.message (как для менеджера)
-            message_id = None
-            try:
-                # Получаем res_model_id для res.partner
-                res_model_ids = self.object_proxy.execute_kw(
-                    self.db,
-                    self.uid,
-                    self.password,
-                    'ir.model',
-                    'search',
-                    [[('model', '=', 'res.partner')]],
-                    {'limit': 1},
-                )
-                res_model_id = res_model_ids[0] if res_model_ids else None
-                
-                if not res_model_id:
-                    logger.error("Could not find res_model_id for res.partner")
-                    return False
-                
-                # Получаем partner_id текущего пользователя (от имени бота)
-                current_user_info = self.object_proxy.execute_kw(
-                    self.db,
-                    self.uid,
-                    self.password,
-                    'res.users',
-                    'read',
-                    [[self.uid], ['partner_id']],
-                )
-                current_partner_id = current_user_info[0]['partner_id'][0] if current_user_info and current_user_info[0].get('partner_id') else None
-                
-                # Создаем сообщение напрямую через mail.message
-                message_vals = {
-                    'model': 'res.partner',
-                    'res_id': partner_id,
-                    'message_type': 'notification',
-                    'body': message_body,
-                    'subject': f'🎾 Клиент {partner_name} хочет записаться к Вам',
-                    'partner_ids': [[6, 0, [trainer_partner_id]]],
-                }
-                if current_partner_id:
-                    message_vals['author_id'] = current_partner_id
-                
-                message_id = self.object_proxy.execute_kw(
-                    self.db,
-                    self.uid,
-                    self.password,
-                    'mail.message',
-                    'create',
-                    [message_vals],
-                )
-                
-                logger.info(f"Created booking request message to trainer: message_id={message_id}")
-                
-            except Exception as e:
-                logger.error(f"Failed to create message: {e}")
-                # Пробуем через message_post как fallback
-                try:
-                    message_id = self.object_proxy.execute_kw(
-                        self.db,
-                        self.uid,
-                        self.password,
-                        'res.partner',
-                        'message_post',
-                        [partner_id],
-                        {
-                            'body': message_body,
-                            'subject': f'🎾 Клиент {partner_name} хочет записаться к Вам',
-                            'message_type': 'notification',
-                            'partner_ids': [trainer_partner_id],
-                        },
-                    )
-                    
-                    if isinstance(message_id, (list, tuple)):
-                        message_id = message_id[0] if message_id else None
-                    
-                    logger.info(f"Created message via message_post (fallback): message_id={message_id}")
-                except Exception as e2:
-                    logger.error(f"Failed to create message via message_post fallback: {e2}")
-                    return False
-            
-            # Принудительно создаем уведомление в Inbox для тренера
-            if message_id:
-                try:
-                    # Проверяем, существует ли уже уведомление для этого сообщения и партнера
-                    existing_notification = self.object_proxy.execute_kw(
-                        self.db,
-                        self.uid,
-                        self.password,
-                        'mail.notification',
-                        'search',
-                        [[('mail_message_id', '=', message_id), ('res_partner_id', '=', trainer_partner_id)]],
-                        {'limit': 1},
-                    )
-                    
-                    if not existing_notification:
-                        # Создаем уведомление для Inbox
-                        try:
-                            notification_id = self.object_proxy.execute_kw(
-                                self.db,
-                                self.uid,
-                                self.password,
-                                'mail.notification',
-                                'create',
-                                [{
-                                    'mail_message_id': message_id,
-                                    'res_partner_id': trainer_partner_id,
-                                    'notification_type': 'inbox',
-                                    'notification_status': 'ready',
-                                    'is_read': False,
-                                }],
-                            )
-                            logger.info(f"Created inbox notification for trainer: notification_id={notification_id}")
-                        except Exception as create_error:
-                            # Если уведомление уже существует (дубликат), это нормально
-                            error_str = str(create_error)
-                            if 'duplicate key' in error_str.lower() or 'unique constraint' in error_str.lower():
-                                logger.info("Notification already exists (created automatically)")
-                            else:
-                                logger.warning(f"Could not create notification for trainer: {create_error}")
-                    else:
-                        logger.info(f"Notification already exists for trainer (notification_id: {existing_notification[0] if existing_notification else 'N/A'})")
-                        # Убеждаемся, что уведомление имеет правильный тип
-                        try:
-                            self.object_proxy.execute_kw(
-                                self.db,
-                                self.uid,
-                                self.password,
-                                'mail.notification',
-                                'write',
-                                [existing_notification, {
-                                    'notification_type': 'inbox',
-                                    'notification_status': 'ready',
-                                    'is_read': False,
-                                }],
-                            )
-                            logger.info("Updated notification to ensure it's in inbox")
-                        except Exception as update_error:
-                            logger.warning(f"Could not update notification: {update_error}")
-                            
-                except Exception as e:
-                    logger.warning(f"Could not create/check notification for trainer: {e}")
-            
-            logger.info(f"Successfully sent booking request message to trainer {trainer_name} (user_id: {trainer_user_id}, partner_id: {trainer_partner_id})")
-            return True
-            
-        except Exception as e:
-            logger.exception(f"Failed to send booking request to trainer: {e}")
-            return False
-
-    def send_balance_request_to_manager(self, partner_id: int, amount: float, manager_user_id: int) -> bool:
-        """Отправляет сообщение менеджеру о запросе пополнения баланса в чат Odoo"""
-        if self.uid is None:
-            self.authenticate()
-        try:
-            # Получаем информацию о клиенте
-            partner_info = self.object_proxy.execute_kw(
-                self.db,
-                self.uid,
-                self.password,
-                'res.partner',
-                'read',
-                [[partner_id], ['name', 'phone', 'mobile', 'email']],
-            )
-            if not partner_info:
-                return False
-            
-            partner = partner_info[0]
-            partner_name = partner.get('name', 'Неизвестный клиент')
-            
-            # Формируем URL для перехода на карточку клиента
-            base_url = self.url.rstrip('/')
-            partner_url = f"{base_url}/web#id={partner_id}&model=res.partner&view_type=form"
-            
-            # Формируем текст сообщения в простом текстовом формате
-            # Odoo может не рендерить HTML в сообщениях, поэтому используем простой текст
-            message_body = f"""💳 Запрос на пополнение баланса
-
-Клиент: {partner_name} (ID: {partner_id})
-Запрашиваемая сумма: {amount:.2f}
-Телефон: {partner.get('phone') or partner.get('mobile') or '-'}
-Email: {partner.get('email') or '-'}
-
-{partner_url}
-
-[Открыть карточку клиента]"""
-            
-            # Получаем partner_id менеджера (Mitchell Admin)
-            manager_info = self.object_proxy.execute_kw(
-                self.db,
-                self.uid,
-                self.password,
-                'res.users',
-                'read',
-                [[manager_user_id], ['partner_id', 'name']],
-            )
-            if not manager_info or not manager_info[0].get('partner_id'):
-                logger.error(f"Manager user {manager_user_id} not found or has no partner_id")
-                return False
-            
-            manager_partner_id = manager_info[0]['partner_id'][0]
-            manager_name = manager_info[0].get('name', 'Менеджер')
-            
-            # Получаем partner_id текущего пользователя (от имени бота)
-            current_user_info = self.object_proxy.execute_kw(
-                self.db,
-                self.uid,
-                self.password,
-                'res.users',
-                'read',
-                [[self.uid], ['partner_id']],
-            )
-            current_partner_id = current_user_info[0]['partner_id'][0] if current_user_info else None
-            
-            # Сначала добавляем менеджера как follower к партнеру
-            try:
-                self.object_proxy.execute_kw(
-                    self.db,
-                    self.uid,
-                    self.password,
-                    'res.partner',
-                    'message_subscribe',
-                    [[partner_id], [manager_partner_id]],
-                )
-                logger.info(f"Added manager {manager_name} as follower to partner {partner_id}")
-            except Exception as e:
-                logger.warning(f"Failed to add manager as follower: {e}")
-            
-            # Создаем сообщение, которое будет видно в Inbox менеджера
-            # Используем комбинацию методов для гарантированного отображения
-            message_id = None
-            
-            try:
-                # Способ 1: Создаем сообщение через message_post на карточке партнера
-                # Это автоматически создаст уведомления для followers
-                message_id = self.object_proxy.execute_kw(
-                    self.db,
-                    self.uid,
-                    self.password,
-                    'res.partner',
-                    'message_post',
-                    [partner_id],
-                    {
-                        'body': message_body,
-                        'subject': f'💳 Запрос на пополнение баланса от {partner_name}',
-                        'message_type': 'notification',
-                        'partner_ids': [manager_partner_id],  # Менеджер - получатель
-                    },
-                )
-                
-                if isinstance(message_id, (list, tuple)):
-                    message_id = message_id[0] if message_id else None
-                
-                logger.info(f"Created message via message_post: message_id={message_id}")
-                
-            except Exception as e:
-                logger.error(f"Failed to create message via message_post: {e}")
-            
-            # Создаем уведомление в Inbox (если message_post не создал его автоматически)
-            if message_id:
-                try:
-                    # Получаем информацию о сообщении, чтобы проверить, есть ли уже уведомления
-                    message_info = self.object_proxy.execute_kw(
-                        self.db,
-                        self.uid,
-                        self.password,
-                        'mail.message',
-                        'read',
-                        [[message_id], ['notification_ids', 'partner_ids']],
-                    )
-                    
-                    if message_info:
-                        # Проверяем, есть ли уже уведомление для менеджера
-                        notification_ids = message_info[0].get('notification_ids', [])
-                        needs_notification = True
-                        
-                        if notification_ids:
-                            # Проверяем существующие уведомления
-                            existing_notifications = self.object_proxy.execute_kw(
-                                self.db,
-                                self.uid,
-                                self.password,
-                                'mail.notification',
-                                'read',
-                                [notification_ids, ['res_partner_id', 'notification_type']],
-                            )
-                            for notif in existing_notifications:
-                                if notif.get('res_partner_id') == manager_partner_id and notif.get('notification_type') == 'inbox':
-                                    needs_notification = False
-                                    break
-                        
-                        if needs_notification:
-                            # Создаем уведомление для Inbox
-                            notification_id = self.object_proxy.execute_kw(
-                                self.db,
-                                self.uid,
-                                self.password,
-                                'mail.notification',
-                                'create',
-                                [{
-                                    'mail_message_id': message_id,
-                                    'res_partner_id': manager_partner_id,
-                                    'notification_type': 'inbox',
-                                    'is_read': False,
-                                }],
-                            )
-                            logger.info(f"Created inbox notification: notification_id={notification_id}")
-                        else:
-                            logger.info("Notification already exists for manager")
-                            
-                except Exception as e:
-                    logger.warning(f"Could not create/check notification: {e}")
-            
-            # Также создаем Activity (задачу) для менеджера, чтобы точно было видно
-            try:
-                from datetime import datetime, timedelta
-                activity_type_id = self.object_proxy.execute_kw(
-                    self.db,
-                    self.uid,
-                    self.password,
-                    'mail.activity.type',
-                    'search',
-                    [[('name', 'ilike', 'call')]],
-                    {'limit': 1},
-                )
-                if not activity_type_id:
-                    # Если нет типа активности, ищем любой доступный
-                    activity_type_id = self.object_proxy.execute_kw(
-                        self.db,
-                        self.uid,
-                        self.password,
-                        'mail.activity.type',
-                        'search',
-                        [[]],
-                        {'limit': 1},
-                    )
-                
-                if activity_type_id:
-                    activity_type_id = activity_type_id[0]
-                else:
-                    activity_type_id = 1  # Используем ID по умолчанию
-                
-                # Получаем res_model_id для res.partner
-                res_model_ids = self.object_proxy.execute_kw(
-                    self.db,
-                    self.uid,
-                    self.password,
-                    'ir.model',
-                    'search',
-                    [[('model', '=', 'res.partner')]],
-                    {'limit': 1},
-                )
-                res_model_id = res_model_ids[0] if res_model_ids else None
-                
-                if res_model_id:
-                    # Создаем активность для менеджера
-                    activity_id = self.object_proxy.execute_kw(
-                        self.db,
-                        self.uid,
-                        self.password,
-                        'mail.activity',
-                        'create',
-                        [{
-                            'res_id': partner_id,
-                            'res_model_id': res_model_id,
-                            'activity_type_id': activity_type_id,
-                            'user_id': manager_user_id,  # Назначаем менеджеру
-                            'summary': f'💳 Запрос на пополнение баланса от {partner_name}',
-                            'note': message_body,
-                            'date_deadline': (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d'),
-                        }],
-                    )
-                    logger.info(f"Created activity for manager: activity_id={activity_id}")
-                else:
-                    logger.warning("Could not find res_model_id for res.partner, skipping activity creation")
-            except Exception as e:
-                logger.warning(f"Could not create activity: {e}")
-            
-            logger.info(f"Successfully sent balance request message to manager {manager_name} (user_id: {manager_user_id}, partner_id: {manager_partner_id}, message_id={message_id})")
-            return True
-            
-        except Exception as e:
-            logger.exception(f"Failed to send balance request to manager: {e}")
-            return False
+class FindSlotStates(StatesGroup):
+    choosing_center = State()
+    choosing_type = State()
+    choosing_trainer = State()
+    choosing_time = State()
+    choosing_slot = State()
 
 
 cfg = load_config()
@@ -1054,6 +61,14 @@ odoo = OdooClient(
     username=cfg['ODOO_USERNAME'],
     password=cfg['ODOO_PASSWORD'],
 )
+reference_cache = ReferenceCache(
+    odoo,
+    ttl=cfg['REFERENCE_CACHE_TTL'],
+    max_entries=cfg['REFERENCE_CACHE_MAX_ENTRIES'],
+)
+fsm_storage, partner_map = create_storage(cfg)
+photo_file_ids = FileIdCache()
+trainer_photo_file_ids = FileIdCache()
 
 
 @router.message(Command("start"))
@@ -1070,7 +85,7 @@ async def cmd_start(message: types.Message, state: FSMContext):
 async def cmd_info(message: types.Message, state: FSMContext):
     """Обработчик команды /info - информация о пользователе и тренировках"""
     # Проверяем, зарегистрирован ли пользователь
-    partner_id = user_partner_map.get(message.from_user.id)
+    partner_id = await partner_map.get(message.from_user.id)
     if not partner_id:
         await message.answer(
             "Вы не зарегистрированы. Пожалуйста, сначала пройдите регистрацию командой /start"
@@ -1079,13 +94,13 @@ async def cmd_info(message: types.Message, state: FSMContext):
     
     try:
         # Получаем информацию о пользователе
-        partner_info = odoo.get_partner_info(partner_id)
+        partner_info = await odoo.get_partner_info(partner_id)
         if not partner_info:
             await message.answer("Не удалось получить информацию о пользователе.")
             return
         
         # Получаем тренировки
-        trainings = odoo.get_partner_trainings(partner_id)
+        trainings = await odoo.get_partner_trainings(partner_id)
         
         # Формируем URL для WebApp с данными пользователя
         webapp_base_url = cfg.get('WEBAPP_URL', 'https://6v7876sr-6000.euw.devtunnels.ms/')
@@ -1147,7 +162,7 @@ async def cmd_info(message: types.Message, state: FSMContext):
 async def cmd_my_balance(message: types.Message, state: FSMContext):
     """Обработчик команды /my_balance - запрос на пополнение баланса"""
     # Проверяем, зарегистрирован ли пользователь
-    partner_id = user_partner_map.get(message.from_user.id)
+    partner_id = await partner_map.get(message.from_user.id)
     if not partner_id:
         await message.answer(
             "Вы не зарегистрированы. Пожалуйста, сначала пройдите регистрацию командой /start"
@@ -1156,7 +171,7 @@ async def cmd_my_balance(message: types.Message, state: FSMContext):
     
     # Получаем текущий баланс
     try:
-        balance = odoo.read_partner_balance(partner_id)
+        balance = await odoo.read_partner_balance(partner_id)
         # Показываем текущий баланс и предлагаем выбрать сумму для пополнения
         kb = InlineKeyboardMarkup(
             inline_keyboard=[
@@ -1180,6 +195,16 @@ async def cmd_my_balance(message: types.Message, state: FSMContext):
         await message.answer("Произошла ошибка при получении баланса. Попробуйте позже.")
 
 
+@router.message(Command("reload"))
+async def cmd_reload(message: types.Message):
+    """Обработчик команды /reload - сброс кэша справочников (только для администратора)"""
+    admin_chat_id = cfg.get('ADMIN_CHAT_ID')
+    if not admin_chat_id or str(message.from_user.id) != str(admin_chat_id).strip():
+        return
+    reference_cache.invalidate()
+    await message.answer("Кэш справочников сброшен.")
+
+
 @router.message(StateFilter(RegistrationStates.waiting_for_name))
 async def process_name(message: types.Message, state: FSMContext):
     if not message.text:
@@ -1216,7 +241,7 @@ async def process_contact(message: types.Message, state: FSMContext):
 
     # Проверка: уже зарегистрирован?
     try:
-        existing = odoo.find_partner_by_phone(phone_number)
+        existing = await odoo.find_partner_by_phone(phone_number)
     except Exception:
         logger.exception("Failed to check existing partner by phone")
         existing = None
@@ -1233,16 +258,13 @@ async def process_contact(message: types.Message, state: FSMContext):
         stored_chat_id_str = str(stored_chat_id) if stored_chat_id else None
         if current_chat_id and current_chat_id != stored_chat_id_str:
             try:
-                odoo.write_partner(existing['id'], {'telegram_chat_id': current_chat_id})
+                await odoo.write_partner(existing['id'], {'telegram_chat_id': current_chat_id})
             except Exception:
                 logger.exception("Failed to update telegram_chat_id for partner %s", existing.get('id'))
         # Если баланс меньше 100 — начислим до 100
         try:
             if balance < 100.0:
-                odoo.object_proxy.execute_kw(
-                    odoo.db,
-                    odoo.uid or odoo.authenticate(),
-                    odoo.password,
+                await odoo.execute_kw(
                     'res.partner',
                     'write',
                     [[existing['id']], {'balance': 100.0}],
@@ -1252,7 +274,7 @@ async def process_contact(message: types.Message, state: FSMContext):
             logger.exception("Failed to top up balance to 100 for existing partner")
         # Привязываем чат к существующему партнёру
         try:
-            user_partner_map[message.from_user.id] = int(existing.get('id'))
+            await partner_map.set(message.from_user.id, int(existing.get('id')))
         except Exception:
             pass
         centers_kb = InlineKeyboardMarkup(
@@ -1315,14 +337,11 @@ async def process_email_and_register(message: types.Message, state: FSMContext):
         logger.info("Creating res.partner with vals: %s", {k: v for k, v in vals.items() if k != 'email' or v})
         # Начисляем стартовый баланс 100
         vals['balance'] = 100.0
-        partner_id = odoo.create_partner(vals)
+        partner_id = await odoo.create_partner(vals)
         # Читаем баланс созданного клиента
         balance = 0.0
         try:
-            balance_list = odoo.object_proxy.execute_kw(
-                odoo.db,
-                odoo.uid or odoo.authenticate(),
-                odoo.password,
+            balance_list = await odoo.execute_kw(
                 'res.partner',
                 'read',
                 [[partner_id], ['balance']],
@@ -1338,7 +357,7 @@ async def process_email_and_register(message: types.Message, state: FSMContext):
         )
         # Привязываем чат к партнеру (в памяти)
         try:
-            user_partner_map[message.from_user.id] = partner_id
+            await partner_map.set(message.from_user.id, partner_id)
         except Exception:
             pass
         await message.answer(f"Вы успешно зарегистрировались! Ваш текущий баланс: {balance:.2f}", reply_markup=centers_kb)
@@ -1362,9 +381,29 @@ async def process_email_and_register(message: types.Message, state: FSMContext):
 
 
 async def main() -> None:
-    dp = Dispatcher(storage=MemoryStorage())
+    # С общим Redis обработка одного чата сериализуется и между экземплярами бота
+    isolation = fsm_storage.create_isolation() if cfg['STORAGE_BACKEND'] == 'redis' else None
+    dp = Dispatcher(storage=fsm_storage, events_isolation=isolation)
+    if cfg['METRICS_ENABLED']:
+        router.message.middleware(HandlerMetricsMiddleware())
+        router.callback_query.middleware(HandlerMetricsMiddleware())
     dp.include_router(router)
-    await dp.start_polling(bot, skip_updates=True)
+    version_watcher = asyncio.create_task(
+        reference_cache.run_version_watcher(cfg['REFERENCE_CACHE_VERSION_CHECK_INTERVAL'])
+    )
+    metrics_runner = None
+    try:
+        if cfg['METRICS_ENABLED']:
+            metrics_runner = await run_metrics_server(cfg['METRICS_HOST'], cfg['METRICS_PORT'], cfg['METRICS_PATH'])
+        if cfg['BOT_MODE'] == 'webhook':
+            await run_webhook(dp, bot, cfg)
+        else:
+            await dp.start_polling(bot, skip_updates=True)
+    finally:
+        version_watcher.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await odoo.close()
 
 
 # ----- Инлайн-обработчики центров -----
@@ -1372,15 +411,7 @@ async def main() -> None:
 @router.callback_query(lambda c: c.data == 'centers:list')
 async def list_centers(callback: types.CallbackQuery):
     try:
-        centers = odoo.object_proxy.execute_kw(
-            odoo.db,
-            odoo.uid or odoo.authenticate(),
-            odoo.password,
-            'sports.center',
-            'search_read',
-            [[]],
-            {'fields': ['name'], 'limit': 25, 'order': 'name asc'},
-        )
+        centers = await reference_cache.list_centers()
         if not centers:
             await callback.message.edit_text("Спортивные центры не найдены.")
             await callback.answer()
@@ -1409,28 +440,13 @@ async def center_detail(callback: types.CallbackQuery):
         parts = callback.data.split(':')
         center_id = int(parts[-1])
         # Читаем центр и связанные корты
-        center_list = odoo.object_proxy.execute_kw(
-            odoo.db,
-            odoo.uid or odoo.authenticate(),
-            odoo.password,
-            'sports.center',
-            'read',
-            [[center_id], ['name', 'work_start_time', 'work_end_time', 'total_courts']],
-        )
-        if not center_list:
+        center = await reference_cache.get_center(center_id)
+        if not center:
             await callback.answer("Центр не найден", show_alert=True)
             return
-        center = center_list[0]
 
         # Ищем корты по sports_center_id
-        courts = odoo.object_proxy.execute_kw(
-            odoo.db,
-            odoo.uid or odoo.authenticate(),
-            odoo.password,
-            'tennis.court',
-            'search_read',
-            [[('sports_center_id', '=', center_id)], ['name', 'surface_type', 'capacity', 'has_lighting', 'has_roof', 'state']],
-        )
+        courts = await reference_cache.get_courts(center_id)
 
         lines = [
             f"🏟 {center.get('name')}",
@@ -1449,47 +465,61 @@ async def center_detail(callback: types.CallbackQuery):
         else:
             lines.append("Кортов не найдено.")
 
-        # Попробуем получить до 5 фотографий центра
+        text_caption = "\n".join(lines).strip()
+
+        # До 5 фотографий центра: сначала только метаданные, байты — лишь для ещё не загруженных в Telegram
         images: list[dict] = []
         try:
-            images = odoo.object_proxy.execute_kw(
-                odoo.db,
-                odoo.uid or odoo.authenticate(),
-                odoo.password,
+            images = await odoo.execute_kw(
                 'sports.center.image',
                 'search_read',
                 [[('sports_center_id', '=', center_id)]],
-                {'fields': ['image', 'name', 'sequence'], 'limit': 5, 'order': 'sequence asc, id asc'},
+                {'fields': ['write_date', 'sequence'], 'limit': 5, 'order': 'sequence asc, id asc'},
             ) or []
+            missing_ids = [img['id'] for img in images if not photo_file_ids.get(img['id'], img['write_date'])]
+            if missing_ids:
+                contents = await odoo.execute_kw('sports.center.image', 'read', [missing_ids, ['image']])
+                raw_images = {rec['id']: rec.get('image') for rec in contents}
+                for img in images:
+                    img['image'] = raw_images.get(img['id'])
         except Exception:
             logger.exception("Failed to load center images")
-
-        text_caption = "\n".join(lines).strip()
+            images = []
 
         if images:
             media: list[types.InputMediaPhoto] = []
+            media_images: list[dict] = []
             for idx, img in enumerate(images):
-                b64 = img.get('image')
-                if not b64:
-                    continue
-                try:
-                    raw = base64.b64decode(b64)
-                except Exception:
-                    continue
-                file_name = f"center_{center_id}_{idx+1}.jpg"
-                input_file = types.BufferedInputFile(raw, filename=file_name)
-                if idx == 0:
-                    media.append(types.InputMediaPhoto(media=input_file, caption=text_caption))
+                photo = photo_file_ids.get(img['id'], img['write_date'])
+                if not photo:
+                    b64 = img.get('image')
+                    if not b64:
+                        continue
+                    try:
+                        raw = base64.b64decode(b64)
+                    except Exception:
+                        continue
+                    photo = types.BufferedInputFile(raw, filename=f"center_{center_id}_{idx+1}.jpg")
+                if not media:
+                    media.append(types.InputMediaPhoto(media=photo, caption=text_caption))
                 else:
-                    media.append(types.InputMediaPhoto(media=input_file))
+                    media.append(types.InputMediaPhoto(media=photo))
+                media_images.append(img)
 
             # Если получилось собрать хотя бы одну фотографию — отправляем медиа-группой
             if media:
                 try:
-                    await callback.message.answer_media_group(media)
+                    sent = await callback.message.answer_media_group(media)
                 except Exception:
                     logger.exception("Failed to send media group, fallback to text only")
+                    # file_id мог стать недействительным — при следующем открытии загрузим заново
+                    for img in media_images:
+                        photo_file_ids.discard(img['id'])
                     media = []
+                else:
+                    for img, msg in zip(media_images, sent):
+                        if msg.photo:
+                            photo_file_ids.set(img['id'], img['write_date'], msg.photo[-1].file_id)
 
             if media:
                 # После фотографий отправим отдельным сообщением кнопки
@@ -1542,7 +572,7 @@ async def handle_favorite_trainer(callback: types.CallbackQuery, state: FSMConte
         answer = callback.data.split(':')[-1]  # 'yes' или 'no'
         data = await state.get_data()
         center_id = data['sports_center_id']
-        partner_id = user_partner_map.get(callback.from_user.id)
+        partner_id = await partner_map.get(callback.from_user.id)
         
         if answer == 'yes':
             # Показываем список тренеров
@@ -1552,15 +582,7 @@ async def handle_favorite_trainer(callback: types.CallbackQuery, state: FSMConte
                 return
             
             # Получаем список тренеров спортивного центра
-            trainers = odoo.object_proxy.execute_kw(
-                odoo.db,
-                odoo.uid or odoo.authenticate(),
-                odoo.password,
-                'hr.employee',
-                'search_read',
-                [[('sports_center_id', '=', center_id), ('position', '=', 'trainer')]],
-                {'fields': ['name', 'image_1920'], 'order': 'name asc'},
-            )
+            trainers = await reference_cache.get_trainers(center_id)
             
             if not trainers:
                 await callback.answer("Тренеры не найдены", show_alert=True)
@@ -1590,7 +612,7 @@ async def handle_favorite_trainer(callback: types.CallbackQuery, state: FSMConte
             return
         
         # Отправляем сообщение менеджеру
-        success = odoo.send_booking_request_to_manager(partner_id, center_id)
+        success = await odoo.send_booking_request_to_manager(partner_id, center_id)
         
         if success:
             await callback.message.edit_text(
@@ -1628,16 +650,9 @@ async def show_trainer_info(callback: types.CallbackQuery, state: FSMContext):
         center_id = data['sports_center_id']
         
         # Получаем информацию о тренере
-        trainer_info = odoo.object_proxy.execute_kw(
-            odoo.db,
-            odoo.uid or odoo.authenticate(),
-            odoo.password,
-            'hr.employee',
-            'read',
-            [[trainer_id], ['name', 'image_1920']],
-        )
+        trainer = await reference_cache.get_trainer(trainer_id)
         
-        if not trainer_info:
+        if not trainer:
             try:
                 await callback.answer("Тренер не найден", show_alert=True)
             except Exception:
@@ -1645,11 +660,10 @@ async def show_trainer_info(callback: types.CallbackQuery, state: FSMContext):
                 await callback.message.answer("Тренер не найден")
             return
         
-        trainer = trainer_info[0]
         trainer_name = trainer.get('name', 'Тренер')
         
         # Получаем даты работы тренера в текущем месяце
-        working_dates = odoo.get_trainer_availability_dates(trainer_id, center_id)
+        working_dates = await odoo.get_trainer_availability_dates(trainer_id, center_id)
         
         # Форматируем даты для отображения
         from datetime import date, datetime
@@ -1690,50 +704,33 @@ async def show_trainer_info(callback: types.CallbackQuery, state: FSMContext):
         # Формируем текст сообщения
         text = f"👤 {trainer_name}\n\n{dates_text}"
         
-        # Получаем фото тренера
-        trainer_image = trainer.get('image_1920')
-        
         # Создаем кнопку "Хочу записаться к нему"
         kb = InlineKeyboardMarkup(
             inline_keyboard=[[InlineKeyboardButton(text="Хочу записаться к нему", callback_data=f"book:request_trainer:{trainer_id}")]]
         )
         
-        if trainer_image:
+        # Фото тренера: file_id уже загруженного в Telegram, байты из Odoo — только при первой отправке
+        photo = None
+        if trainer.get('has_image'):
+            photo = trainer_photo_file_ids.get(trainer_id, trainer['write_date'])
+            if not photo:
+                photo = await load_trainer_photo(trainer_id)
+        
+        if photo:
             try:
-                # Убираем префикс data:image/...;base64, если есть
-                if ',' in trainer_image:
-                    trainer_image = trainer_image.split(',', 1)[1]
-                
-                # Декодируем base64 изображение
-                raw = base64.b64decode(trainer_image)
-                
-                # Проверяем размер изображения (Telegram ограничивает до 10MB)
-                if len(raw) > 10 * 1024 * 1024:
-                    logger.warning(f"Trainer image too large: {len(raw)} bytes")
-                    # Отправляем только текст, если изображение слишком большое
-                    await callback.message.edit_text(text, reply_markup=kb)
-                    # Не отвечаем на callback, так как уже ответили в начале функции
-                    return
-                
-                # Проверяем, что это действительно изображение (проверяем первые байты)
-                if len(raw) < 10:
-                    logger.warning("Trainer image data too short")
-                    await callback.message.edit_text(text, reply_markup=kb)
-                    # Не отвечаем на callback, так как уже ответили в начале функции
-                    return
-                
-                file_name = f"trainer_{trainer_id}.jpg"
-                input_file = types.BufferedInputFile(raw, filename=file_name)
-                
                 # Отправляем фото с подписью
-                await callback.message.answer_photo(
-                    photo=input_file,
+                sent = await callback.message.answer_photo(
+                    photo=photo,
                     caption=text,
                     reply_markup=kb
                 )
+                if sent.photo:
+                    trainer_photo_file_ids.set(trainer_id, trainer['write_date'], sent.photo[-1].file_id)
                 # Не отвечаем на callback, так как уже ответили в начале функции
             except Exception as e:
                 logger.exception(f"Failed to send trainer photo: {e}")
+                # file_id мог стать недействительным — при следующем открытии загрузим заново
+                trainer_photo_file_ids.discard(trainer_id)
                 # Если не удалось отправить фото, отправляем текст
                 try:
                     await callback.message.edit_text(text, reply_markup=kb)
@@ -1758,6 +755,35 @@ async def show_trainer_info(callback: types.CallbackQuery, state: FSMContext):
                 pass
 
 
+async def load_trainer_photo(trainer_id: int) -> Optional[types.BufferedInputFile]:
+    """Читает фото тренера из Odoo; None, если его нельзя отправить в Telegram"""
+    try:
+        res = await odoo.execute_kw('hr.employee', 'read', [[trainer_id], ['image_1920']])
+    except Exception:
+        logger.exception("Failed to load trainer image")
+        return None
+    trainer_image = res[0].get('image_1920') if res else None
+    if not trainer_image:
+        return None
+    # Убираем префикс data:image/...;base64, если есть
+    if ',' in trainer_image:
+        trainer_image = trainer_image.split(',', 1)[1]
+    try:
+        raw = base64.b64decode(trainer_image)
+    except Exception:
+        logger.warning("Trainer image is not valid base64")
+        return None
+    # Проверяем размер изображения (Telegram ограничивает до 10MB)
+    if len(raw) > 10 * 1024 * 1024:
+        logger.warning(f"Trainer image too large: {len(raw)} bytes")
+        return None
+    # Проверяем, что это действительно изображение (проверяем первые байты)
+    if len(raw) < 10:
+        logger.warning("Trainer image data too short")
+        return None
+    return types.BufferedInputFile(raw, filename=f"trainer_{trainer_id}.jpg")
+
+
 @router.callback_query(lambda c: c.data and c.data.startswith('book:request_trainer:'))
 async def request_trainer_booking(callback: types.CallbackQuery, state: FSMContext):
     """Отправляет запрос тренеру о желании клиента записаться"""
@@ -1765,7 +791,7 @@ async def request_trainer_booking(callback: types.CallbackQuery, state: FSMConte
         trainer_id = int(callback.data.split(':')[-1])
         data = await state.get_data()
         center_id = data['sports_center_id']
-        partner_id = user_partner_map.get(callback.from_user.id)
+        partner_id = await partner_map.get(callback.from_user.id)
         
         if not partner_id:
             await callback.answer("Не удалось определить клиента. Повторите регистрацию.", show_alert=True)
@@ -1773,7 +799,7 @@ async def request_trainer_booking(callback: types.CallbackQuery, state: FSMConte
             return
         
         # Отправляем сообщение тренеру
-        success = odoo.send_booking_request_to_trainer(partner_id, trainer_id, center_id)
+        success = await odoo.send_booking_request_to_trainer(partner_id, trainer_id, center_id)
         
         if success:
             try:
@@ -1815,15 +841,7 @@ async def choose_type(callback: types.CallbackQuery, state: FSMContext):
         # После выбора типа — выбираем корт
         data = await state.get_data()
         center_id = data['sports_center_id']
-        courts = odoo.object_proxy.execute_kw(
-            odoo.db,
-            odoo.uid or odoo.authenticate(),
-            odoo.password,
-            'tennis.court',
-            'search_read',
-            [[('sports_center_id', '=', center_id)]],
-            {'fields': ['name']},
-        )
+        courts = await reference_cache.get_courts(center_id)
         if not courts:
             await callback.answer("Кортов не найдено", show_alert=True)
             return
@@ -1881,15 +899,7 @@ async def choose_court(callback: types.CallbackQuery, state: FSMContext):
         # Теперь выбираем тренера (список тренеров центра)
         data = await state.get_data()
         center_id = data['sports_center_id']
-        trainers = odoo.object_proxy.execute_kw(
-            odoo.db,
-            odoo.uid or odoo.authenticate(),
-            odoo.password,
-            'hr.employee',
-            'search_read',
-            [[('sports_center_id', '=', center_id), ('position', '=', 'trainer')]],
-            {'fields': ['name']},
-        )
+        trainers = await reference_cache.get_trainers(center_id)
         if not trainers:
             await callback.answer("Тренеры не найдены", show_alert=True)
             return
@@ -1911,6 +921,26 @@ async def choose_court(callback: types.CallbackQuery, state: FSMContext):
         await callback.answer("Ошибка выбора корта", show_alert=True)
 
 
+async def get_slots(state: FSMContext, data: dict) -> list:
+    """Слоты (начала и допустимые окончания) для корта/даты/тренера из FSM-данных.
+
+    Список запрашивается у Odoo один раз и переиспользуется следующими шагами
+    диалога, пока не истечёт SLOT_CACHE_TTL или не изменятся корт, дата или тренер.
+    Окончательная проверка занятости всё равно выполняется в book_slot.
+    """
+    key = [data['court_id'], data['booking_date'], data.get('trainer_id') or False]
+    cached = data.get('slots')
+    if cached and cached.get('key') == key and time.time() - cached.get('fetched_at', 0) < cfg['SLOT_CACHE_TTL']:
+        return cached['items']
+    items = await odoo.execute_kw(
+        'training.booking',
+        'get_available_slots',
+        [data['court_id'], data['booking_date'], data.get('trainer_id'), data.get('sports_center_id')],
+    ) or []
+    await state.update_data(slots={'key': key, 'fetched_at': time.time(), 'items': items})
+    return items
+
+
 @router.callback_query(StateFilter(BookingStates.choosing_date), lambda c: c.data and c.data.startswith('book:date:'))
 async def choose_date(callback: types.CallbackQuery, state: FSMContext):
     try:
@@ -1918,14 +948,7 @@ async def choose_date(callback: types.CallbackQuery, state: FSMContext):
         await state.update_data(booking_date=iso)
         data = await state.get_data()
         # Получаем доступные тайм-слоты с учётом тренера и корта на выбранный день
-        available = odoo.object_proxy.execute_kw(
-            odoo.db,
-            odoo.uid or odoo.authenticate(),
-            odoo.password,
-            'training.booking',
-            'get_available_times',
-            [data['court_id'], iso, data.get('trainer_id'), data.get('sports_center_id')],
-        )
+        available = await get_slots(state, data)
         if not available:
             await callback.message.edit_text("Нет доступного времени на выбранную дату. Выберите другую дату.")
             await callback.answer()
@@ -1957,23 +980,18 @@ async def choose_start(callback: types.CallbackQuery, state: FSMContext):
     try:
         start_f = float(callback.data.split(':')[-1])
         await state.update_data(start_time=start_f)
-        # Предложим окончания в рамках тех же доступных слотов (после старта)
+        # Окончания берём из уже загруженного списка слотов
         data = await state.get_data()
-        available = odoo.object_proxy.execute_kw(
-            odoo.db,
-            odoo.uid or odoo.authenticate(),
-            odoo.password,
-            'training.booking',
-            'get_available_times',
-            [data['court_id'], data['booking_date'], data.get('trainer_id'), data.get('sports_center_id')],
-        )
+        available = await get_slots(state, data)
+        ends = next((slot.get('ends', []) for slot in available if float(slot.get('value')) == start_f), [])
+        if not ends:
+            await callback.answer("Это время уже занято. Выберите другую дату.", show_alert=True)
+            return
         rows = []
         row = []
-        for slot in available:
-            end_val = float(slot.get('value'))
-            if end_val <= start_f:
-                continue
-            label = slot.get('label') or f"{end_val:.2f}"
+        for end in ends:
+            end_val = float(end.get('value'))
+            label = end.get('label') or f"{end_val:.2f}"
             row.append(InlineKeyboardButton(text=label, callback_data=f"book:end:{end_val}"))
             if len(row) == 4:
                 rows.append(row)
@@ -1989,6 +1007,47 @@ async def choose_start(callback: types.CallbackQuery, state: FSMContext):
         await callback.answer("Ошибка выбора времени", show_alert=True)
 
 
+async def book_slot_and_reply(callback: types.CallbackQuery, state: FSMContext, data: dict, partner_id: int) -> None:
+    """Бронирует слот одним вызовом training.booking.book_slot и показывает результат"""
+    result = await odoo.execute_kw(
+        'training.booking',
+        'book_slot',
+        [
+            data['sports_center_id'],
+            data['court_id'],
+            data['booking_date'],
+            data['start_time'],
+            data['end_time'],
+            partner_id,
+            data['training_type_id'],
+        ],
+        {'trainer_id': data.get('trainer_id') or False},
+    )
+    if not result.get('success'):
+        logger.info(f"Booking rejected for partner {partner_id}: {result.get('error_code')} {result.get('error')}")
+        await callback.answer(result.get('error') or "Не удалось создать запись", show_alert=True)
+        if result.get('error_code') == 'slot_taken':
+            # Сохранённый список слотов устарел
+            await state.update_data(slots=None)
+        else:
+            await state.clear()
+        return
+    lines = [
+        "Запись создана и подтверждена!",
+        f"Номер: {result['name']}",
+        f"Дата: {result['booking_date']}",
+        f"Время: {result['start_time_display']} — {result['end_time_display']}",
+        f"Корт: {result['court']}",
+    ]
+    if result.get('trainer'):
+        lines.append(f"Тренер: {result['trainer']}")
+    lines.append(f"Стоимость: {result['total_price']:.2f} руб.")
+    lines.append(f"Баланс: {result['balance']:.2f} руб.")
+    await callback.message.edit_text("\n".join(lines))
+    await state.clear()
+    await callback.answer()
+
+
 @router.callback_query(StateFilter(BookingStates.choosing_end), lambda c: c.data and c.data.startswith('book:end:'))
 async def choose_end(callback: types.CallbackQuery, state: FSMContext):
     try:
@@ -1996,50 +1055,12 @@ async def choose_end(callback: types.CallbackQuery, state: FSMContext):
         await state.update_data(end_time=end_f)
         # Создаём запись сразу (тренер уже выбран ранее)
         data = await state.get_data()
-        partner_id = user_partner_map.get(callback.from_user.id)
+        partner_id = await partner_map.get(callback.from_user.id)
         if not partner_id:
             await callback.answer("Не удалось определить клиента. Повторите регистрацию.", show_alert=True)
             await state.clear()
             return
-        vals = {
-            'sports_center_id': data['sports_center_id'],
-            'customer_id': partner_id,
-            'training_type_id': data['training_type_id'],
-            'court_id': data['court_id'],
-            'booking_date': data['booking_date'],
-            'start_time': data['start_time'],
-            'end_time': data['end_time'],
-            'trainer_id': data['trainer_id'],
-            'state': 'draft',  # Создаём в draft, потом подтвердим
-        }
-        booking_id = odoo.object_proxy.execute_kw(
-            odoo.db,
-            odoo.uid or odoo.authenticate(),
-            odoo.password,
-            'training.booking',
-            'create',
-            [vals],
-        )
-        # Подтверждаем запись (списывает баланс)
-        try:
-            odoo.object_proxy.execute_kw(
-                odoo.db,
-                odoo.uid or odoo.authenticate(),
-                odoo.password,
-                'training.booking',
-                'action_confirm',
-                [[booking_id]],
-            )
-        except Exception:
-            logger.exception("Failed to confirm booking, but created as draft")
-            # Запись создана в draft, но не подтверждена
-        await callback.message.edit_text(
-            "Запись создана!\n"
-            f"Дата: {data['booking_date']}\n"
-            f"Время: {data['start_time']:.2f} — {data['end_time']:.2f}"
-        )
-        await state.clear()
-        await callback.answer()
+        await book_slot_and_reply(callback, state, data, partner_id)
     except Exception:
         logger.exception("Failed to create booking")
         await callback.answer("Ошибка создания записи", show_alert=True)
@@ -2054,7 +1075,7 @@ async def handle_balance_request(callback: types.CallbackQuery):
         amount = float(amount_str)
         
         # Получаем ID партнера
-        partner_id = user_partner_map.get(callback.from_user.id)
+        partner_id = await partner_map.get(callback.from_user.id)
         if not partner_id:
             await callback.answer("Не удалось определить клиента. Повторите регистрацию.", show_alert=True)
             return
@@ -2066,7 +1087,7 @@ async def handle_balance_request(callback: types.CallbackQuery):
             return
         
         # Отправляем сообщение менеджеру в Odoo
-        success = odoo.send_balance_request_to_manager(partner_id, amount, int(manager_user_id))
+        success = await odoo.send_balance_request_to_manager(partner_id, amount, int(manager_user_id))
         
         if success:
             await callback.message.edit_text(
@@ -2091,40 +1112,198 @@ async def finalize_booking(callback: types.CallbackQuery, state: FSMContext):
         data = await state.get_data()
 
         # Ищем клиента по сохранённому соответствию
-        partner_id = user_partner_map.get(callback.from_user.id)
+        partner_id = await partner_map.get(callback.from_user.id)
         if not partner_id:
             await callback.answer("Не удалось определить клиента. Повторите регистрацию.", show_alert=True)
             await state.clear()
             return
 
-        # Создаём training.booking
-        vals = {
-            'sports_center_id': data['sports_center_id'],
-            'customer_id': partner_id,
-            'training_type_id': data['training_type_id'],
-            'court_id': data['court_id'],
-            'booking_date': data['booking_date'],
-            'start_time': data['start_time'],
-            'end_time': data['end_time'],
-            'state': 'confirmed',
-        }
-        booking_id = odoo.object_proxy.execute_kw(
-            odoo.db,
-            odoo.uid or odoo.authenticate(),
-            odoo.password,
-            'training.booking',
-            'create',
-            [vals],
-        )
-        await callback.message.edit_text(
-            "Запись создана!\n"
-            f"Дата: {data['booking_date']}\n"
-            f"Время: {data['start_time']:.2f} — {data['end_time']:.2f}"
+        await book_slot_and_reply(callback, state, data, partner_id)
+    except Exception:
+        logger.exception("Failed to create booking")
+        await callback.answer("Ошибка создания записи", show_alert=True)
+
+
+# ----- Поиск ближайшего свободного слота (/find) -----
+
+# Части суток для поиска: ключ -> (подпись, с какого часа, до какого часа)
+FIND_TIME_RANGES = {
+    'morning': ("Утро", 6.0, 12.0),
+    'day': ("День", 12.0, 17.0),
+    'evening': ("Вечер", 17.0, 23.0),
+    'any': ("Любое время", False, False),
+}
+FIND_DAYS_AHEAD = 7
+FIND_LIMIT = 6
+WEEKDAY_NAMES = ('Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс')
+
+
+def _button_rows(buttons: list, per_row: int = 2) -> list:
+    return [buttons[i:i + per_row] for i in range(0, len(buttons), per_row)]
+
+
+@router.message(Command("find"))
+async def cmd_find(message: types.Message, state: FSMContext):
+    """Обработчик команды /find - поиск ближайшего свободного времени одним запросом"""
+    partner_id = await partner_map.get(message.from_user.id)
+    if not partner_id:
+        await message.answer(
+            "Вы не зарегистрированы. Пожалуйста, сначала пройдите регистрацию командой /start"
         )
+        return
+    try:
+        centers = await reference_cache.list_centers()
+        if not centers:
+            await message.answer("Спортивные центры не найдены.")
+            return
         await state.clear()
+        kb = InlineKeyboardMarkup(inline_keyboard=_button_rows([
+            InlineKeyboardButton(text=center['name'], callback_data=f"find:center:{center['id']}")
+            for center in centers
+        ]))
+        await message.answer("Выберите спортивный центр:", reply_markup=kb)
+        await state.set_state(FindSlotStates.choosing_center)
+    except Exception:
+        logger.exception("Failed to start slot search")
+        await message.answer("Произошла ошибка. Попробуйте позже.")
+
+
+@router.callback_query(StateFilter(FindSlotStates.choosing_center), lambda c: c.data and c.data.startswith('find:center:'))
+async def find_choose_center(callback: types.CallbackQuery, state: FSMContext):
+    try:
+        center_id = int(callback.data.split(':')[-1])
+        await state.update_data(sports_center_id=center_id)
+        types_list = await reference_cache.get_training_types()
+        if not types_list:
+            await callback.answer("Типы тренировок не найдены", show_alert=True)
+            return
+        kb = InlineKeyboardMarkup(inline_keyboard=_button_rows([
+            InlineKeyboardButton(text=tt['name'], callback_data=f"find:type:{tt['id']}")
+            for tt in types_list
+        ]))
+        await callback.message.edit_text("Выберите тип тренировки:", reply_markup=kb)
+        await state.set_state(FindSlotStates.choosing_type)
         await callback.answer()
     except Exception:
-        logger.exception("Failed to create booking")
+        logger.exception("Failed to list training types for slot search")
+        await callback.answer("Ошибка загрузки типов тренировок", show_alert=True)
+
+
+@router.callback_query(StateFilter(FindSlotStates.choosing_type), lambda c: c.data and c.data.startswith('find:type:'))
+async def find_choose_type(callback: types.CallbackQuery, state: FSMContext):
+    try:
+        type_id = int(callback.data.split(':')[-1])
+        await state.update_data(training_type_id=type_id)
+        data = await state.get_data()
+        trainers = await reference_cache.get_trainers(data['sports_center_id'])
+        buttons = [InlineKeyboardButton(text="Любой тренер", callback_data="find:trainer:0")]
+        buttons += [
+            InlineKeyboardButton(text=tr['name'], callback_data=f"find:trainer:{tr['id']}")
+            for tr in trainers
+        ]
+        kb = InlineKeyboardMarkup(inline_keyboard=_button_rows(buttons))
+        await callback.message.edit_text("Предпочтительный тренер:", reply_markup=kb)
+        await state.set_state(FindSlotStates.choosing_trainer)
+        await callback.answer()
+    except Exception:
+        logger.exception("Failed to list trainers for slot search")
+        await callback.answer("Ошибка загрузки тренеров", show_alert=True)
+
+
+@router.callback_query(StateFilter(FindSlotStates.choosing_trainer), lambda c: c.data and c.data.startswith('find:trainer:'))
+async def find_choose_trainer(callback: types.CallbackQuery, state: FSMContext):
+    try:
+        trainer_id = int(callback.data.split(':')[-1])
+        await state.update_data(preferred_trainer_id=trainer_id or False)
+        kb = InlineKeyboardMarkup(inline_keyboard=_button_rows([
+            InlineKeyboardButton(text=label, callback_data=f"find:time:{key}")
+            for key, (label, _start, _end) in FIND_TIME_RANGES.items()
+        ]))
+        await callback.message.edit_text("Когда удобно?", reply_markup=kb)
+        await state.set_state(FindSlotStates.choosing_time)
+        await callback.answer()
+    except Exception:
+        logger.exception("Failed to choose trainer for slot search")
+        await callback.answer("Ошибка выбора тренера", show_alert=True)
+
+
+@router.callback_query(StateFilter(FindSlotStates.choosing_time), lambda c: c.data and c.data.startswith('find:time:'))
+async def find_choose_time(callback: types.CallbackQuery, state: FSMContext):
+    try:
+        _label, time_from, time_to = FIND_TIME_RANGES.get(callback.data.split(':')[-1], FIND_TIME_RANGES['any'])
+        data = await state.get_data()
+        partner_id = await partner_map.get(callback.from_user.id)
+        from datetime import date, timedelta
+        today = date.today()
+        found = await odoo.execute_kw(
+            'training.booking',
+            'find_free_slots',
+            [
+                data['sports_center_id'],
+                data['training_type_id'],
+                today.isoformat(),
+                (today + timedelta(days=FIND_DAYS_AHEAD - 1)).isoformat(),
+            ],
+            {
+                'trainer_id': data.get('preferred_trainer_id') or False,
+                'time_from': time_from,
+                'time_to': time_to,
+                'limit': FIND_LIMIT,
+                'customer_id': partner_id or False,
+            },
+        ) or []
+        if not found:
+            await callback.message.edit_text(
+                f"Свободного времени в ближайшие {FIND_DAYS_AHEAD} дней не нашлось. "
+                "Попробуйте другое время суток или /find заново."
+            )
+            await state.clear()
+            await callback.answer()
+            return
+        rows = []
+        for index, slot in enumerate(found):
+            day = date.fromisoformat(slot['booking_date'])
+            text = (
+                f"{WEEKDAY_NAMES[day.weekday()]} {day.strftime('%d.%m')} "
+                f"{slot['start_time_display']}–{slot['end_time_display']} · {slot['court']}"
+            )
+            if slot.get('trainer'):
+                text += f" · {slot['trainer']}"
+            rows.append([InlineKeyboardButton(text=text, callback_data=f"find:pick:{index}")])
+        await state.update_data(found_slots=found)
+        await callback.message.edit_text("Ближайшее свободное время:", reply_markup=InlineKeyboardMarkup(inline_keyboard=rows))
+        await state.set_state(FindSlotStates.choosing_slot)
+        await callback.answer()
+    except Exception:
+        logger.exception("Failed to find free slots")
+        await callback.answer("Ошибка поиска свободного времени", show_alert=True)
+
+
+@router.callback_query(StateFilter(FindSlotStates.choosing_slot), lambda c: c.data and c.data.startswith('find:pick:'))
+async def find_pick_slot(callback: types.CallbackQuery, state: FSMContext):
+    try:
+        index = int(callback.data.split(':')[-1])
+        data = await state.get_data()
+        found = data.get('found_slots') or []
+        if index >= len(found):
+            await callback.answer("Вариант устарел. Выполните /find заново.", show_alert=True)
+            return
+        partner_id = await partner_map.get(callback.from_user.id)
+        if not partner_id:
+            await callback.answer("Не удалось определить клиента. Повторите регистрацию.", show_alert=True)
+            await state.clear()
+            return
+        slot = found[index]
+        data.update(
+            court_id=slot['court_id'],
+            booking_date=slot['booking_date'],
+            start_time=slot['start_time'],
+            end_time=slot['end_time'],
+            trainer_id=slot['trainer_id'],
+        )
+        await book_slot_and_reply(callback, state, data, partner_id)
+    except Exception:
+        logger.exception("Failed to book found slot")
         await callback.answer("Ошибка создания записи", show_alert=True)
 
 
@@ -0,0 +1,30 @@
+from collections import OrderedDict
+from typing import Optional
+
+
+class FileIdCache:
+    """Telegram file_id уже загруженных фотографий.
+
+    Ключ — id записи изображения в Odoo, вместе с file_id хранится write_date:
+    если фото заменили, write_date меняется и старый file_id не используется.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._data: OrderedDict[int, tuple[str, str]] = OrderedDict()
+
+    def get(self, image_id: int, write_date: str) -> Optional[str]:
+        item = self._data.get(image_id)
+        if item is None or item[0] != write_date:
+            return None
+        self._data.move_to_end(image_id)
+        return item[1]
+
+    def set(self, image_id: int, write_date: str, file_id: str) -> None:
+        self._data[image_id] = (write_date, file_id)
+        self._data.move_to_end(image_id)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def discard(self, image_id: int) -> None:
+        self._data.pop(image_id, None)
@@ -0,0 +1,192 @@
+import bisect
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _header(self) -> list[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for labels, value in self._values.items():
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, *labels: Any, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: Any, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) - amount
+
+    def set(self, value: float, *labels: Any) -> None:
+        self._values[labels] = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Значение без меток вычисляется в момент выгрузки метрик."""
+        self._function = function
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        if self._function is not None:
+            lines.append(f'{self.name} {self._function()}')
+        for labels, value in self._values.items():
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счётчики по корзинам (+Inf последняя), сумма]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: Any) -> None:
+        item = self._values.get(labels)
+        if item is None:
+            item = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        item[0][bisect.bisect_left(self.buckets, value)] += 1
+        item[1] += value
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+RPC_DURATION = REGISTRY.register(Histogram(
+    'odoo_rpc_duration_seconds', 'Duration of Odoo JSON-RPC calls', ('model', 'method'),
+))
+RPC_ERRORS = REGISTRY.register(Counter(
+    'odoo_rpc_errors_total', 'Failed Odoo JSON-RPC calls', ('model', 'method', 'error'),
+))
+RPC_IN_FLIGHT = REGISTRY.register(Gauge(
+    'odoo_rpc_in_flight', 'Odoo JSON-RPC calls currently in progress',
+))
+HANDLER_DURATION = REGISTRY.register(Histogram(
+    'bot_handler_duration_seconds', 'Duration of bot update handlers', ('handler',),
+))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    'bot_handler_errors_total', 'Bot update handlers that raised an exception', ('handler', 'error'),
+))
+HANDLER_IN_FLIGHT = REGISTRY.register(Gauge(
+    'bot_handlers_in_flight', 'Bot update handlers currently in progress',
+))
+WEBHOOK_PENDING = REGISTRY.register(Gauge(
+    'bot_webhook_pending_updates', 'Accepted webhook updates not yet processed',
+))
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware aiogram: время выполнения и ошибки каждого обработчика."""
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+        HANDLER_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            HANDLER_DURATION.observe(time.perf_counter() - started, name)
+            HANDLER_IN_FLIGHT.dec()
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=REGISTRY.render(), content_type='text/plain', charset='utf-8',
+                        headers={'X-Content-Type-Options': 'nosniff'})
+
+
+def add_metrics_route(app: web.Application, path: str = '/metrics') -> None:
+    app.router.add_get(path, metrics_handler)
+
+
+async def run_metrics_server(host: str, port: int, path: str = '/metrics') -> web.AppRunner:
+    """Отдельный HTTP-сервер метрик (для режима polling)."""
+    app = web.Application()
+    add_metrics_route(app, path)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics available on {host}:{port}{path}")
+    return runner
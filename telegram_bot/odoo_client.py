@@ -0,0 +1,296 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Optional
+
+import aiohttp
+
+from metrics import RPC_DURATION, RPC_ERRORS, RPC_IN_FLIGHT
+
+
+logger = logging.getLogger(__name__)
+
+
+class OdooRPCError(Exception):
+    """Ошибка, возвращённая Odoo в ответе JSON-RPC."""
+
+    def __init__(self, message: str, data: Optional[dict] = None):
+        super().__init__(message)
+        self.data = data or {}
+
+
+class OdooClient:
+    """Асинхронный клиент Odoo поверх JSON-RPC (/jsonrpc).
+
+    Все запросы идут через один aiohttp.ClientSession с пулом keep-alive
+    соединений, поэтому медленный вызов Odoo не блокирует event loop бота,
+    а параллельные обработчики разных пользователей выполняются одновременно.
+    """
+
+    def __init__(self, url: str, db: str, username: str, password: str,
+                 pool_size: int = 100, timeout: float = 30.0):
+        self.url = url.rstrip('/')
+        self.db = db
+        self.username = username
+        self.password = password
+        self.uid: Optional[int] = None
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._auth_lock = asyncio.Lock()
+        self._request_ids = itertools.count(1)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _call(self, service: str, method: str, *args: Any) -> Any:
+        payload = {
+            'jsonrpc': '2.0',
+            'method': 'call',
+            'params': {'service': service, 'method': method, 'args': list(args)},
+            'id': next(self._request_ids),
+        }
+        async with self._get_session().post(f"{self.url}/jsonrpc", json=payload) as response:
+            response.raise_for_status()
+            result = await response.json(content_type=None)
+        error = result.get('error')
+        if error:
+            data = error.get('data') or {}
+            raise OdooRPCError(data.get('message') or error.get('message') or str(error), data)
+        return result.get('result')
+
+    async def authenticate(self) -> int:
+        async with self._auth_lock:
+            if self.uid is not None:
+                return self.uid
+            try:
+                logger.info(f"Attempting to authenticate to Odoo: db={self.db}, username={self.username}, url={self.url}")
+                uid = await self._call('common', 'authenticate', self.db, self.username, self.password, {})
+                logger.info(f"Authentication result: uid={uid} (type: {type(uid)})")
+                if not uid:
+                    logger.error(f"Authentication failed: uid={uid}, db={self.db}, username={self.username}")
+                    raise RuntimeError(f"Failed to authenticate to Odoo: invalid credentials or user doesn't exist (db={self.db}, username={self.username})")
+                self.uid = uid
+                logger.info(f"Successfully authenticated: uid={uid}")
+                return uid
+            except Exception as e:
+                logger.exception(f"Exception during authentication: {e}")
+                raise
+
+    async def execute_kw(self, model: str, method: str, args: list, kwargs: Optional[dict] = None) -> Any:
+        """Вызывает метод модели Odoo (аналог execute_kw в XML-RPC)."""
+        uid = self.uid if self.uid is not None else await self.authenticate()
+        RPC_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            return await self._call('object', 'execute_kw', self.db, uid, self.password, model, method, args, kwargs or {})
+        except Exception as e:
+            RPC_ERRORS.inc(model, method, type(e).__name__)
+            raise
+        finally:
+            RPC_DURATION.observe(time.perf_counter() - started, model, method)
+            RPC_IN_FLIGHT.dec()
+
+    async def create_partner(self, vals: dict) -> int:
+        partner_id = await self.execute_kw(
+            'res.partner',
+            'create',
+            [vals],
+        )
+        return partner_id
+
+    async def write_partner(self, partner_id: int, vals: dict) -> None:
+        if not vals:
+            return
+        await self.execute_kw(
+            'res.partner',
+            'write',
+            [[partner_id], vals],
+        )
+
+    async def find_partner_by_phone(self, phone_number: str) -> Optional[dict]:
+        domain = ['|', ('phone', '=', phone_number), ('mobile', '=', phone_number)]
+        partners = await self.execute_kw(
+            'res.partner',
+            'search_read',
+            [domain, ['id', 'name', 'phone', 'mobile', 'email', 'balance', 'telegram_chat_id']],
+            {'limit': 1},
+        )
+        return partners[0] if partners else None
+
+    async def read_partner_balance(self, partner_id: int) -> float:
+        res = await self.execute_kw(
+            'res.partner',
+            'read',
+            [[partner_id], ['balance']],
+        )
+        if res and isinstance(res, list):
+            return float(res[0].get('balance') or 0.0)
+        return 0.0
+
+    async def get_partner_info(self, partner_id: int) -> Optional[dict]:
+        """Получает информацию о партнере: ФИО и баланс"""
+        res = await self.execute_kw(
+            'res.partner',
+            'read',
+            [[partner_id], ['name', 'balance']],
+        )
+        if res and isinstance(res, list):
+            return res[0]
+        return None
+
+    async def get_partner_trainings(self, partner_id: int) -> list:
+        """Получает список тренировок партнера: завершенные и не начатые"""
+        from datetime import date
+        today = date.today().isoformat()
+        # Оба запроса независимы — выполняем их параллельно
+        completed, not_started = await asyncio.gather(
+            self.execute_kw(
+                'training.booking',
+                'search_read',
+                [[('customer_id', '=', partner_id), ('state', '=', 'completed')]],
+                {
+                    'fields': ['name', 'booking_date', 'start_time', 'end_time', 'training_type_id', 'trainer_id', 'court_id', 'state'],
+                    'order': 'booking_date desc, start_time desc',
+                    'limit': 50,
+                },
+            ),
+            self.execute_kw(
+                'training.booking',
+                'search_read',
+                [[('customer_id', '=', partner_id), ('state', 'in', ['draft', 'confirmed']), ('booking_date', '>=', today)]],
+                {
+                    'fields': ['name', 'booking_date', 'start_time', 'end_time', 'training_type_id', 'trainer_id', 'court_id', 'state'],
+                    'order': 'booking_date asc, start_time asc',
+                    'limit': 50,
+                },
+            ),
+        )
+
+        trainings = []
+        for training in completed + not_started:
+            # Форматируем время
+            start_hour = int(training.get('start_time', 0))
+            start_min = int((training.get('start_time', 0) - start_hour) * 60)
+            end_hour = int(training.get('end_time', 0))
+            end_min = int((training.get('end_time', 0) - end_hour) * 60)
+            
+            training_type_name = training.get('training_type_id', [False, ''])[1] if training.get('training_type_id') else 'Не указан'
+            trainer_name = training.get('trainer_id', [False, ''])[1] if training.get('trainer_id') else 'Не указан'
+            court_name = training.get('court_id', [False, ''])[1] if training.get('court_id') else 'Не указан'
+            
+            trainings.append({
+                'id': training.get('id'),
+                'name': training.get('name', 'Без номера'),
+                'date': training.get('booking_date', ''),
+                'start_time': f"{start_hour:02d}:{start_min:02d}",
+                'end_time': f"{end_hour:02d}:{end_min:02d}",
+                'training_type': training_type_name,
+                'trainer': trainer_name,
+                'court': court_name,
+                'state': training.get('state', 'draft'),
+            })
+        
+        return trainings
+
+    async def _send_bot_request(self, request_type: str, partner_id: int, **kwargs) -> bool:
+        """Один вызов res.partner.send_bot_request: сервер сам находит получателя,
+        публикует сообщение и создаёт задачу в одной транзакции."""
+        try:
+            result = await self.execute_kw(
+                'res.partner',
+                'send_bot_request',
+                [request_type, partner_id],
+                kwargs,
+            )
+        except Exception as e:
+            logger.exception(f"Failed to send '{request_type}' request for partner {partner_id}: {e}")
+            return False
+        if not result or not result.get('success'):
+            logger.error(f"Odoo rejected '{request_type}' request for partner {partner_id}: {(result or {}).get('error')}")
+            return False
+        logger.info(f"Sent '{request_type}' request for partner {partner_id}: message_id={result.get('message_id')}, activity_id={result.get('activity_id')}")
+        return True
+
+    async def send_booking_request_to_manager(self, partner_id: int, sports_center_id: int) -> bool:
+        """Отправляет сообщение менеджеру о необходимости записать пользователя на тренировку"""
+        return await self._send_bot_request('booking_manager', partner_id, sports_center_id=sports_center_id)
+
+    async def get_trainer_availability_dates(self, trainer_id: int, sports_center_id: int) -> list:
+        """Получает даты, когда тренер работает в текущем месяце"""
+        try:
+            from datetime import date, datetime, timedelta
+            
+            today = date.today()
+            month_start = today.replace(day=1)
+            next_month = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+            month_end = next_month - timedelta(days=1)
+            
+            # Получаем доступности тренера
+            availabilities = await self.execute_kw(
+                'trainer.availability',
+                'search_read',
+                [[
+                    ('employee_id', '=', trainer_id),
+                    ('sports_center_id', '=', sports_center_id),
+                    ('start_datetime', '<=', datetime.combine(month_end, datetime.max.time()).isoformat()),
+                    ('end_datetime', '>=', datetime.combine(month_start, datetime.min.time()).isoformat()),
+                ]],
+                {'fields': ['start_datetime', 'end_datetime'], 'order': 'start_datetime asc'},
+            )
+            
+            # Собираем уникальные даты работы
+            working_dates = set()
+            for avail in availabilities:
+                try:
+                    # Odoo возвращает дату в формате 'YYYY-MM-DD HH:MM:SS'
+                    start_str = avail['start_datetime']
+                    end_str = avail['end_datetime']
+                    
+                    # Парсим дату
+                    if 'T' in start_str:
+                        start_dt = datetime.fromisoformat(start_str.replace('Z', '+00:00').split('+')[0])
+                    else:
+                        start_dt = datetime.strptime(start_str.split('.')[0], '%Y-%m-%d %H:%M:%S')
+                    
+                    if 'T' in end_str:
+                        end_dt = datetime.fromisoformat(end_str.replace('Z', '+00:00').split('+')[0])
+                    else:
+                        end_dt = datetime.strptime(end_str.split('.')[0], '%Y-%m-%d %H:%M:%S')
+                    
+                    current_date = start_dt.date()
+                    end_date = end_dt.date()
+                    
+                    while current_date <= end_date and current_date <= month_end:
+                        if current_date >= month_start:
+                            working_dates.add(current_date)
+                        current_date += timedelta(days=1)
+                except Exception as e:
+                    logger.warning(f"Failed to parse date from availability: {e}")
+                    continue
+            
+            # Сортируем даты
+            return sorted(list(working_dates))
+        except Exception as e:
+            logger.exception(f"Failed to get trainer availability dates: {e}")
+            return []
+
+    async def send_booking_request_to_trainer(self, partner_id: int, trainer_id: int, sports_center_id: int) -> bool:
+        """Отправляет сообщение тренеру о желании клиента записаться к нему"""
+        return await self._send_bot_request('booking_trainer', partner_id, trainer_id=trainer_id, sports_center_id=sports_center_id)
+
+    async def send_balance_request_to_manager(self, partner_id: int, amount: float, manager_user_id: int) -> bool:
+        """Отправляет сообщение менеджеру о запросе пополнения баланса в чат Odoo"""
+        return await self._send_bot_request('balance', partner_id, amount=amount, manager_user_id=manager_user_id)
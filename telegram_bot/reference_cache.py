@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from odoo_client import OdooClient
+
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_MODELS = ('sports.center', 'tennis.court', 'training.type', 'hr.employee')
+
+COURT_FIELDS = ['name', 'surface_type', 'capacity', 'has_lighting', 'has_roof', 'state']
+
+
+class TTLCache:
+    """Ограниченный по размеру LRU-кэш с временем жизни записей."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        item = self._data.get(key)
+        if item is None:
+            return False, None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ReferenceCache:
+    """Read-through кэш справочных данных бота (центры, корты, типы, тренеры).
+
+    Данные меняются несколько раз в месяц, поэтому проход по меню записи
+    не должен стоить ни одного RPC. Кэш сбрасывается по TTL, командой /reload
+    или когда меняется штамп версии модели (max(write_date) и количество записей).
+    """
+
+    def __init__(self, client: OdooClient, ttl: dict[str, float], max_entries: int = 1000,
+                 default_ttl: float = 3600.0):
+        self.client = client
+        self._caches = {
+            model: TTLCache(ttl.get(model, default_ttl), max_entries)
+            for model in REFERENCE_MODELS
+        }
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self._versions: dict[str, tuple] = {}
+
+    async def _get(self, model: str, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        cache = self._caches[model]
+        hit, value = cache.get(key)
+        if hit:
+            return value
+        # Параллельные промахи по одному ключу ждут один и тот же запрос к Odoo
+        inflight_key = (model, key)
+        future = self._inflight.get(inflight_key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Отменили не нас, а задачу, которая выполняла запрос, — загружаем сами
+                if not future.cancelled():
+                    raise
+                return await self._get(model, key, loader)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[inflight_key] = future
+        try:
+            value = await loader()
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже передано ожидающим; помечаем его как полученное
+            future.exception()
+            raise
+        else:
+            cache.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            # CancelledError не наследует Exception: без этого ожидающие зависнут на future
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(inflight_key, None)
+
+    async def list_centers(self) -> list:
+        return await self._get('sports.center', 'list', lambda: self.client.execute_kw(
+            'sports.center',
+            'search_read',
+            [[]],
+            {'fields': ['name'], 'limit': 25, 'order': 'name asc'},
+        ))
+
+    async def get_center(self, center_id: int) -> Optional[dict]:
+        async def load():
+            res = await self.client.execute_kw(
+                'sports.center',
+                'read',
+                [[center_id], ['name', 'work_start_time', 'work_end_time', 'total_courts']],
+            )
+            return res[0] if res else None
+        return await self._get('sports.center', ('detail', center_id), load)
+
+    async def get_courts(self, center_id: int) -> list:
+        return await self._get('tennis.court', center_id, lambda: self.client.execute_kw(
+            'tennis.court',
+            'search_read',
+            [[('sports_center_id', '=', center_id)], COURT_FIELDS],
+        ))
+
+    async def get_training_types(self) -> list:
+        return await self._get('training.type', 'list', lambda: self.client.execute_kw(
+            'training.type',
+            'search_read',
+            [[]],
+            {'fields': ['name', 'category'], 'order': 'name asc'},
+        ))
+
+    async def get_trainers(self, center_id: int) -> list:
+        return await self._get('hr.employee', ('center', center_id), lambda: self.client.execute_kw(
+            'hr.employee',
+            'search_read',
+            [[('sports_center_id', '=', center_id), ('position', '=', 'trainer')]],
+            {'fields': ['name'], 'order': 'name asc'},
+        ))
+
+    async def get_trainer(self, trainer_id: int) -> Optional[dict]:
+        """Имя тренера и метаданные фото (has_image, write_date) без самого изображения.
+
+        Фото отправляется по file_id из FileIdCache, а байты читаются из Odoo
+        только при первой отправке или после смены write_date.
+        """
+        async def load():
+            res = await self.client.execute_kw(
+                'hr.employee',
+                'read',
+                [[trainer_id], ['name', 'write_date', 'image_1920']],
+                # bin_size: вместо base64 Odoo вернёт размер изображения
+                {'context': {'bin_size': True}},
+            )
+            if not res:
+                return None
+            trainer = res[0]
+            trainer['has_image'] = bool(trainer.pop('image_1920'))
+            return trainer
+        return await self._get('hr.employee', ('detail', trainer_id), load)
+
+    def invalidate(self, model: Optional[str] = None) -> None:
+        """Сбрасывает кэш одной модели или всех справочников."""
+        models = [model] if model else list(self._caches)
+        for name in models:
+            self._caches[name].clear()
+        logger.info("Reference cache invalidated: %s", ', '.join(models))
+
+    async def _fetch_version(self, model: str) -> tuple:
+        last, count = await asyncio.gather(
+            self.client.execute_kw(model, 'search_read', [[]], {'fields': ['write_date'], 'order': 'write_date desc', 'limit': 1}),
+            self.client.execute_kw(model, 'search_count', [[]]),
+        )
+        return (last[0]['write_date'] if last else None, count)
+
+    async def check_versions(self) -> list[str]:
+        """Сверяет штампы версий моделей с Odoo и сбрасывает устаревшие кэши."""
+        versions = await asyncio.gather(*(self._fetch_version(model) for model in REFERENCE_MODELS))
+        changed = []
+        for model, version in zip(REFERENCE_MODELS, versions):
+            previous = self._versions.get(model)
+            self._versions[model] = version
+            if previous is not None and previous != version:
+                self.invalidate(model)
+                changed.append(model)
+        return changed
+
+    async def run_version_watcher(self, interval: float) -> None:
+        """Фоновая задача: периодически проверяет версии справочников."""
+        while True:
+            try:
+                await self.check_versions()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to check reference data versions")
+            await asyncio.sleep(interval)
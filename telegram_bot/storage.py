@@ -0,0 +1,350 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+
+logger = logging.getLogger(__name__)
+
+_FSM_TABLE = 'fsm_state'
+_PARTNER_TABLE = 'partner_map'
+
+
+def _storage_key_to_str(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+
+def _state_to_str(state: StateType) -> Optional[str]:
+    return state.state if hasattr(state, 'state') else state
+
+
+class PartnerMap(ABC):
+    """Связь пользователь Telegram → партнёр Odoo."""
+
+    @abstractmethod
+    async def get(self, user_id: int) -> Optional[int]:
+        pass
+
+    @abstractmethod
+    async def set(self, user_id: int, partner_id: int) -> None:
+        pass
+
+
+class MemoryPartnerMap(PartnerMap):
+    """Хранение в памяти процесса (теряется при перезапуске)."""
+
+    def __init__(self):
+        self._data: dict[int, int] = {}
+
+    async def get(self, user_id: int) -> Optional[int]:
+        return self._data.get(user_id)
+
+    async def set(self, user_id: int, partner_id: int) -> None:
+        self._data[user_id] = partner_id
+
+
+class SQLiteDatabase:
+    """Файл SQLite с отложенной пакетной записью (write-behind).
+
+    Изменения копятся в памяти и сбрасываются одной транзакцией раз в
+    flush_interval секунд или при накоплении batch_size изменений. Повторные
+    изменения одного ключа между сбросами схлопываются в одну запись.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, batch_size: int = 500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_lock = threading.Lock()
+        # (table, key) -> кортеж значений строки или None для удаления
+        self._pending: dict[tuple[str, Any], Optional[tuple]] = {}
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            # WAL позволяет нескольким процессам бота читать файл одновременно с записью
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=5000')
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {_FSM_TABLE} '
+                '(key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL)'
+            )
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {_PARTNER_TABLE} '
+                '(user_id INTEGER PRIMARY KEY, partner_id INTEGER NOT NULL)'
+            )
+            self._conn = conn
+        return self._conn
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None:
+            self._flush_lock = asyncio.Lock()
+            self._flush_requested = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to flush bot state to SQLite")
+
+    def _fetch_one(self, sql: str, params: tuple) -> Optional[tuple]:
+        with self._conn_lock:
+            return self._connect().execute(sql, params).fetchone()
+
+    async def fetch_one(self, sql: str, params: tuple) -> Optional[tuple]:
+        return await asyncio.to_thread(self._fetch_one, sql, params)
+
+    def is_pending(self, table: str, key: Any) -> bool:
+        return (table, key) in self._pending
+
+    def schedule(self, table: str, key: Any, row: Optional[tuple]) -> None:
+        """Ставит запись (или удаление, если row is None) в очередь на сброс."""
+        self._ensure_flusher()
+        self._pending[(table, key)] = row
+        if len(self._pending) >= self.batch_size:
+            self._flush_requested.set()
+
+    def _write_batch(self, batch: dict) -> None:
+        fsm_upserts, fsm_deletes, partner_upserts = [], [], []
+        for (table, key), row in batch.items():
+            if table == _FSM_TABLE:
+                if row is None:
+                    fsm_deletes.append((key,))
+                else:
+                    fsm_upserts.append((key,) + row)
+            elif table == _PARTNER_TABLE:
+                partner_upserts.append((key,) + row)
+        with self._conn_lock:
+            conn = self._connect()
+            conn.execute('BEGIN')
+            try:
+                if fsm_upserts:
+                    conn.executemany(
+                        f'INSERT INTO {_FSM_TABLE} (key, state, data) VALUES (?, ?, ?) '
+                        'ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data',
+                        fsm_upserts,
+                    )
+                if fsm_deletes:
+                    conn.executemany(f'DELETE FROM {_FSM_TABLE} WHERE key = ?', fsm_deletes)
+                if partner_upserts:
+                    conn.executemany(
+                        f'INSERT INTO {_PARTNER_TABLE} (user_id, partner_id) VALUES (?, ?) '
+                        'ON CONFLICT(user_id) DO UPDATE SET partner_id = excluded.partner_id',
+                        partner_upserts,
+                    )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        async with self._flush_lock:
+            batch, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception:
+                # Возвращаем несохранённые изменения, не затирая более свежие
+                for item_key, row in batch.items():
+                    self._pending.setdefault(item_key, row)
+                raise
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+            await self.flush()
+        if self._conn is not None:
+            with self._conn_lock:
+                self._conn.close()
+            self._conn = None
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище aiogram поверх SQLiteDatabase.
+
+    Состояния подгружаются лениво при первом обращении к ключу, поэтому старт
+    бота не зависит от размера базы. Горячие ключи живут в LRU-кэше процесса.
+    """
+
+    def __init__(self, db: SQLiteDatabase, max_cached: int = 10000):
+        self.db = db
+        self.max_cached = max_cached
+        self._cache: OrderedDict[str, tuple[Optional[str], Dict[str, Any]]] = OrderedDict()
+
+    async def _load(self, key: StorageKey) -> tuple[Optional[str], Dict[str, Any]]:
+        skey = _storage_key_to_str(key)
+        record = self._cache.get(skey)
+        if record is not None:
+            self._cache.move_to_end(skey)
+            return record
+        row = await self.db.fetch_one(f'SELECT state, data FROM {_FSM_TABLE} WHERE key = ?', (skey,))
+        # Пока шёл запрос, обработчик мог успеть записать более свежее значение
+        if skey not in self._cache:
+            self._remember(skey, (row[0], json.loads(row[1])) if row else (None, {}))
+        return self._cache[skey]
+
+    def _remember(self, skey: str, record: tuple[Optional[str], Dict[str, Any]]) -> None:
+        self._cache[skey] = record
+        self._cache.move_to_end(skey)
+        if len(self._cache) <= self.max_cached:
+            return
+        # Вытесняем только уже сохранённые записи
+        for old_key in list(self._cache):
+            if len(self._cache) <= self.max_cached:
+                break
+            if old_key != skey and not self.db.is_pending(_FSM_TABLE, old_key):
+                del self._cache[old_key]
+
+    def _store(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]) -> None:
+        skey = _storage_key_to_str(key)
+        self._remember(skey, (state, data))
+        if state is None and not data:
+            self.db.schedule(_FSM_TABLE, skey, None)
+        else:
+            self.db.schedule(_FSM_TABLE, skey, (state, json.dumps(data, ensure_ascii=False)))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, data = await self._load(key)
+        self._store(key, _state_to_str(state), data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        state, _ = await self._load(key)
+        self._store(key, state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(key)
+        return data.copy()
+
+    async def close(self) -> None:
+        await self.db.close()
+
+
+class SQLitePartnerMap(PartnerMap):
+    """Связь пользователь → партнёр в том же файле SQLite, с ленивой подгрузкой.
+
+    Кэш процесса ограничен по размеру и времени жизни: связь, которую изменил
+    другой процесс бота с тем же файлом, видна не позже чем через ttl секунд.
+    """
+
+    def __init__(self, db: SQLiteDatabase, max_cached: int = 10000, ttl: float = 60.0):
+        self.db = db
+        self.max_cached = max_cached
+        self.ttl = ttl
+        self._cache: OrderedDict[int, tuple[float, int]] = OrderedDict()
+
+    async def get(self, user_id: int) -> Optional[int]:
+        item = self._cache.get(user_id)
+        # Несохранённую связь перечитывать бессмысленно: в базе её ещё нет
+        if item is not None and (item[0] > time.monotonic() or self.db.is_pending(_PARTNER_TABLE, user_id)):
+            self._cache.move_to_end(user_id)
+            return item[1]
+        row = await self.db.fetch_one(
+            f'SELECT partner_id FROM {_PARTNER_TABLE} WHERE user_id = ?', (user_id,)
+        )
+        # Пока шёл запрос, обработчик мог успеть записать более свежее значение
+        current = self._cache.get(user_id)
+        if current is not item:
+            return current[1]
+        if not row:
+            self._cache.pop(user_id, None)
+            return None
+        self._remember(user_id, row[0])
+        return row[0]
+
+    async def set(self, user_id: int, partner_id: int) -> None:
+        self._remember(user_id, partner_id)
+        self.db.schedule(_PARTNER_TABLE, user_id, (partner_id,))
+
+    def _remember(self, user_id: int, partner_id: int) -> None:
+        self._cache[user_id] = (time.monotonic() + self.ttl, partner_id)
+        self._cache.move_to_end(user_id)
+        if len(self._cache) <= self.max_cached:
+            return
+        # Вытесняем только уже сохранённые записи
+        for old_key in list(self._cache):
+            if len(self._cache) <= self.max_cached:
+                break
+            if old_key != user_id and not self.db.is_pending(_PARTNER_TABLE, old_key):
+                del self._cache[old_key]
+
+
+class RedisPartnerMap(PartnerMap):
+    """Связь пользователь → партнёр в хэше Redis (общая для нескольких процессов бота)."""
+
+    HASH_KEY = 'tennis_bot:partner_map'
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def get(self, user_id: int) -> Optional[int]:
+        value = await self.redis.hget(self.HASH_KEY, str(user_id))
+        return int(value) if value is not None else None
+
+    async def set(self, user_id: int, partner_id: int) -> None:
+        await self.redis.hset(self.HASH_KEY, str(user_id), str(partner_id))
+
+
+def create_storage(cfg: dict) -> tuple[BaseStorage, PartnerMap]:
+    """Создаёт FSM-хранилище и хранилище связей по настройке STORAGE_BACKEND.
+
+    sqlite — файл на диске (по умолчанию), переживает перезапуск бота;
+    redis  — общее хранилище для нескольких процессов бота (нужен пакет redis);
+    memory — всё в памяти процесса, как раньше.
+
+    Соединение принадлежит FSM-хранилищу: диспетчер закрывает его при остановке,
+    сбрасывая и отложенные записи связей.
+    """
+    backend = cfg.get('STORAGE_BACKEND', 'sqlite')
+    if backend == 'memory':
+        return MemoryStorage(), MemoryPartnerMap()
+    if backend == 'sqlite':
+        db = SQLiteDatabase(
+            cfg['STORAGE_SQLITE_PATH'],
+            flush_interval=cfg['STORAGE_FLUSH_INTERVAL'],
+            batch_size=cfg['STORAGE_FLUSH_BATCH_SIZE'],
+        )
+        partner_map = SQLitePartnerMap(
+            db, max_cached=cfg['STORAGE_CACHE_MAX_ENTRIES'], ttl=cfg['STORAGE_PARTNER_CACHE_TTL'],
+        )
+        return SQLiteStorage(db, max_cached=cfg['STORAGE_CACHE_MAX_ENTRIES']), partner_map
+    if backend == 'redis':
+        try:
+            from redis.asyncio import Redis
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND = 'redis' requires the 'redis' package") from e
+        redis = Redis.from_url(cfg['STORAGE_REDIS_URL'])
+        return RedisStorage(redis), RedisPartnerMap(redis)
+    raise RuntimeError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -0,0 +1,181 @@
+import asyncio
+import hmac
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import setup_application
+
+from metrics import WEBHOOK_PENDING
+
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# Типы апдейтов, в которых есть чат (или хотя бы автор) для упорядочивания
+_CHAT_UPDATE_TYPES = ('message', 'edited_message', 'channel_post', 'edited_channel_post')
+_USER_UPDATE_TYPES = ('callback_query', 'inline_query', 'chosen_inline_result',
+                      'shipping_query', 'pre_checkout_query', 'my_chat_member', 'chat_member',
+                      'chat_join_request')
+
+
+def update_order_key(update: dict) -> Hashable:
+    """Ключ упорядочивания: апдейты одного чата обрабатываются строго по очереди."""
+    for name in _CHAT_UPDATE_TYPES:
+        event = update.get(name)
+        if event and event.get('chat'):
+            return ('chat', event['chat']['id'])
+    for name in _USER_UPDATE_TYPES:
+        event = update.get(name)
+        if not event:
+            continue
+        message = event.get('message')
+        if message and message.get('chat'):
+            return ('chat', message['chat']['id'])
+        if event.get('chat'):
+            return ('chat', event['chat']['id'])
+        if event.get('from'):
+            return ('chat', event['from']['id'])
+    # Остальное упорядочивать не нужно
+    return ('update', update.get('update_id'))
+
+
+class ChatOrderedWorkerPool:
+    """Ограниченный пул обработчиков апдейтов с сохранением порядка внутри чата.
+
+    Апдейты разных чатов обрабатываются параллельно не более чем workers
+    задачами; апдейты одного чата — последовательно, в порядке поступления.
+    Число принятых, но не обработанных апдейтов ограничено max_pending:
+    при переполнении submit() возвращает False, и вебхук отвечает 503,
+    чтобы Telegram повторил доставку позже (возможно, на другой экземпляр).
+    """
+
+    def __init__(self, handler: Callable[[dict], Awaitable[Any]], workers: int = 32,
+                 max_pending: int = 1000):
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pending = 0
+        self._chats: dict[Hashable, deque] = {}
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, update: dict) -> bool:
+        if self._pending >= self.max_pending:
+            return False
+        self._pending += 1
+        self._idle.clear()
+        key = update_order_key(update)
+        queue = self._chats.get(key)
+        if queue is not None:
+            # Чат уже стоит в очереди или обрабатывается: апдейт подождёт свою очередь
+            queue.append(update)
+        else:
+            self._chats[key] = deque([update])
+            self._ready.put_nowait(key)
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            queue = self._chats[key]
+            update = queue.popleft()
+            try:
+                await self.handler(update)
+            except Exception:
+                logger.exception(f"Failed to process update {update.get('update_id')}")
+            finally:
+                self._pending -= 1
+                if queue:
+                    # Отдаём воркер другим чатам, следующий апдейт этого чата — в конец очереди
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+                if not self._pending:
+                    self._idle.set()
+
+    async def close(self, timeout: Optional[float] = None) -> None:
+        """Дожидается обработки принятых апдейтов и останавливает воркеры."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stopping webhook workers with {self._pending} unprocessed updates")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def create_webhook_app(dp: Dispatcher, bot: Bot, cfg: dict) -> web.Application:
+    """Собирает aiohttp-приложение, принимающее апдейты Telegram на WEBHOOK_PATH."""
+    pool = ChatOrderedWorkerPool(
+        lambda update: dp.feed_raw_update(bot, update),
+        workers=cfg['WEBHOOK_WORKERS'],
+        max_pending=cfg['WEBHOOK_MAX_PENDING'],
+    )
+    secret = cfg.get('WEBHOOK_SECRET') or ''
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), secret):
+            return web.Response(status=401)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if not pool.submit(update):
+            logger.warning(f"Webhook queue is full ({pool.pending}), asking Telegram to retry")
+            return web.Response(status=503)
+        return web.Response()
+
+    async def on_startup(app: web.Application) -> None:
+        pool.start()
+        if cfg.get('WEBHOOK_SET_ON_STARTUP', True):
+            await bot.set_webhook(
+                url=cfg['WEBHOOK_BASE_URL'].rstrip('/') + cfg['WEBHOOK_PATH'],
+                secret_token=secret or None,
+                max_connections=cfg['WEBHOOK_MAX_CONNECTIONS'],
+                allowed_updates=dp.resolve_used_update_types(),
+                drop_pending_updates=False,
+            )
+
+    async def on_shutdown(app: web.Application) -> None:
+        await pool.close(timeout=cfg['WEBHOOK_SHUTDOWN_TIMEOUT'])
+
+    app = web.Application()
+    app['update_pool'] = pool
+    app.router.add_post(cfg['WEBHOOK_PATH'], handle_update)
+    if cfg['METRICS_ENABLED']:
+        # Сами метрики отдаёт отдельный сервер на METRICS_HOST, а не публичный webhook
+        WEBHOOK_PENDING.set_function(lambda: pool.pending)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    # Запуск/остановка диспетчера (в т.ч. закрытие FSM-хранилища) — после пула
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, cfg: dict) -> None:
+    app = create_webhook_app(dp, bot, cfg)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, cfg['WEBHOOK_HOST'], cfg['WEBHOOK_PORT'])
+    await site.start()
+    logger.info(f"Webhook server listening on {cfg['WEBHOOK_HOST']}:{cfg['WEBHOOK_PORT']}{cfg['WEBHOOK_PATH']}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await bot.session.close()
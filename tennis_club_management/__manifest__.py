@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'Tennis Club Management',
-    'version': '18.0.1.0.18',
+    'version': '18.0.1.0.19',
     'category': 'Sports',
     'summary': 'Система управления сетью теннисных клубов',
     'description': """
@@ -13,6 +13,9 @@
         * Система записи на тренировки
         * Финансовый учет и отчетность
         * Интеграция с Telegram ботом
+
+        Требования: расширение PostgreSQL btree_gist для ограничения
+        пересечений записей на корте.
     """,
     'author': 'Tennis Club Management',
     'website': 'https://www.tennisclub.com',
@@ -22,6 +25,7 @@
         'hr',
         'calendar',
         'mail',
+        'bus',
     ],
     'assets': {
         'web.assets_backend': [
@@ -48,6 +52,7 @@
         'data/training_reminders_cron.xml',
         'views/trainer_availability_views.xml',
         'views/trainer_availability_wizard_views.xml',
+        'views/training_recurrence_wizard_views.xml',
         'views/training_booking_views.xml',
         'views/training_calendar_views.xml',
         'views/trainer_revenue_report_wizard_views.xml',
@@ -63,6 +68,7 @@
         'views/training_type_views.xml',
         'views/training_group_views.xml',
         'views/sports_center_training_price_views.xml',
+        'views/telegram_outbox_views.xml',
         'views/dashboard_actions.xml',
         'views/menu_views.xml',
     ],
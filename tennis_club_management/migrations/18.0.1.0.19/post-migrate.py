@@ -0,0 +1,32 @@
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    env = api.Environment(cr, SUPERUSER_ID, {})
+
+    # Флаги reminder_1day_sent / reminder_2hours_sent заменены очередью напоминаний.
+    # Колонки остаются в таблице: переносим из них уже отправленные напоминания,
+    # чтобы клиенты не получили их повторно
+    cr.execute("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_name = 'training_booking' AND column_name = 'reminder_1day_sent'
+    """)
+
+    if cr.fetchone():
+        cr.execute("""
+            UPDATE training_booking
+               SET reminder_sent_offset = CASE WHEN reminder_2hours_sent THEN 2 ELSE 24 END
+             WHERE (reminder_1day_sent OR reminder_2hours_sent)
+               AND state IN ('confirmed', 'in_progress')
+               AND booking_datetime_start > now() at time zone 'UTC'
+        """)
+        print(f"Перенесены отметки о напоминаниях для {cr.rowcount} записей")
+
+    env['training.booking']._recompute_reminders([])
+    cr.execute("DROP INDEX IF EXISTS training_booking_active_date_idx")
+    cr.commit()
+    print("Миграция завершена. Очередь напоминаний заполнена.")
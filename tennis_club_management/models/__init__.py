@@ -6,6 +6,7 @@ from . import sports_center_training_price
 from . import tennis_court
 from . import hr_employee
 from . import res_partner
+from . import telegram_outbox
 from . import training_type
 from . import training_booking
 from . import training_booking_participant
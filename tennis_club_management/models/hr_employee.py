@@ -10,6 +10,9 @@ ROLE_PASSWORDS = {
 
 SKIP_EMPLOYEE_ROLE_SYNC_CTX_KEY = 'skip_employee_role_sync'
 
+# Надбавки тренера, входящие в кэш цен записей на тренировки
+TRAINER_EXTRA_PRICE_FIELDS = {'price_extra_individual', 'price_extra_split', 'price_extra_group'}
+
 
 class HrEmployee(models.Model):
     _inherit = 'hr.employee'
@@ -178,6 +181,10 @@ class HrEmployee(models.Model):
     def write(self, vals):
         """Обновляет сотрудников и проверяет ограничения"""
         result = super().write(vals)
+
+        # Надбавки тренеров кэшируются для расчёта цен записей
+        if TRAINER_EXTRA_PRICE_FIELDS.intersection(vals):
+            self.env.registry.clear_cache()
         
         # Для тренеров фиксируем почасовую ставку = 1
         for employee in self:
@@ -208,6 +215,8 @@ class HrEmployee(models.Model):
     @api.model_create_multi
     def create(self, vals_list):
         employees = super().create(vals_list)
+        if any(TRAINER_EXTRA_PRICE_FIELDS.intersection(vals) for vals in vals_list):
+            self.env.registry.clear_cache()
         # При создании тренеров — ставка = 1
         for emp, vals in zip(employees, vals_list):
             position = vals.get('position') or emp.position
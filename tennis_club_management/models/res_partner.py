@@ -1,11 +1,10 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 import logging
+from datetime import timedelta
 from typing import Dict
 
-import requests
-
 _logger = logging.getLogger(__name__)
 
 
@@ -280,7 +279,10 @@ class ResPartner(models.Model):
         return (base_url or 'https://api.telegram.org').rstrip('/')
 
     def _send_telegram_message(self, message: str) -> None:
-        """Отправляет текстовое сообщение клиентам в Telegram.
+        """Ставит текстовое сообщение клиентам в очередь отправки в Telegram.
+
+        Сообщение уходит только после фиксации текущей транзакции
+        (см. telegram.outbox), сам вызов не обращается к API Telegram.
 
         :param message: текст сообщения
         """
@@ -288,58 +290,7 @@ class ResPartner(models.Model):
             _logger.warning("Пустое сообщение, уведомление не отправлено")
             return
 
-        token = self._get_telegram_bot_token()
-        if not token:
-            _logger.warning("Не настроен токен Telegram бота. Уведомление не отправлено.")
-            return
-
-        base_url = self._get_telegram_api_base_url()
-        url = f"{base_url}/bot{token}/sendMessage"
-
-        _logger.info("Отправка Telegram сообщения. URL: %s (токен скрыт)", base_url)
-
-        session = requests.Session()
-
-        for partner in self:
-            chat_id = partner.telegram_chat_id
-            if not chat_id:
-                _logger.warning("Партнер %s (%s) не имеет telegram_chat_id, уведомление пропущено.", partner.name, partner.id)
-                continue
-            
-            payload = {
-                'chat_id': chat_id,
-                'text': message,
-                'parse_mode': 'HTML',
-            }
-            
-            _logger.info("Отправка сообщения в Telegram для партнера %s (ID: %s, chat_id: %s)", partner.name, partner.id, chat_id)
-            
-            try:
-                response = session.post(url, json=payload, timeout=10)
-                if response.ok:
-                    _logger.info(
-                        "Сообщение успешно отправлено в Telegram для партнера %s (%s). "
-                        "Код: %s",
-                        partner.name,
-                        partner.id,
-                        response.status_code,
-                    )
-                else:
-                    _logger.warning(
-                        "Не удалось отправить сообщение в Telegram для партнера %s (%s). "
-                        "Код: %s, ответ: %s",
-                        partner.name,
-                        partner.id,
-                        response.status_code,
-                        response.text,
-                    )
-            except requests.RequestException as exc:
-                _logger.exception(
-                    "Ошибка при отправке сообщения в Telegram для партнера %s (%s): %s",
-                    partner.name,
-                    partner.id,
-                    exc,
-                )
+        self.env['telegram.outbox'].enqueue(self, message)
 
     def _notify_balance_change(self, diff: float) -> None:
         """Отправляет уведомление клиенту при изменении баланса.
@@ -386,9 +337,152 @@ class ResPartner(models.Model):
                 f"Текущий баланс: {self.balance:.2f} руб."
             )
         
-        _logger.info("Отправка сообщения в Telegram для партнера %s (ID: %s): %s", self.name, self.id, message)
+        _logger.info("Сообщение в Telegram для партнера %s (ID: %s) поставлено в очередь: %s", self.name, self.id, message)
         self._send_telegram_message(message)
 
+    # -------------------------------------------------------------------------
+    # Запросы из Telegram бота
+    # -------------------------------------------------------------------------
+
+    def _get_partner_form_url(self) -> str:
+        """Возвращает ссылку на карточку клиента в бэкенде."""
+        self.ensure_one()
+        base_url = self.env['ir.config_parameter'].sudo().get_param('web.base.url') or ''
+        return f"{base_url.rstrip('/')}/web#id={self.id}&model=res.partner&view_type=form"
+
+    def _resolve_bot_request_recipient(self, request_type, sports_center_id=False, trainer_id=False, manager_user_id=False):
+        """Определяет пользователя-получателя запроса из бота.
+
+        :return: кортеж (res.users, False) или (None, текст ошибки)
+        """
+        Center = self.env['sports.center'].sudo()
+        if request_type == 'booking_manager':
+            center = Center.browse(sports_center_id).exists()
+            if not center:
+                return None, f"Sports center {sports_center_id} not found"
+            if not center.manager_id:
+                return None, f"Sports center {sports_center_id} ({center.name}) has no manager"
+            user = center.manager_id.user_id
+            if not user:
+                return None, f"Manager employee {center.manager_id.id} has no user_id"
+        elif request_type == 'booking_trainer':
+            trainer = self.env['hr.employee'].sudo().browse(trainer_id).exists()
+            if not trainer or not trainer.user_id:
+                return None, f"Trainer {trainer_id} not found or has no user_id"
+            user = trainer.user_id
+        elif request_type == 'balance':
+            user = self.env['res.users'].sudo().browse(manager_user_id).exists()
+            if not user:
+                return None, f"Manager user {manager_user_id} not found"
+        else:
+            return None, f"Unknown request type: {request_type}"
+        if not user.partner_id:
+            return None, f"User {user.id} has no partner_id"
+        return user, False
+
+    @api.model
+    def send_bot_request(self, request_type, partner_id, sports_center_id=False, trainer_id=False,
+                         amount=0.0, manager_user_id=False):
+        """Маршрутизирует запрос клиента из Telegram бота менеджеру или тренеру.
+
+        Одним вызовом (и одной транзакцией) определяет получателя
+        (центр → сотрудник → пользователь → партнёр), подписывает его на карточку
+        клиента, публикует сообщение с уведомлением во «Входящие» и создаёт задачу.
+
+        :param request_type: 'booking_manager' (записать на тренировку через менеджера центра),
+            'booking_trainer' (клиент хочет к тренеру) или 'balance' (пополнение баланса)
+        :param partner_id: ID клиента (res.partner)
+        :return: dict с ключами success, message_id, activity_id, error
+        """
+        partner = self.browse(partner_id).exists()
+        if not partner:
+            return {'success': False, 'error': f"Partner {partner_id} not found"}
+
+        user, error = partner._resolve_bot_request_recipient(
+            request_type,
+            sports_center_id=sports_center_id,
+            trainer_id=trainer_id,
+            manager_user_id=manager_user_id,
+        )
+        if user is None:
+            _logger.error("Не удалось определить получателя запроса из бота: %s", error)
+            return {'success': False, 'error': error}
+        recipient = user.partner_id
+        center = self.env['sports.center'].sudo().browse(sports_center_id).exists() if sports_center_id else None
+        center_name = center.name if center else 'Неизвестный центр'
+
+        contacts = (
+            f"Телефон: {partner.phone or partner.mobile or '-'}\n"
+            f"Email: {partner.email or '-'}"
+        )
+        if request_type == 'booking_manager':
+            subject = f"📝 Необходимо записать на тренировку пользователя {partner.name}"
+            body = (
+                "📝 Необходимо записать на тренировку пользователя\n\n"
+                f"Клиент: {partner.name} (ID: {partner.id})\n"
+                f"Спортивный центр: {center_name}\n"
+                f"{contacts}\n\n"
+                f"{partner._get_partner_form_url()}"
+            )
+        elif request_type == 'booking_trainer':
+            subject = f"🎾 Клиент {partner.name} хочет записаться к Вам"
+            body = (
+                "🎾 Клиент хочет записаться к Вам на тренировку\n"
+                f"Клиент: {partner.name} (ID: {partner.id})\n"
+                f"Спортивный центр: {center_name}\n"
+                f"{contacts}"
+            )
+        else:
+            subject = f"💳 Запрос на пополнение баланса от {partner.name}"
+            body = (
+                "💳 Запрос на пополнение баланса\n\n"
+                f"Клиент: {partner.name} (ID: {partner.id})\n"
+                f"Запрашиваемая сумма: {float(amount or 0.0):.2f}\n"
+                f"{contacts}\n\n"
+                f"{partner._get_partner_form_url()}"
+            )
+        html_body = tools.plaintext2html(body)
+
+        partner.message_subscribe(partner_ids=[recipient.id])
+        message = partner.message_post(
+            body=html_body,
+            subject=subject,
+            message_type='notification',
+            partner_ids=[recipient.id],
+        )
+
+        # Гарантируем, что сообщение попадёт во «Входящие» получателя,
+        # даже если у него включены уведомления по email
+        notification = message.notification_ids.filtered(lambda n: n.res_partner_id == recipient)
+        if notification:
+            notification.write({'notification_type': 'inbox', 'notification_status': 'ready', 'is_read': False})
+        else:
+            self.env['mail.notification'].sudo().create({
+                'mail_message_id': message.id,
+                'res_partner_id': recipient.id,
+                'notification_type': 'inbox',
+                'notification_status': 'ready',
+                'is_read': False,
+            })
+
+        activity = partner.activity_schedule(
+            'mail.mail_activity_data_call',
+            date_deadline=fields.Date.context_today(self) + timedelta(days=1),
+            summary=subject,
+            note=html_body,
+            user_id=user.id,
+        )
+
+        _logger.info(
+            "Запрос из бота '%s' по клиенту %s (ID: %s) отправлен пользователю %s (ID: %s)",
+            request_type,
+            partner.name,
+            partner.id,
+            user.name,
+            user.id,
+        )
+        return {'success': True, 'message_id': message.id, 'activity_id': activity.id, 'error': False}
+
     # -------------------------------------------------------------------------
     # CRUD
     # -------------------------------------------------------------------------
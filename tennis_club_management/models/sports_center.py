@@ -40,6 +40,21 @@ class SportsCenter(models.Model):
         default=22.0,
         help='Время окончания работы (в часах, например 22.0 = 22:00)'
     )
+
+    # Шаг сетки расписания: с какой точностью можно начинать и заканчивать тренировки
+    slot_duration = fields.Selection([
+        ('15', '15 минут'),
+        ('30', '30 минут'),
+        ('60', '1 час'),
+    ], string='Шаг расписания', required=True, default='60',
+       help='Шаг, с которым предлагается время начала и окончания тренировок')
+
+    # За сколько часов до начала тренировки клиент получает напоминания в Telegram
+    reminder_offsets = fields.Char(
+        string='Напоминания (часов до начала)',
+        default='24, 2',
+        help='Через запятую, например "24, 2" — за сутки и за 2 часа. Пусто — без напоминаний'
+    )
     
     # Количество кортов (вычисляемое поле)
     court_count = fields.Integer(
@@ -209,6 +224,36 @@ class SportsCenter(models.Model):
                     _('Время окончания работы должно быть от 0 до 24 часов')
                 )
     
+    def _get_slot_minutes(self):
+        """Шаг расписания центра в минутах (по умолчанию 1 час)"""
+        self.ensure_one()
+        return int(self.slot_duration or 60)
+
+    @api.constrains('reminder_offsets')
+    def _check_reminder_offsets(self):
+        """Проверяет формат списка напоминаний"""
+        for center in self:
+            try:
+                center._get_reminder_offsets()
+            except ValueError:
+                raise ValidationError(
+                    _('Напоминания задаются положительными числами часов через запятую, например "24, 2"')
+                )
+
+    def _get_reminder_offsets(self):
+        """Смещения напоминаний в часах, от большего к меньшему"""
+        self.ensure_one()
+        offsets = set()
+        for part in (self.reminder_offsets or '').replace(';', ',').split(','):
+            part = part.strip()
+            if not part:
+                continue
+            offset = float(part)
+            if offset <= 0:
+                raise ValueError(part)
+            offsets.add(offset)
+        return sorted(offsets, reverse=True)
+
     @api.constrains('image_ids')
     def _check_max_images(self):
         """Проверяет, что количество фотографий не превышает 5"""
@@ -319,6 +364,9 @@ class SportsCenter(models.Model):
                             old_manager.write({'position': 'trainer'})
         
         result = super().write(vals)
+
+        if 'reminder_offsets' in vals:
+            self.env['training.booking']._recompute_reminders([('sports_center_id', 'in', self.ids)])
         
         if 'manager_id' in vals:
             for center in self:
@@ -3,6 +3,9 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
 
+# Поля, входящие в кэшируемую матрицу цен training.booking._get_price_matrix
+PRICE_MATRIX_FIELDS = {'sports_center_id', 'training_type_id', 'price_per_hour', 'active'}
+
 
 class SportsCenterTrainingPrice(models.Model):
     _name = 'sports.center.training.price'
@@ -92,6 +95,24 @@ class SportsCenterTrainingPrice(models.Model):
                     )
                 )
     
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        # Матрица цен записей на тренировки хранится в кэше реестра
+        self.env.registry.clear_cache()
+        return records
+
+    def write(self, vals):
+        result = super().write(vals)
+        if PRICE_MATRIX_FIELDS.intersection(vals):
+            self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env.registry.clear_cache()
+        return result
+
     @api.constrains('price_per_hour')
     def _check_price(self):
         """Проверяет корректность цены"""
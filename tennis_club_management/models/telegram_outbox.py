@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from datetime import timedelta
+import logging
+
+from .telegram_sender import TELEGRAM_CHAT_INTERVAL, get_sender
+
+_logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = 100
+# Сколько пакетов отправлять за один запуск cron, остаток — в следующем запуске
+OUTBOX_MAX_BATCHES = 10
+OUTBOX_MAX_ATTEMPTS = 8
+# Задержка повтора: 30 с, 1 мин, 2 мин ... но не больше часа
+OUTBOX_RETRY_DELAY = 30
+OUTBOX_RETRY_MAX_DELAY = 3600
+OUTBOX_KEEP_SENT_DAYS = 7
+# Ответы Telegram, после которых повтор бессмысленен (чат не найден, бот заблокирован)
+OUTBOX_PERMANENT_ERRORS = (400, 403, 404)
+
+
+class TelegramOutbox(models.Model):
+    """Очередь исходящих сообщений Telegram (transactional outbox).
+
+    Бизнес-операции только добавляют строки в очередь в своей транзакции:
+    при откате операции сообщение не уйдёт, а медленный Telegram не держит
+    блокировки записей. Отправляет очередь cron уже после фиксации.
+    """
+    _name = 'telegram.outbox'
+    _description = 'Очередь сообщений Telegram'
+    _order = 'id desc'
+
+    partner_id = fields.Many2one('res.partner', string='Получатель', ondelete='set null')
+    chat_id = fields.Char(string='Chat ID', required=True)
+    message = fields.Text(string='Сообщение', required=True)
+    parse_mode = fields.Char(string='Режим разметки', default='HTML')
+    state = fields.Selection([
+        ('pending', 'В очереди'),
+        ('sent', 'Отправлено'),
+        ('dead', 'Не доставлено'),
+    ], string='Статус', required=True, default='pending')
+    attempts = fields.Integer(string='Попыток', default=0)
+    next_attempt_at = fields.Datetime(string='Следующая попытка', default=fields.Datetime.now)
+    sent_at = fields.Datetime(string='Отправлено в')
+    last_error = fields.Text(string='Последняя ошибка')
+
+    def init(self):
+        # cron выбирает только ожидающие сообщения, срок которых подошёл
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS telegram_outbox_pending_idx
+                ON telegram_outbox (next_attempt_at, id)
+             WHERE state = 'pending'
+        """)
+        # время последней отправки в чат — для ограничения «не чаще раза в секунду»
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS telegram_outbox_chat_sent_idx
+                ON telegram_outbox (chat_id, sent_at)
+             WHERE state = 'sent'
+        """)
+
+    @api.model
+    def enqueue(self, partners, message, parse_mode='HTML'):
+        """Ставит сообщение в очередь для каждого партнёра с telegram_chat_id."""
+        vals_list = []
+        for partner in partners:
+            if not partner.telegram_chat_id:
+                _logger.warning("Партнер %s (%s) не имеет telegram_chat_id, уведомление пропущено.", partner.name, partner.id)
+                continue
+            vals_list.append({
+                'partner_id': partner.id,
+                'chat_id': partner.telegram_chat_id,
+                'message': message,
+                'parse_mode': parse_mode,
+            })
+        if not vals_list:
+            return self.browse()
+        records = self.sudo().create(vals_list)
+        # Запуск cron фиксируется вместе с транзакцией, поэтому отправка начнётся после commit
+        self._trigger_dispatch()
+        return records
+
+    @api.model
+    def _trigger_dispatch(self):
+        cron = self.env.ref('tennis_club_management.ir_cron_telegram_outbox', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model
+    def _cron_dispatch(self):
+        """Отправляет подошедшие сообщения пакетами, фиксируя результат после каждого пакета."""
+        for _batch in range(OUTBOX_MAX_BATCHES):
+            records = self._claim_batch()
+            if not records:
+                break
+            records._deliver()
+            self.env.cr.commit()
+        self._schedule_next_dispatch()
+
+    @api.model
+    def _schedule_next_dispatch(self):
+        """Запускает cron снова, если сообщения ждут только интервала чата или скорого повтора."""
+        now = fields.Datetime.now()
+        self.env.cr.execute("""
+            SELECT min(next_attempt_at)
+              FROM telegram_outbox
+             WHERE state = 'pending'
+        """)
+        due = self.env.cr.fetchone()[0]
+        if due and due < now + timedelta(minutes=1):
+            cron = self.env.ref('tennis_club_management.ir_cron_telegram_outbox', raise_if_not_found=False)
+            if cron:
+                cron.sudo()._trigger(at=max(due, now + timedelta(seconds=TELEGRAM_CHAT_INTERVAL)))
+
+    @api.model
+    def _claim_batch(self, limit=OUTBOX_BATCH_SIZE):
+        """Блокирует пакет подошедших сообщений; занятые другим обработчиком пропускаются.
+
+        Из каждого чата берётся только самое раннее сообщение и только если в чат
+        ничего не отправлялось последнюю секунду: так лимит Telegram «1 сообщение
+        в секунду в чат» соблюдается между пакетами и параллельными обработчиками
+        (следующее сообщение чата заблокировано первым и не выбирается другими).
+        Время берётся в PostgreSQL: fields.Datetime.now() отбрасывает доли секунды,
+        а sent_at пишется с полной точностью (см. _apply_results).
+        """
+        self.flush_model(['state', 'next_attempt_at', 'chat_id', 'sent_at'])
+        self.env.cr.execute("""
+            SELECT id
+              FROM telegram_outbox
+             WHERE id IN (
+                    SELECT DISTINCT ON (o.chat_id) o.id
+                      FROM telegram_outbox o
+                     WHERE o.state = 'pending'
+                       AND o.next_attempt_at <= now() at time zone 'UTC'
+                       AND NOT EXISTS (
+                            SELECT 1
+                              FROM telegram_outbox s
+                             WHERE s.chat_id = o.chat_id
+                               AND s.state = 'sent'
+                               AND s.sent_at >= clock_timestamp() at time zone 'UTC' - %(interval)s * interval '1 second'
+                       )
+                     ORDER BY o.chat_id, o.next_attempt_at, o.id
+                   )
+             ORDER BY next_attempt_at, id
+             LIMIT %(limit)s
+               FOR UPDATE SKIP LOCKED
+        """, {
+            'interval': TELEGRAM_CHAT_INTERVAL,
+            'limit': limit,
+        })
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    def _deliver(self):
+        """Отправляет сообщения набора параллельно через общий отправитель процесса."""
+        Partner = self.env['res.partner']
+        token = Partner._get_telegram_bot_token()
+        if not token:
+            _logger.warning("Не настроен токен Telegram бота. Отправка %s сообщений отложена.", len(self))
+            self.write({'next_attempt_at': fields.Datetime.now() + timedelta(seconds=OUTBOX_RETRY_MAX_DELAY)})
+            return
+        sender = get_sender(Partner._get_telegram_api_base_url(), token)
+        messages = []
+        for record in self:
+            payload = {'text': record.message}
+            if record.parse_mode:
+                payload['parse_mode'] = record.parse_mode
+            messages.append((record.id, record.chat_id, payload))
+        # HTTP-запросы идут в потоках, а запись результатов — здесь, в потоке с курсором
+        results = sender.send_many(messages)
+        self._apply_results(results)
+
+    def _apply_results(self, results):
+        """Записывает результаты отправки всего пакета одним UPDATE.
+
+        sent_at ставит PostgreSQL по clock_timestamp(): время с долями секунды и не
+        раньше фактической отправки, иначе интервал чата в _claim_batch сокращается.
+        """
+        now = fields.Datetime.now()
+        ids, states, attempts, next_attempts, errors = [], [], [], [], []
+        for record in self:
+            state, record_attempts, next_attempt_at, error = record._get_result_values(results[record.id], now)
+            ids.append(record.id)
+            states.append(state)
+            attempts.append(record_attempts)
+            next_attempts.append(next_attempt_at)
+            errors.append(error or None)
+        self.flush_recordset()
+        self.env.cr.execute("""
+            UPDATE telegram_outbox o
+               SET state = v.state,
+                   attempts = v.attempts,
+                   next_attempt_at = v.next_attempt_at,
+                   sent_at = CASE WHEN v.state = 'sent' THEN clock_timestamp() at time zone 'UTC' ELSE o.sent_at END,
+                   last_error = v.last_error
+              FROM unnest(%s::int[], %s::varchar[], %s::int[], %s::timestamp[], %s::text[])
+                   AS v(id, state, attempts, next_attempt_at, last_error)
+             WHERE o.id = v.id
+        """, (ids, states, attempts, next_attempts, errors))
+        self.invalidate_recordset(['state', 'attempts', 'next_attempt_at', 'sent_at', 'last_error'])
+
+    def _get_result_values(self, result, now):
+        """(статус, попыток, следующая попытка, ошибка) по результату отправки."""
+        self.ensure_one()
+        if result['ok']:
+            return 'sent', self.attempts + 1, self.next_attempt_at, False
+        error = result['error']
+        if result['status'] == 429:
+            # Ограничение частоты — не ошибка сообщения: ждём столько, сколько просит Telegram
+            delay = result['retry_after'] or OUTBOX_RETRY_DELAY
+            return 'pending', self.attempts, now + timedelta(seconds=delay), error
+        attempts = self.attempts + 1
+        if result['status'] in OUTBOX_PERMANENT_ERRORS or attempts >= OUTBOX_MAX_ATTEMPTS:
+            _logger.warning(
+                "Сообщение Telegram %s для chat_id %s не доставлено после %s попыток: %s",
+                self.id, self.chat_id, attempts, error,
+            )
+            return 'dead', attempts, self.next_attempt_at, error
+        delay = min(OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), OUTBOX_RETRY_MAX_DELAY)
+        return 'pending', attempts, now + timedelta(seconds=delay), error
+
+    def action_retry(self):
+        """Возвращает недоставленные сообщения в очередь."""
+        self.filtered(lambda r: r.state == 'dead').write({
+            'state': 'pending',
+            'attempts': 0,
+            'next_attempt_at': fields.Datetime.now(),
+        })
+        self._trigger_dispatch()
+
+    @api.autovacuum
+    def _gc_sent_messages(self):
+        """Удаляет давно отправленные сообщения."""
+        limit = fields.Datetime.now() - timedelta(days=OUTBOX_KEEP_SENT_DAYS)
+        self.search([('state', '=', 'sent'), ('sent_at', '<', limit)]).unlink()
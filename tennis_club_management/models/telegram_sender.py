@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Параллельная отправка сообщений в Telegram с ограничением частоты.
+
+Модуль не работает с ORM: потоки только выполняют HTTP-запросы, а результаты
+записывает в базу вызывающий код (см. telegram.outbox._deliver).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_logger = logging.getLogger(__name__)
+
+# Ограничения Bot API: не больше 30 сообщений в секунду на бота
+# и не больше одного сообщения в секунду в один чат (соблюдает telegram.outbox._claim_batch)
+TELEGRAM_GLOBAL_RATE = 30
+TELEGRAM_CHAT_INTERVAL = 1.0
+TELEGRAM_SENDER_WORKERS = 16
+TELEGRAM_REQUEST_TIMEOUT = 10
+# Короткий 429 пережидаем сразу, длинный возвращаем в очередь
+TELEGRAM_MAX_INLINE_RETRY_AFTER = 5
+
+
+class TokenBucket:
+    """Потокобезопасное ведро токенов; pause() останавливает выдачу всем потокам."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._updated = self._paused_until
+
+
+class TelegramSender:
+    """Отправитель с общим пулом соединений и глобальным ограничением частоты.
+
+    Экземпляр живёт всё время работы процесса (см. get_sender), поэтому
+    соединения с api.telegram.org переиспользуются между запусками cron.
+    """
+
+    def __init__(self, base_url, token, workers=TELEGRAM_SENDER_WORKERS):
+        self.url = f"{base_url}/bot{token}/sendMessage"
+        self.workers = workers
+        self.bucket = TokenBucket(TELEGRAM_GLOBAL_RATE)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def send_many(self, messages):
+        """Отправляет сообщения параллельно с общим ограничением частоты бота.
+
+        Интервал между сообщениями одного чата здесь не выдерживается: вызывающий
+        код передаёт не больше одного сообщения на чат (см. telegram.outbox._claim_batch).
+
+        :param messages: список кортежей (key, chat_id, payload)
+        :return: словарь key -> результат, см. _post
+        """
+        if not messages:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(messages))) as executor:
+            results = executor.map(
+                lambda message: self._post(dict(message[2], chat_id=message[1])), messages,
+            )
+            return {message[0]: result for message, result in zip(messages, results)}
+
+    def _post(self, payload):
+        """Возвращает словарь с ключами ok, status, error и retry_after."""
+        for _attempt in range(2):
+            self.bucket.acquire()
+            try:
+                response = self.session.post(self.url, json=payload, timeout=TELEGRAM_REQUEST_TIMEOUT)
+            except requests.RequestException as exc:
+                return {'ok': False, 'status': None, 'error': str(exc), 'retry_after': 0}
+            if response.ok:
+                return {'ok': True, 'status': response.status_code, 'error': False, 'retry_after': 0}
+            error = f"{response.status_code}: {response.text[:500]}"
+            if response.status_code != 429:
+                return {'ok': False, 'status': response.status_code, 'error': error, 'retry_after': 0}
+            try:
+                retry_after = int(response.json().get('parameters', {}).get('retry_after') or 1)
+            except ValueError:
+                retry_after = 1
+            # Telegram ограничил бота целиком — останавливаем все потоки, а не только этот
+            self.bucket.pause(retry_after)
+            if retry_after > TELEGRAM_MAX_INLINE_RETRY_AFTER:
+                break
+            _logger.info("Telegram вернул 429, повтор через %s с.", retry_after)
+        return {'ok': False, 'status': 429, 'error': error, 'retry_after': retry_after}
+
+
+_senders = {}
+_senders_lock = threading.Lock()
+
+
+def get_sender(base_url, token):
+    """Возвращает общий для процесса отправитель для указанного бота."""
+    key = (base_url, token)
+    with _senders_lock:
+        sender = _senders.get(key)
+        if sender is None:
+            sender = _senders[key] = TelegramSender(base_url, token)
+        return sender
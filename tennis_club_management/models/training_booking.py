@@ -1,13 +1,105 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, Command, _
 from odoo.exceptions import ValidationError, UserError
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 import logging
+import math
+import psycopg2.errors
 
 _logger = logging.getLogger(__name__)
 
+# Индекс занятости кортов: сутки делятся на 15-минутные слоты, занятость — битовая маска
+OCCUPANCY_SLOTS_PER_HOUR = 4
+OCCUPANCY_STATES = ('confirmed', 'in_progress')
+OCCUPANCY_FIELDS = ('court_id', 'booking_date', 'start_time', 'end_time', 'state')
+COURT_OVERLAP_CONSTRAINT = 'training_booking_court_overlap_excl'
+
+
+class CourtOverlapError(ValidationError):
+    """Нарушено ограничение исключения пересечений на корте (см. _court_overlap_guard)"""
+
+# Категория типа тренировки -> поле надбавки тренера
+TRAINER_EXTRA_FIELDS = {
+    'individual': 'price_extra_individual',
+    'split': 'price_extra_split',
+    'group': 'price_extra_group',
+}
+
+# Составные индексы горячих запросов: имя -> (колонки, INCLUDE, условие частичного индекса)
+BOOKING_INDEXES = {
+    # индекс занятости корта, проверки пересечений, get_available_times
+    'training_booking_court_date_active_idx': (
+        'court_id, booking_date, start_time', 'end_time', "state IN ('confirmed', 'in_progress')",
+    ),
+    # пересечения тренеров и участников: активные записи тех же дат (_check_person_conflicts)
+    'training_booking_active_day_idx': (
+        'booking_date', 'id, start_time, end_time, trainer_id', "state IN ('confirmed', 'in_progress')",
+    ),
+    # расписание и доступные даты тренера
+    'training_booking_trainer_date_state_idx': (
+        'trainer_id, booking_date, state', 'start_time, end_time', 'trainer_id IS NOT NULL',
+    ),
+    # тренировки клиента (бот: /info, get_partner_trainings)
+    'training_booking_customer_state_date_idx': (
+        'customer_id, state, booking_date', 'start_time', 'customer_id IS NOT NULL',
+    ),
+    # автоматическая смена статусов: подтверждённые по началу, идущие по окончанию
+    'training_booking_confirmed_start_idx': (
+        'booking_datetime_start', 'booking_datetime_end', "state = 'confirmed'",
+    ),
+    'training_booking_in_progress_end_idx': (
+        'booking_datetime_end', 'booking_datetime_start', "state = 'in_progress'",
+    ),
+    # очередь напоминаний: cron читает только записи с наступившим сроком
+    'training_booking_next_reminder_idx': (
+        'next_reminder_at', 'next_reminder_offset', 'next_reminder_at IS NOT NULL',
+    ),
+}
+
+# Уведомление шины о смене статуса (см. static/src/js/training_booking_timer.js)
+BOOKING_STATE_NOTIFICATION = 'tennis_club_management/booking_state'
+STATE_NOTIFICATION_GROUPS = (
+    'tennis_club_management.group_tennis_director',
+    'tennis_club_management.group_tennis_manager',
+    'tennis_club_management.group_tennis_trainer',
+)
+
+REMINDER_BATCH_SIZE = 200
+REMINDER_MAX_BATCHES = 10
+
+
+def occupancy_mask(start_time, end_time):
+    """Битовая маска слотов, которые задевает интервал [start_time, end_time)"""
+    first = math.floor(start_time * OCCUPANCY_SLOTS_PER_HOUR)
+    last = math.ceil(end_time * OCCUPANCY_SLOTS_PER_HOUR) if end_time else first + OCCUPANCY_SLOTS_PER_HOUR
+    if last <= first:
+        last = first + 1
+    return ((1 << (last - first)) - 1) << first
+
+
+def free_starts(free, first, last, step, length):
+    """Слоты начала на сетке с шагом step (от first), с которых length слотов подряд свободны в free"""
+    need = (1 << length) - 1
+    starts = []
+    index = first
+    while index + length <= last:
+        if (free >> index) & need == need:
+            starts.append(index)
+        index += step
+    return starts
+
+
+def covered_mask(start_time, end_time):
+    """Битовая маска слотов, целиком лежащих внутри интервала [start_time, end_time)"""
+    first = math.ceil(start_time * OCCUPANCY_SLOTS_PER_HOUR)
+    last = math.floor(end_time * OCCUPANCY_SLOTS_PER_HOUR)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
 
 class TrainingBooking(models.Model):
     _name = 'training.booking'
@@ -187,19 +279,69 @@ class TrainingBooking(models.Model):
                 # По умолчанию используем цвет типа тренировки или серый
                 booking.color = booking.training_type_id.color if booking.training_type_id else 0
     
-    # Поля для отслеживания отправленных напоминаний
-    reminder_1day_sent = fields.Boolean(
-        string='Напоминание за день отправлено',
-        default=False,
-        help='Отметка о том, что напоминание за день до тренировки было отправлено'
+    # Очередь напоминаний: срок ближайшего неотправленного напоминания хранится
+    # в записи, cron выбирает записи с наступившим сроком по индексу
+    reminder_sent_offset = fields.Float(
+        string='Отправлено напоминание за (ч)',
+        copy=False,
+        help='За сколько часов до начала было отправлено последнее напоминание (0 — ещё не отправлялось)'
     )
-    
-    reminder_2hours_sent = fields.Boolean(
-        string='Напоминание за 2 часа отправлено',
-        default=False,
-        help='Отметка о том, что напоминание за 2 часа до тренировки было отправлено'
+
+    next_reminder_at = fields.Datetime(
+        string='Следующее напоминание',
+        compute='_compute_next_reminder',
+        store=True,
+        copy=False,
+        help='Когда клиенту будет отправлено следующее напоминание о тренировке'
     )
-    
+
+    next_reminder_offset = fields.Float(
+        string='Следующее напоминание за (ч)',
+        compute='_compute_next_reminder',
+        store=True,
+        copy=False
+    )
+
+    @api.depends('booking_datetime_start', 'state', 'sports_center_id', 'reminder_sent_offset')
+    def _compute_next_reminder(self):
+        now = fields.Datetime.now()
+        for booking in self:
+            offsets = ()
+            if booking.state in OCCUPANCY_STATES and booking.sports_center_id:
+                offsets = booking.sports_center_id._get_reminder_offsets()
+            booking.next_reminder_at, booking.next_reminder_offset = self._get_next_reminder(
+                booking.booking_datetime_start, offsets, booking.reminder_sent_offset, now
+            )
+
+    @api.model
+    def _get_next_reminder(self, start, offsets, sent_offset, now):
+        """Ближайшее напоминание (срок, смещение в часах) или (False, 0).
+
+        Напоминания, срок которых уже прошёл к моменту записи или переноса,
+        пропускаются: клиент, записавшийся за 3 часа, получит только
+        напоминание за 2 часа, а не «завтра тренировка».
+        """
+        if not start:
+            return False, 0.0
+        for offset in offsets:
+            if sent_offset and offset >= sent_offset:
+                continue
+            due = start - timedelta(hours=offset)
+            if due > now:
+                return due, offset
+        return False, 0.0
+
+    @api.model
+    def _recompute_reminders(self, domain):
+        """Пересчитывает очередь напоминаний для будущих записей после смены настроек центра"""
+        bookings = self.search(domain + [
+            ('state', 'in', OCCUPANCY_STATES),
+            ('booking_datetime_start', '>', fields.Datetime.now()),
+        ])
+        for field_name in ('next_reminder_at', 'next_reminder_offset'):
+            self.env.add_to_compute(self._fields[field_name], bookings)
+        bookings.flush_recordset(['next_reminder_at', 'next_reminder_offset'])
+
     # Поле для определения, записал ли тренер сам себе
     is_trainer_self_booking = fields.Boolean(
         string='Запись тренера самому себе',
@@ -442,23 +584,14 @@ class TrainingBooking(models.Model):
     @api.depends('sports_center_id', 'training_type_id')
     def _compute_price_per_hour(self):
         """Вычисляет цену за час из настроек спортивного центра или типа тренировки"""
+        center_prices, type_info = self._get_price_matrix()
         for booking in self:
             price = 0.0
-            # Сначала ищем цену в настройках спортивного центра
-            if booking.sports_center_id and booking.training_type_id:
-                price_record = self.env['sports.center.training.price'].search([
-                    ('sports_center_id', '=', booking.sports_center_id.id),
-                    ('training_type_id', '=', booking.training_type_id.id),
-                    ('active', '=', True)
-                ], limit=1)
-                if price_record:
-                    price = price_record.price_per_hour
-                else:
-                    # Если цена не найдена в центре, используем цену из типа тренировки
-                    price = booking.training_type_id.price_per_hour or 0.0
-            elif booking.training_type_id:
-                # Если нет центра, используем цену из типа тренировки
-                price = booking.training_type_id.price_per_hour or 0.0
+            type_id = booking.training_type_id.id
+            if type_id:
+                # Цена центра, если задана, иначе — цена из типа тренировки
+                base_price = type_info.get(type_id, (0.0, False))[0]
+                price = center_prices.get((booking.sports_center_id.id, type_id), base_price)
             booking.price_per_hour = price
     
     @api.depends('price_per_hour', 'start_time', 'end_time', 'trainer_extra_per_hour')
@@ -474,37 +607,79 @@ class TrainingBooking(models.Model):
 
     @api.depends('trainer_id', 'training_type_id')
     def _compute_trainer_extra(self):
+        _center_prices, type_info = self._get_price_matrix()
+        trainer_extras = self._get_trainer_extras()
         for booking in self:
             extra = 0.0
             if booking.trainer_id and booking.training_type_id:
-                # 1) Приоритет — явная категория типа тренировки
-                category = booking.training_type_id.category
-                if category == 'individual':
-                    extra = booking.trainer_id.price_extra_individual or 0.0
-                elif category == 'split':
-                    extra = booking.trainer_id.price_extra_split or 0.0
-                elif category == 'group':
-                    extra = booking.trainer_id.price_extra_group or 0.0
-                else:
-                    # 2) Fallback по коду
-                    code = (booking.training_type_id.code or '').strip().upper()
-                    name = (booking.training_type_id.name or '').strip().lower()
-                    if code in ('INDIVIDUAL', 'IND'):
-                        extra = booking.trainer_id.price_extra_individual or 0.0
-                    elif code in ('SPLIT', 'PAIR'):
-                        extra = booking.trainer_id.price_extra_split or 0.0
-                    elif code in ('GROUP', 'GRP'):
-                        extra = booking.trainer_id.price_extra_group or 0.0
-                    else:
-                        # 3) Fallback по названию (рус/англ, регистронезависимо)
-                        if 'инд' in name or 'individual' in name:
-                            extra = booking.trainer_id.price_extra_individual or 0.0
-                        elif 'сплит' in name or 'split' in name or 'парн' in name:
-                            extra = booking.trainer_id.price_extra_split or 0.0
-                        elif 'груп' in name or 'group' in name:
-                            extra = booking.trainer_id.price_extra_group or 0.0
+                category = type_info.get(booking.training_type_id.id, (0.0, False))[1]
+                if category:
+                    extra = trainer_extras.get(booking.trainer_id.id, {}).get(category, 0.0)
             booking.trainer_extra_per_hour = extra
             booking.final_price_per_hour = (booking.price_per_hour or 0.0) + extra
+
+    @api.model
+    def _get_trainer_extra_category(self, category, code, name):
+        """Категория надбавки тренера для типа тренировки: individual, split, group или False"""
+        # 1) Приоритет — явная категория типа тренировки
+        if category in TRAINER_EXTRA_FIELDS:
+            return category
+        # 2) Fallback по коду
+        code = (code or '').strip().upper()
+        if code in ('INDIVIDUAL', 'IND'):
+            return 'individual'
+        if code in ('SPLIT', 'PAIR'):
+            return 'split'
+        if code in ('GROUP', 'GRP'):
+            return 'group'
+        # 3) Fallback по названию (рус/англ, регистронезависимо)
+        name = (name or '').strip().lower()
+        if 'инд' in name or 'individual' in name:
+            return 'individual'
+        if 'сплит' in name or 'split' in name or 'парн' in name:
+            return 'split'
+        if 'груп' in name or 'group' in name:
+            return 'group'
+        return False
+
+    @api.model
+    @tools.ormcache()
+    def _get_price_matrix(self):
+        """Матрица цен: ({(центр, тип): цена за час}, {тип: (цена типа, категория надбавки)}).
+
+        Загружается целиком двумя запросами и хранится в кэше реестра до изменения
+        цен центров, типов тренировок или надбавок тренеров: только их create/write/
+        unlink сбрасывают кэш, записи на тренировки его не затрагивают.
+        """
+        center_prices = {}
+        for price in self.env['sports.center.training.price'].sudo().with_context(active_test=True).search_read(
+            [], ['sports_center_id', 'training_type_id', 'price_per_hour'], load=None,
+        ):
+            key = (price['sports_center_id'], price['training_type_id'])
+            center_prices.setdefault(key, price['price_per_hour'] or 0.0)
+        type_info = {
+            training_type['id']: (
+                training_type['price_per_hour'] or 0.0,
+                self._get_trainer_extra_category(training_type['category'], training_type['code'], training_type['name']),
+            )
+            for training_type in self.env['training.type'].sudo().with_context(active_test=False).search_read(
+                [], ['price_per_hour', 'category', 'code', 'name'],
+            )
+        }
+        return center_prices, type_info
+
+    @api.model
+    @tools.ormcache()
+    def _get_trainer_extras(self):
+        """Надбавки тренеров одним запросом: {тренер: {категория: руб/час}} (только ненулевые)"""
+        fnames = list(TRAINER_EXTRA_FIELDS.values())
+        domain = ['|', '|'] + [(fname, '!=', 0) for fname in fnames]
+        extras = {}
+        for employee in self.env['hr.employee'].sudo().with_context(active_test=False).search_read(domain, fnames):
+            extras[employee['id']] = {
+                category: employee[fname] or 0.0 for category, fname in TRAINER_EXTRA_FIELDS.items()
+            }
+        return extras
     
     @api.depends('customer_balance', 'total_price', 'participant_count', 'additional_participants', 'additional_participants.participant_id', 'training_type_id')
     def _compute_can_afford(self):
@@ -839,27 +1014,12 @@ class TrainingBooking(models.Model):
                 booking.recur_total_sessions = 1
                 booking.overall_total_price = booking.total_price
                 continue
-            # Собираем даты по выбранным дням недели
-            start_date = booking.booking_date
-            if not start_date:
+            if not booking.booking_date:
                 booking.recur_total_sessions = 1
                 booking.overall_total_price = booking.total_price
                 continue
-            end_date = start_date + relativedelta(months=booking.recur_months)
-            weekday_codes = [d.code for d in booking.recur_weekday_ids] or [start_date.weekday()]
-            # Генерация дней
-            count = 0
-            current = start_date
-            while current < end_date:
-                if current.weekday() in weekday_codes:
-                    count += 1
-                current += timedelta(days=1)
-            # Учёт ограничителя «раз в неделю»
-            if booking.recur_times_per_week > 0:
-                # приблизительная неделя = 7 дней
-                weeks = max(1, (end_date - start_date).days // 7)
-                count = min(count, weeks * booking.recur_times_per_week)
-            booking.recur_total_sessions = max(1, count)
+            # Текущее занятие + будущие даты серии (те же правила, что и при генерации)
+            booking.recur_total_sessions = 1 + len(booking._get_recurrence_dates())
             # Итоговая сумма = цена за одно занятие * количество занятий
             price_one = booking.total_price if booking.total_price else (booking.price_per_hour * max(0.0, (booking.end_time or 0) - (booking.start_time or 0)))
             booking.overall_total_price = price_one * booking.recur_total_sessions
@@ -1031,7 +1191,11 @@ class TrainingBooking(models.Model):
                     if 'state' not in vals or vals.get('state') not in ['draft', 'cancelled']:
                         vals['state'] = 'draft'
         
-        bookings = super().create(vals_list)
+        if any(vals.get('state') in OCCUPANCY_STATES for vals in vals_list):
+            with self._court_overlap_guard():
+                bookings = super().create(vals_list)
+        else:
+            bookings = super().create(vals_list)
         
         # После создания, если нужно, добавляем пустые записи для участников
         # НЕ создаем записи для групповых тренировок - участники определяются в группе
@@ -1094,35 +1258,313 @@ class TrainingBooking(models.Model):
         """При смене тренера/центра/даты сразу подставляем ближайший допустимый слот"""
         self._auto_set_first_available_slot()
     
+    @api.model
+    def _get_court_occupancy(self, court_id, booking_date):
+        """Маска занятости корта на дату по подтверждённым и идущим записям.
+
+        Запрос читает только start_time и end_time, которые есть в частичном
+        индексе training_booking_court_date_active_idx, поэтому выполняется
+        index-only scan. Чтение из базы видит изменения текущей транзакции и
+        не зависит от кэшей других процессов.
+        """
+        self.flush_model(list(OCCUPANCY_FIELDS))
+        self.env.cr.execute("""
+            SELECT start_time, end_time
+              FROM training_booking
+             WHERE court_id = %s
+               AND booking_date = %s
+               AND state IN %s
+        """, (court_id, booking_date, OCCUPANCY_STATES))
+        mask = 0
+        for start_time, end_time in self.env.cr.fetchall():
+            mask |= occupancy_mask(start_time, end_time)
+        return mask
+
+    def init(self):
+        """Создаёт составные индексы и гарантию отсутствия пересечений на корте.
+
+        booking_range — вычисляемая PostgreSQL колонка tsrange из
+        booking_datetime_start/end, по ней GiST-ограничение исключения не даёт
+        двум подтверждённым/идущим записям одного корта пересечься даже при
+        одновременных транзакциях.
+        """
+        super().init()
+        self._init_booking_indexes()
+        cr = self.env.cr
+        try:
+            with cr.savepoint(flush=False):
+                cr.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        except psycopg2.Error as e:
+            _logger.error("Расширение btree_gist недоступно, ограничение пересечений кортов не создано: %s", e)
+            return
+        if not tools.sql.column_exists(cr, self._table, 'booking_range'):
+            cr.execute("""
+                ALTER TABLE training_booking
+                ADD COLUMN booking_range tsrange GENERATED ALWAYS AS (
+                    CASE WHEN booking_datetime_end > booking_datetime_start
+                         THEN tsrange(booking_datetime_start, booking_datetime_end, '[)')
+                    END
+                ) STORED
+            """)
+        if not tools.sql.constraint_definition(cr, self._table, COURT_OVERLAP_CONSTRAINT):
+            try:
+                with cr.savepoint(flush=False):
+                    cr.execute(f"""
+                        ALTER TABLE training_booking
+                        ADD CONSTRAINT {COURT_OVERLAP_CONSTRAINT}
+                        EXCLUDE USING gist (court_id WITH =, booking_range WITH &&)
+                        WHERE (state IN ('confirmed', 'in_progress'))
+                    """)
+            except psycopg2.Error as e:
+                # Обычно это уже существующие пересекающиеся записи: их нужно разобрать вручную
+                _logger.error("Не удалось создать ограничение %s: %s", COURT_OVERLAP_CONSTRAINT, e)
+
+    def _init_booking_indexes(self):
+        for name, (columns, include, where) in BOOKING_INDEXES.items():
+            self.env.cr.execute(f"""
+                CREATE INDEX IF NOT EXISTS {name}
+                    ON training_booking ({columns}) INCLUDE ({include})
+                 WHERE {where}
+            """)
+
+    @api.model
+    def check_booking_indexes(self):
+        """Сверяет индексы и ограничения training_booking со статистикой PostgreSQL.
+
+        Возвращает {'missing': [...], 'unused': [...], 'missing_constraints': [...]}:
+        недостающие индексы из BOOKING_INDEXES, индексы таблицы без единого
+        сканирования с момента сброса статистики (кроме первичного ключа и
+        ограничений) и отсутствующее ограничение пересечений кортов. Без него
+        от двойного бронирования защищает только блокировка корта в book_slot.
+        """
+        cr = self.env.cr
+        cr.execute("""
+            SELECT s.indexrelname, s.idx_scan, c.conname IS NOT NULL
+              FROM pg_stat_user_indexes s
+              LEFT JOIN pg_constraint c ON c.conindid = s.indexrelid
+             WHERE s.relname = 'training_booking'
+        """)
+        rows = cr.fetchall()
+        existing = {name for name, _scans, _is_constraint in rows}
+        missing = sorted(set(BOOKING_INDEXES) - existing)
+        unused = sorted(name for name, scans, is_constraint in rows if not scans and not is_constraint)
+        if missing:
+            _logger.warning("Отсутствуют индексы training_booking: %s", ', '.join(missing))
+        if unused:
+            _logger.info("Неиспользуемые индексы training_booking: %s", ', '.join(unused))
+        missing_constraints = []
+        if not tools.sql.constraint_definition(cr, self._table, COURT_OVERLAP_CONSTRAINT):
+            missing_constraints.append(COURT_OVERLAP_CONSTRAINT)
+            _logger.error(
+                "Отсутствует ограничение %s: пересечения на корте проверяются только в book_slot. "
+                "Установите расширение btree_gist и обновите модуль.", COURT_OVERLAP_CONSTRAINT,
+            )
+        return {'missing': missing, 'unused': unused, 'missing_constraints': missing_constraints}
+
+    @contextmanager
+    def _court_overlap_guard(self):
+        """Переводит нарушение ограничения пересечений корта в понятную пользователю ошибку"""
+        try:
+            with self.env.cr.savepoint():
+                yield
+        except psycopg2.errors.ExclusionViolation as e:
+            if e.diag.constraint_name != COURT_OVERLAP_CONSTRAINT:
+                raise
+            raise CourtOverlapError(
+                _('Выбранное время на корте уже занято другой подтверждённой записью. Выберите другое время.')
+            ) from None
+
     @api.constrains('booking_date', 'start_time', 'end_time', 'court_id')
     def _check_booking_conflicts(self):
-        """Проверяет конфликты в расписании"""
-        for booking in self:
-            if booking.state in ['cancelled']:
-                continue
-                
-            # Проверяем пересечения с другими записями на том же корте
-            conflicting_bookings = self.search([
-                ('court_id', '=', booking.court_id.id),
-                ('booking_date', '=', booking.booking_date),
-                ('state', 'in', ['confirmed', 'in_progress']),
-                ('id', '!=', booking.id),
-                '|',
-                '&', ('start_time', '<', booking.end_time),
-                     ('end_time', '>', booking.start_time),
-                '&', ('start_time', '=', booking.start_time),
-                     ('end_time', '=', booking.end_time)
-            ])
-            
-            if conflicting_bookings:
-                raise ValidationError(
-                    _('Время %s-%s уже занято на корте %s') % (
-                        booking.start_time_display,
-                        booking.end_time_display,
-                        booking.court_id.name
-                    )
-                )
+        """Проверяет конфликты в расписании одним запросом для всего набора.
+
+        Неотменённая запись конфликтует с подтверждёнными/идущими записями
+        корта (включая записи этого же набора) — одинаково для одной записи
+        и для пакета.
+        """
+        bookings = self.filtered('id')
+        if not bookings:
+            return
+        self.flush_model(list(OCCUPANCY_FIELDS))
+        self.env.cr.execute("""
+            SELECT b.id
+              FROM training_booking b
+              JOIN training_booking o
+                ON o.court_id = b.court_id
+               AND o.booking_date = b.booking_date
+               AND o.id != b.id
+               AND (
+                    (o.start_time < b.end_time AND o.end_time > b.start_time)
+                    OR (o.start_time = b.start_time AND o.end_time = b.end_time)
+               )
+             WHERE b.id IN %(ids)s
+               AND b.state != 'cancelled'
+               AND o.state IN %(states)s
+             ORDER BY b.booking_date, b.start_time
+             LIMIT 1
+        """, {'ids': tuple(bookings.ids), 'states': OCCUPANCY_STATES})
+        row = self.env.cr.fetchone()
+        if row:
+            self.browse(row[0])._raise_booking_conflict()
+
+    def _raise_booking_conflict(self):
+        raise ValidationError(
+            _('Время %s-%s уже занято на корте %s') % (
+                self.start_time_display,
+                self.end_time_display,
+                self.court_id.name
+            )
+        )
     
+    @api.constrains('booking_date', 'start_time', 'end_time', 'trainer_id', 'customer_id', 'group_id')
+    def _check_person_conflicts(self):
+        """Тренер и участники не могут быть на двух тренировках одновременно.
+
+        Весь набор проверяется одним запросом: пересечения по времени ищутся
+        среди подтверждённых/идущих записей тех же дат и черновиков/подтверждённых/
+        идущих записей самого набора, затем сравниваются тренеры и составы
+        участников (клиент, дополнительные участники, участники группы).
+        Завершённые записи не проверяются. Смена статуса проверяется только
+        при подтверждении (см. write), чтобы автоматические переходы
+        в «в процессе»/«завершена» не блокировались старыми пересечениями.
+        """
+        bookings = self.filtered('id')
+        if not bookings:
+            return
+        self.flush_model(['booking_date', 'start_time', 'end_time', 'trainer_id', 'customer_id', 'group_id', 'state'])
+        self.env['training.booking.participant'].flush_model(['booking_id', 'participant_id'])
+        self.env['training.group'].flush_model(['participant_ids'])
+        self.env.cr.execute("""
+            WITH target AS (
+                SELECT id, booking_date, start_time, end_time, trainer_id
+                  FROM training_booking
+                 WHERE id IN %(ids)s
+                   AND state NOT IN ('cancelled', 'completed')
+                   AND booking_date IS NOT NULL
+            ),
+            others AS (
+                SELECT o.id, o.booking_date, o.start_time, o.end_time, o.trainer_id
+                  FROM training_booking o
+                 WHERE o.state IN %(states)s
+                   AND o.booking_date IN (SELECT booking_date FROM target)
+                UNION
+                SELECT id, booking_date, start_time, end_time, trainer_id
+                  FROM target
+            ),
+            pairs AS (
+                SELECT t.id AS booking_id, o.id AS other_id, t.trainer_id = o.trainer_id AS same_trainer
+                  FROM target t
+                  JOIN others o
+                    ON o.booking_date = t.booking_date
+                   AND o.id != t.id
+                   AND o.start_time < t.end_time
+                   AND o.end_time > t.start_time
+            ),
+            involved AS (
+                SELECT booking_id AS id FROM pairs
+                UNION
+                SELECT other_id FROM pairs
+            ),
+            members AS (
+                SELECT b.id AS booking_id, b.customer_id AS partner_id
+                  FROM training_booking b
+                 WHERE b.id IN (SELECT id FROM involved)
+                   AND b.customer_id IS NOT NULL
+                UNION
+                SELECT p.booking_id, p.participant_id
+                  FROM training_booking_participant p
+                 WHERE p.booking_id IN (SELECT id FROM involved)
+                   AND p.participant_id IS NOT NULL
+                UNION
+                SELECT b.id, r.partner_id
+                  FROM training_booking b
+                  JOIN training_group_participant_rel r ON r.group_id = b.group_id
+                 WHERE b.id IN (SELECT id FROM involved)
+            )
+            SELECT p.booking_id, p.other_id, NULL
+              FROM pairs p
+             WHERE p.same_trainer
+            UNION ALL
+            SELECT p.booking_id, p.other_id, m.partner_id
+              FROM pairs p
+              JOIN members m ON m.booking_id = p.booking_id
+              JOIN members n ON n.booking_id = p.other_id AND n.partner_id = m.partner_id
+             LIMIT 1
+        """, {'ids': tuple(bookings.ids), 'states': OCCUPANCY_STATES})
+        row = self.env.cr.fetchone()
+        if not row:
+            return
+        booking, other = self.browse(row[0]), self.browse(row[1])
+        when = '%s %s-%s' % (other.booking_date, other.start_time_display, other.end_time_display)
+        if row[2] is None:
+            raise ValidationError(
+                _('Тренер %s уже занят в это время: %s (%s, корт %s)') % (
+                    booking.trainer_id.name, other.name, when, other.court_id.name
+                )
+            )
+        raise ValidationError(
+            _('Участник %s уже записан на тренировку в это время: %s (%s)') % (
+                self.env['res.partner'].browse(row[2]).name, other.name, when
+            )
+        )
+
+    @api.model
+    def _get_busy_masks(self, date_from, date_to, trainer_ids=(), partner_ids=()):
+        """Занятость тренеров и участников подтверждёнными тренировками за период.
+
+        Один запрос; результат — {('trainer' | 'partner', id, дата): маска слотов}.
+        Используется поиском слотов, проверкой доступности и генерацией серий.
+        """
+        busy = {}
+        if not trainer_ids and not partner_ids:
+            return busy
+        self.flush_model(['booking_date', 'start_time', 'end_time', 'trainer_id', 'customer_id', 'group_id', 'state'])
+        self.env['training.booking.participant'].flush_model(['booking_id', 'participant_id'])
+        self.env['training.group'].flush_model(['participant_ids'])
+        partners = list(partner_ids)
+        self.env.cr.execute("""
+            SELECT 'trainer', b.trainer_id, b.booking_date, b.start_time, b.end_time
+              FROM training_booking b
+             WHERE b.trainer_id = ANY(%(trainers)s)
+               AND b.booking_date BETWEEN %(date_from)s AND %(date_to)s
+               AND b.state IN %(states)s
+            UNION ALL
+            SELECT 'partner', m.partner_id, b.booking_date, b.start_time, b.end_time
+              FROM (
+                    SELECT id AS booking_id, customer_id AS partner_id
+                      FROM training_booking
+                     WHERE customer_id = ANY(%(partners)s)
+                    UNION
+                    SELECT booking_id, participant_id
+                      FROM training_booking_participant
+                     WHERE participant_id = ANY(%(partners)s)
+                    UNION
+                    SELECT g.id, r.partner_id
+                      FROM training_group_participant_rel r
+                      JOIN training_booking g ON g.group_id = r.group_id
+                     WHERE r.partner_id = ANY(%(partners)s)
+                   ) m
+              JOIN training_booking b ON b.id = m.booking_id
+             WHERE b.booking_date BETWEEN %(date_from)s AND %(date_to)s
+               AND b.state IN %(states)s
+        """, {
+            'trainers': list(trainer_ids),
+            'partners': partners,
+            'date_from': date_from,
+            'date_to': date_to,
+            'states': OCCUPANCY_STATES,
+        })
+        for kind, record_id, day, start_time, end_time in self.env.cr.fetchall():
+            key = (kind, record_id, day)
+            busy[key] = busy.get(key, 0) | occupancy_mask(start_time, end_time)
+        return busy
+
+    def _get_member_partner_ids(self):
+        """Все участники записи: клиент, дополнительные участники и участники группы"""
+        self.ensure_one()
+        partners = self.customer_id | self.additional_participants.participant_id | self.group_id.participant_ids
+        return partners.ids
+
     @api.constrains('booking_date', 'start_time', 'court_id')
     def _check_court_availability(self):
         """Проверяет доступность корта в указанное время"""
@@ -1299,49 +1741,120 @@ class TrainingBooking(models.Model):
                 'tag': 'reload',
             }
 
+    def _get_recurrence_dates(self):
+        """Даты будущих занятий серии по правилам повторов (без даты текущей записи).
+
+        Правило раскрывается целиком в памяти: дни недели, ограничение
+        «раз в неделю» и срок в месяцах.
+        """
+        self.ensure_one()
+        if not self.is_recurring or not self.booking_date:
+            return []
+        start_date = self.booking_date
+        end_date = start_date + relativedelta(months=max(1, self.recur_months))
+        weekday_codes = {d.code for d in self.recur_weekday_ids} or {start_date.weekday()}
+        dates = []
+        week_count = {}
+        current = start_date + timedelta(days=1)
+        while current < end_date:
+            if current.weekday() in weekday_codes:
+                # ограничение по количеству раз в неделю
+                iso_year, iso_week, _iso_weekday = current.isocalendar()
+                key = (iso_year, iso_week)
+                week_count[key] = week_count.get(key, 0) + 1
+                if not self.recur_times_per_week or week_count[key] <= self.recur_times_per_week:
+                    dates.append(current)
+            current += timedelta(days=1)
+        return dates
+
+    def _check_recurrence_dates(self, dates, start_time, end_time):
+        """Пакетная проверка дат серии: {дата: причина}, свободные даты в словарь не попадают.
+
+        Занятость корта и доступность тренера за весь период читаются
+        двумя запросами независимо от числа занятий.
+        Причины: 'past', 'court_busy', 'trainer_unavailable', 'trainer_busy',
+        'participant_busy'.
+        """
+        self.ensure_one()
+        if not dates:
+            return {}
+        date_from, date_to = min(dates), max(dates)
+        need = occupancy_mask(start_time, end_time)
+        occupancy = self._get_period_occupancy([self.court_id.id], date_from, date_to) if self.court_id else {}
+        availability = None
+        if self.trainer_id and self.sports_center_id:
+            availability = self._get_trainer_availability_masks(
+                [self.trainer_id.id], self.sports_center_id.id, date_from, date_to
+            )
+        partner_ids = self._get_member_partner_ids()
+        busy = self._get_busy_masks(date_from, date_to, self.trainer_id.ids, partner_ids)
+        today = fields.Date.today()
+        problems = {}
+        for day in dates:
+            if day < today:
+                problems[day] = 'past'
+            elif occupancy.get((self.court_id.id, day), 0) & need:
+                problems[day] = 'court_busy'
+            elif availability is not None and availability.get((self.trainer_id.id, day), 0) & need != need:
+                problems[day] = 'trainer_unavailable'
+            elif busy.get(('trainer', self.trainer_id.id, day), 0) & need:
+                problems[day] = 'trainer_busy'
+            elif any(busy.get(('partner', partner_id, day), 0) & need for partner_id in partner_ids):
+                problems[day] = 'participant_busy'
+        return problems
+
+    def _prepare_recurrence_vals(self, booking_date, start_time, end_time):
+        self.ensure_one()
+        return {
+            'name': _('New'),
+            'customer_id': self.customer_id.id,
+            'trainer_id': self.trainer_id.id,
+            'court_id': self.court_id.id,
+            'training_type_id': self.training_type_id.id,
+            'booking_date': booking_date,
+            'start_time': start_time,
+            'end_time': end_time,
+            'sports_center_id': self.sports_center_id.id,
+            'state': 'draft',
+        }
+
     def action_generate_recurrences(self):
-        """Создаёт будущие записи по правилам повторов, не создавая дубликат текущей"""
-        Booking = self.env['training.booking']
-        created = self.browse()
-        for booking in self:
-            if not booking.is_recurring or not booking.booking_date:
-                continue
-            start_date = booking.booking_date
-            end_date = start_date + relativedelta(months=max(1, booking.recur_months))
-            weekday_codes = [d.code for d in booking.recur_weekday_ids] or [start_date.weekday()]
-            # используем времена повторов если заданы, иначе текущие
-            st = booking.recur_start_time or booking.start_time
-            en = booking.recur_end_time or booking.end_time
-            # генерация по дням
-            week_count = {}
-            current = start_date
-            while current < end_date:
-                if current == start_date:
-                    current += timedelta(days=1)
-                    continue
-                if current.weekday() in weekday_codes:
-                    # ограничение по количеству раз в неделю
-                    iso_year, iso_week, iso_weekday = current.isocalendar()
-                    key = (iso_year, iso_week)
-                    week_count[key] = week_count.get(key, 0) + 1
-                    if booking.recur_times_per_week and week_count[key] > booking.recur_times_per_week:
-                        current += timedelta(days=1)
-                        continue
-                    vals = {
-                        'name': _('New'),
-                        'customer_id': booking.customer_id.id,
-                        'trainer_id': booking.trainer_id.id,
-                        'court_id': booking.court_id.id,
-                        'training_type_id': booking.training_type_id.id,
-                        'booking_date': current,
-                        'start_time': st,
-                        'end_time': en,
-                        'sports_center_id': booking.sports_center_id.id,
-                        'state': 'draft',
-                    }
-                    created |= Booking.create([vals])
-                current += timedelta(days=1)
-        return created
+        """Открывает предпросмотр серии: даты будущих занятий и конфликты по каждой из них.
+
+        Сами записи создаются мастером одним create(vals_list) после подтверждения.
+        """
+        self.ensure_one()
+        if not self.is_recurring or not self.booking_date:
+            raise UserError(_('Включите «Постоянные занятия» и укажите дату первой тренировки.'))
+        start_time = self.recur_start_time or self.start_time
+        end_time = self.recur_end_time or self.end_time
+        if end_time <= start_time:
+            raise UserError(_('Время окончания должно быть позже времени начала'))
+        dates = self._get_recurrence_dates()
+        if not dates:
+            raise UserError(_('По заданным правилам нет ни одной будущей даты.'))
+        problems = self._check_recurrence_dates(dates, start_time, end_time)
+        wizard = self.env['training.recurrence.wizard'].create({
+            'booking_id': self.id,
+            'start_time': start_time,
+            'end_time': end_time,
+            'line_ids': [
+                Command.create({
+                    'booking_date': day,
+                    'status': problems.get(day, 'ok'),
+                    'selected': day not in problems,
+                })
+                for day in dates
+            ],
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Постоянные занятия'),
+            'res_model': 'training.recurrence.wizard',
+            'res_id': wizard.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
     
     def action_start(self):
         """Начинает тренировку"""
@@ -1449,16 +1962,22 @@ class TrainingBooking(models.Model):
             if vals['state'] not in ['draft', 'cancelled']:
                 raise ValidationError(_('Тренер может установить только статус "Черновик" или "Отменена". Подтверждение записей доступно только менеджеру.'))
         
-        # Сбрасываем флаги напоминаний при изменении даты или времени тренировки
-        if 'booking_date' in vals or 'start_time' in vals or 'state' in vals:
-            for booking in self:
-                # Если дата изменилась или тренировка отменена/завершена, сбрасываем флаги
-                if 'booking_date' in vals or (vals.get('state') in ['cancelled', 'completed']):
-                    if booking.reminder_1day_sent or booking.reminder_2hours_sent:
-                        vals.setdefault('reminder_1day_sent', False)
-                        vals.setdefault('reminder_2hours_sent', False)
+        # При переносе или отмене тренировки напоминания начинаются заново;
+        # срок следующего напоминания пересчитает _compute_next_reminder
+        if 'booking_date' in vals or 'start_time' in vals or vals.get('state') == 'cancelled':
+            if any(booking.reminder_sent_offset for booking in self):
+                vals.setdefault('reminder_sent_offset', 0.0)
         
-        result = super().write(vals)
+        # Пересечение на корте отсекает ограничение исключения в базе
+        if any(field in vals for field in OCCUPANCY_FIELDS):
+            with self._court_overlap_guard():
+                result = super().write(vals)
+        else:
+            result = super().write(vals)
+
+        # Занятость тренера и участников при подтверждении (остальные поля проверяет ограничение)
+        if vals.get('state') == 'confirmed':
+            self._check_person_conflicts()
         
         # После изменения типа тренировки, если нужно, добавляем пустые записи для участников
         # НЕ создаем записи для групповых тренировок - участники определяются в группе
@@ -1605,11 +2124,12 @@ class TrainingBooking(models.Model):
                             f"Ошибка при отправке уведомления клиенту {partner.name}: {e}"
                         )
     
-    def _send_training_reminder(self, reminder_type='1day'):
-        """Отправляет напоминание о предстоящей тренировке клиенту.
-        
-        :param reminder_type: тип напоминания - '1day' (за день) или '2hours' (за 2 часа)
+    def _send_training_reminder(self, offset):
+        """Ставит в очередь напоминание о предстоящей тренировке клиенту.
+
+        :param offset: за сколько часов до начала отправляется напоминание
         """
+        lead = self._format_reminder_lead(offset)
         for booking in self:
             partner = booking.customer_id
             if not partner or not partner.telegram_chat_id:
@@ -1619,155 +2139,223 @@ class TrainingBooking(models.Model):
                     partner.name if partner else 'N/A'
                 )
                 continue
-            
-            if booking.state not in ['confirmed', 'in_progress']:
-                _logger.debug(
-                    "Пропуск напоминания для записи %s: статус %s не подходит для напоминания",
-                    booking.name,
-                    booking.state
-                )
-                continue
 
             date_str = booking.booking_date.strftime('%d.%m.%Y') if booking.booking_date else '-'
             start = self._format_time_value(booking.start_time) if booking.start_time is not None else '--:--'
             end = self._format_time_value(booking.end_time) if booking.end_time is not None else '--:--'
             center = booking.sports_center_id.name or '-'
 
-            if reminder_type == '1day':
-                message = (
-                    "🔔 Напоминание о тренировке\n\n"
-                    f"Завтра у вас тренировка в спортивном центре {center}\n"
-                    f"Время: {start} — {end}\n"
-                    f"Дата: {date_str}"
-                )
-            elif reminder_type == '2hours':
-                message = (
-                    "🔔 Напоминание о тренировке\n\n"
-                    f"Через 2 часа у вас тренировка в спортивном центре {center}\n"
-                    f"Время: {start} — {end}\n"
-                    f"Дата: {date_str}"
-                )
-            else:
-                _logger.warning("Неизвестный тип напоминания: %s", reminder_type)
-                continue
+            message = (
+                "🔔 Напоминание о тренировке\n\n"
+                f"{lead} у вас тренировка в спортивном центре {center}\n"
+                f"Время: {start} — {end}\n"
+                f"Дата: {date_str}"
+            )
 
             try:
                 partner._send_telegram_message(message)
                 _logger.info(
-                    "Отправлено напоминание %s для записи %s клиенту %s",
-                    reminder_type,
+                    "Отправлено напоминание за %s ч для записи %s клиенту %s",
+                    offset,
                     booking.name,
                     partner.name
                 )
-                
-                # Отмечаем, что напоминание отправлено
-                vals = {}
-                if reminder_type == '1day':
-                    vals['reminder_1day_sent'] = True
-                elif reminder_type == '2hours':
-                    vals['reminder_2hours_sent'] = True
-                
-                if vals:
-                    booking.write(vals)
-                    
             except Exception as e:
                 _logger.exception(
-                    "Ошибка при отправке напоминания %s для записи %s: %s",
-                    reminder_type,
+                    "Ошибка при отправке напоминания за %s ч для записи %s: %s",
+                    offset,
                     booking.name,
                     e
                 )
-    
+
+    @api.model
+    def _format_reminder_lead(self, offset):
+        """«Завтра», «Через 2 часа», «Через 1 ч 30 мин» — для текста напоминания"""
+        if offset == 24:
+            return "Завтра"
+        minutes = round(offset * 60)
+        if minutes % 60:
+            hours, minutes = divmod(minutes, 60)
+            return f"Через {hours} ч {minutes} мин" if hours else f"Через {minutes} мин"
+        hours = minutes // 60
+        if hours % 10 == 1 and hours % 100 != 11:
+            word = 'час'
+        elif hours % 10 in (2, 3, 4) and hours % 100 not in (12, 13, 14):
+            word = 'часа'
+        else:
+            word = 'часов'
+        return f"Через {hours} {word}"
+
     @api.model
     def send_training_reminders(self):
-        """Отправляет напоминания о предстоящих тренировках.
+        """Отправляет напоминания, срок которых наступил.
         Вызывается cron job'ом периодически.
+
+        Записи выбираются по индексу next_reminder_at, после постановки
+        сообщений в очередь все записи пакета отмечаются одним UPDATE.
         """
-        today = fields.Date.today()
-        tomorrow = today + timedelta(days=1)
-        now = datetime.now()
-        
-        # Напоминания за день до тренировки
-        bookings_1day = self.search([
-            ('booking_date', '=', tomorrow),
-            ('state', 'in', ['confirmed', 'in_progress']),
-            ('reminder_1day_sent', '=', False),
-        ])
-        
-        if bookings_1day:
-            _logger.info("Найдено %d тренировок для напоминания за день", len(bookings_1day))
-            bookings_1day._send_training_reminder('1day')
-        
-        # Напоминания за 2 часа до тренировки
-        # Ищем тренировки на сегодня, где start_time примерно через 2 часа от текущего времени
-        current_hour = now.hour + now.minute / 60.0
-        target_hour_min = current_hour + 2.0  # Через 2 часа
-        target_hour_max = current_hour + 2.5  # Небольшой запас (30 минут)
-        
-        bookings_2hours = self.search([
-            ('booking_date', '=', today),
-            ('state', 'in', ['confirmed', 'in_progress']),
-            ('reminder_2hours_sent', '=', False),
-            ('start_time', '>=', target_hour_min),
-            ('start_time', '<=', target_hour_max),
-        ])
-        
-        if bookings_2hours:
-            _logger.info("Найдено %d тренировок для напоминания за 2 часа", len(bookings_2hours))
-            bookings_2hours._send_training_reminder('2hours')
-        
+        for _batch in range(REMINDER_MAX_BATCHES):
+            count = self._send_due_reminders()
+            self.env.cr.commit()
+            if count < REMINDER_BATCH_SIZE:
+                break
         return True
+
+    @api.model
+    def _send_due_reminders(self, limit=REMINDER_BATCH_SIZE):
+        cr = self.env.cr
+        now = fields.Datetime.now()
+        self.flush_model(['next_reminder_at', 'next_reminder_offset', 'reminder_sent_offset'])
+        cr.execute("""
+            SELECT id, next_reminder_offset
+              FROM training_booking
+             WHERE next_reminder_at IS NOT NULL
+               AND next_reminder_at <= %s
+             ORDER BY next_reminder_at
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, (now, limit))
+        rows = cr.fetchall()
+        if not rows:
+            return 0
+        bookings = self.browse([booking_id for booking_id, _offset in rows])
+        offsets = dict(rows)
+        _logger.info("Найдено %d тренировок для напоминания", len(bookings))
+
+        by_offset = {}
+        for booking in bookings:
+            by_offset.setdefault(offsets[booking.id], []).append(booking.id)
+        for offset, booking_ids in by_offset.items():
+            self.browse(booking_ids)._send_training_reminder(offset)
+
+        # Следующее напоминание каждой записи считается здесь же и пишется вместе с отметкой об отправке
+        ids, sent, next_at, next_offset = [], [], [], []
+        for booking in bookings:
+            due, offset = self._get_next_reminder(
+                booking.booking_datetime_start,
+                booking.sports_center_id._get_reminder_offsets(),
+                offsets[booking.id],
+                now,
+            )
+            ids.append(booking.id)
+            sent.append(offsets[booking.id])
+            next_at.append(due or None)
+            next_offset.append(offset)
+        cr.execute("""
+            UPDATE training_booking b
+               SET reminder_sent_offset = v.sent,
+                   next_reminder_at = v.next_at,
+                   next_reminder_offset = v.next_offset
+              FROM unnest(%s::int[], %s::float8[], %s::timestamp[], %s::float8[]) AS v(id, sent, next_at, next_offset)
+             WHERE b.id = v.id
+        """, (ids, sent, next_at, next_offset))
+        bookings.invalidate_recordset(['reminder_sent_offset', 'next_reminder_at', 'next_reminder_offset'])
+        return len(rows)
     
     @api.model
     def auto_update_training_states(self):
-        """Автоматически обновляет статусы тренировок на основе текущего времени"""
-        now = datetime.now()
-        today = fields.Date.today()
-        
-        # Находим подтвержденные тренировки, которые должны начаться
-        confirmed_bookings = self.search([
+        """Автоматически обновляет статусы тренировок на основе текущего времени.
+
+        Переходы выполняются двумя пакетными write по хранимым
+        booking_datetime_start/end (частичные индексы по статусу), поэтому
+        стоимость запуска не зависит от числа тренировок за день. write пишет
+        историю изменений пакетом.
+        """
+        now = fields.Datetime.now()
+        # Как и раньше, обрабатываются только сегодняшние тренировки: давние неотмеченные записи не трогаем
+        day_start = datetime.combine(now.date(), datetime.min.time())
+
+        # Подтвержденные тренировки, время начала которых наступило
+        started = self.search([
             ('state', '=', 'confirmed'),
-            ('booking_date', '=', today),
+            ('booking_datetime_start', '>=', day_start),
+            ('booking_datetime_start', '<=', now),
         ])
-        
-        for booking in confirmed_bookings:
-            if booking.start_time is not None:
-                start_hour = int(booking.start_time)
-                start_min = int((booking.start_time - start_hour) * 60)
-                start_datetime = datetime.combine(booking.booking_date, datetime.min.time()).replace(
-                    hour=start_hour, minute=start_min, second=0
-                )
-                
-                # Если время начала наступило или прошло, меняем статус на "в процессе"
-                if now >= start_datetime:
-                    booking.state = 'in_progress'
-                    _logger.info(f"Автоматически изменен статус тренировки {booking.name} на 'в процессе'")
-        
-        # Находим тренировки в процессе, которые должны завершиться
-        in_progress_bookings = self.search([
+        if started:
+            started.write({'state': 'in_progress'})
+            started._notify_state_change()
+            _logger.info(f"Автоматически изменен статус {len(started)} тренировок на 'в процессе': {', '.join(started.mapped('name'))}")
+
+        # Тренировки в процессе, время окончания которых наступило (включая только что начатые,
+        # если cron какое-то время не запускался)
+        finished = self.search([
             ('state', '=', 'in_progress'),
-            ('booking_date', '=', today),
+            ('booking_datetime_end', '>=', day_start),
+            ('booking_datetime_end', '<=', now),
         ])
-        
-        for booking in in_progress_bookings:
-            if booking.end_time is not None:
-                end_hour = int(booking.end_time)
-                end_min = int((booking.end_time - end_hour) * 60)
-                end_datetime = datetime.combine(booking.booking_date, datetime.min.time()).replace(
-                    hour=end_hour, minute=end_min, second=0
-                )
-                
-                # Если время окончания наступило или прошло, меняем статус на "завершена"
-                if now >= end_datetime:
-                    booking.state = 'completed'
-                    _logger.info(f"Автоматически изменен статус тренировки {booking.name} на 'завершена'")
-        
+        if finished:
+            finished.write({'state': 'completed'})
+            finished._notify_state_change()
+            _logger.info(f"Автоматически изменен статус {len(finished)} тренировок на 'завершена': {', '.join(finished.mapped('name'))}")
+
+        self._schedule_next_state_update(now)
         return True
+
+    @api.model
+    def _schedule_next_state_update(self, now):
+        """Запускает cron точно ко времени ближайшего начала или окончания тренировки,
+        если оно наступит раньше следующего планового запуска (раз в минуту)"""
+        next_start = self.search([
+            ('state', '=', 'confirmed'),
+            ('booking_datetime_start', '>', now),
+        ], order='booking_datetime_start', limit=1).booking_datetime_start
+        next_end = self.search([
+            ('state', '=', 'in_progress'),
+            ('booking_datetime_end', '>', now),
+        ], order='booking_datetime_end', limit=1).booking_datetime_end
+        due = min(filter(None, (next_start, next_end)), default=False)
+        if due and due < now + timedelta(minutes=1):
+            cron = self.env.ref('tennis_club_management.ir_cron_auto_update_training_states', raise_if_not_found=False)
+            if cron:
+                cron.sudo()._trigger(at=due)
+
+    def _notify_state_change(self):
+        """Сообщает открытым формам записей о смене статуса через шину.
+
+        Уведомление уходит группам клуба (на них браузер подписан
+        автоматически) после фиксации транзакции; форма перечитывает запись.
+        """
+        if not self:
+            return
+        groups = self.env['res.groups']
+        for xmlid in STATE_NOTIFICATION_GROUPS:
+            groups |= self.env.ref(xmlid, raise_if_not_found=False) or self.env['res.groups']
+        payload = {'ids': self.ids, 'state': self[0].state}
+        self.env['bus.bus']._sendmany([
+            (group, BOOKING_STATE_NOTIFICATION, payload) for group in groups
+        ])
     
+    @api.model
+    def _get_free_mask(self, court, booking_date, trainer_id=False, sports_center_id=False):
+        """Маска свободных слотов корта на дату: рабочее время центра без занятых
+        и прошедших слотов, а при указанном тренере — только внутри его доступности
+        и вне его тренировок на других кортах.
+        """
+        free = covered_mask(court.work_start_time, court.work_end_time)
+        occupied = self._get_court_occupancy(court.id, booking_date)
+        free &= ~occupied
+        if trainer_id and sports_center_id:
+            availability = self._get_trainer_availability_masks([trainer_id], sports_center_id, booking_date, booking_date)
+            free &= availability.get((trainer_id, booking_date), 0)
+        if trainer_id:
+            # Тренер не может вести две тренировки одновременно на разных кортах
+            busy = self._get_busy_masks(booking_date, booking_date, trainer_ids=[trainer_id])
+            free &= ~busy.get(('trainer', trainer_id, booking_date), 0)
+        if booking_date == fields.Date.today():
+            free &= ~self._get_past_mask(self._get_slot_step(court.sports_center_id))
+        return free
+
+    @api.model
+    def _get_past_mask(self, step):
+        """Маска прошедших слотов сегодняшнего дня: текущий шаг сетки ещё можно занять, более ранние — нет"""
+        now = datetime.now()
+        current = (now.hour * 60 + now.minute) * OCCUPANCY_SLOTS_PER_HOUR // 60 // step * step
+        return (1 << current) - 1
+
     @api.model
     def get_available_times(self, court_id, booking_date, trainer_id=False, sports_center_id=False):
         """Возвращает список доступного времени для корта на дату с учётом доступности тренера.
-        Возвращаются часовые интервалы.
+        Шаг интервалов задаётся настройкой центра (15, 30 или 60 минут).
         """
         if not court_id or not booking_date:
             return []
@@ -1785,105 +2373,373 @@ class TrainingBooking(models.Model):
         court = self.env['tennis.court'].browse(court_id)
         if not court.exists():
             return []
-        
-        # Получаем время работы корта
-        start_hour = int(court.work_start_time)
-        end_hour = int(court.work_end_time)
-        
-        # Создаем список всех возможных часов (только целые часы)
-        available_times = []
+
+        # Свободные слоты дня — одна маска: рабочее время, занятость корта, доступность тренера
+        free = self._get_free_mask(court, booking_date, trainer_id, sports_center_id)
+        step = self._get_slot_step(court.sports_center_id)
+        first = math.ceil(court.work_start_time * OCCUPANCY_SLOTS_PER_HOUR)
+        last = math.floor(court.work_end_time * OCCUPANCY_SLOTS_PER_HOUR)
+        free_times = []
+        for index in free_starts(free, first, last, step, step):
+            value = index / OCCUPANCY_SLOTS_PER_HOUR
+            free_times.append({'value': value, 'label': self._format_time_value(value)})
+        return free_times
+
+    @api.model
+    def _get_slot_step(self, center):
+        """Шаг сетки расписания центра в 15-минутных слотах"""
+        minutes = center._get_slot_minutes() if center else 60
+        return minutes * OCCUPANCY_SLOTS_PER_HOUR // 60
+
+    @api.model
+    def get_available_slots(self, court_id, booking_date, trainer_id=False, sports_center_id=False):
+        """Доступные времена начала вместе с допустимыми временами окончания.
+
+        Окончание допустимо, если все интервалы от начала до него свободны,
+        поэтому для шага выбора окончания повторный запрос не нужен.
+        """
+        free_times = self.get_available_times(court_id, booking_date, trainer_id, sports_center_id)
+        if not free_times:
+            return []
+        step = self._get_slot_step(self.env['tennis.court'].browse(court_id).sports_center_id) / OCCUPANCY_SLOTS_PER_HOUR
+        free_values = {float(t['value']) for t in free_times}
+        slots = []
+        for slot in free_times:
+            ends = []
+            end = float(slot['value']) + step
+            while True:
+                ends.append({'value': end, 'label': self._format_time_value(end)})
+                if end not in free_values:
+                    break
+                end += step
+            slots.append(dict(slot, ends=ends))
+        return slots
+
+    @api.model
+    def _get_bookable_courts(self, center):
+        return self.env['tennis.court'].search_fetch([
+            ('sports_center_id', '=', center.id),
+            ('state', '=', 'available'),
+        ], ['name', 'work_start_time', 'work_end_time'])
+
+    @api.model
+    def _get_period_occupancy(self, court_ids, date_from, date_to):
+        """Занятость кортов за период одним запросом: (корт, дата) -> маска слотов"""
+        occupancy = {}
+        if not court_ids:
+            return occupancy
+        bookings = self.sudo().search_fetch([
+            ('court_id', 'in', list(court_ids)),
+            ('booking_date', '>=', date_from),
+            ('booking_date', '<=', date_to),
+            ('state', 'in', list(OCCUPANCY_STATES)),
+        ], ['court_id', 'booking_date', 'start_time', 'end_time'])
+        for booking in bookings:
+            key = (booking.court_id.id, booking.booking_date)
+            occupancy[key] = occupancy.get(key, 0) | occupancy_mask(booking.start_time, booking.end_time)
+        return occupancy
+
+    @api.model
+    def _get_trainer_availability_masks(self, trainer_ids, sports_center_id, date_from, date_to):
+        """Доступность тренеров за период одним запросом: (тренер, дата) -> маска слотов.
+
+        В маску попадают только слоты, целиком покрытые интервалом доступности,
+        как того требует _check_trainer_availability.
+        """
+        masks = {}
+        if not trainer_ids:
+            return masks
+        period_start = datetime.combine(date_from, datetime.min.time())
+        period_end = datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+        availabilities = self.env['trainer.availability'].sudo().search_fetch([
+            ('employee_id', 'in', list(trainer_ids)),
+            ('sports_center_id', '=', sports_center_id),
+            ('start_datetime', '<', period_end),
+            ('end_datetime', '>', period_start),
+        ], ['employee_id', 'start_datetime', 'end_datetime'])
+        for av in availabilities:
+            start_dt = max(av.start_datetime, period_start)
+            end_dt = min(av.end_datetime, period_end)
+            # Интервал может захватывать несколько дней — режем его по суткам
+            day_start = datetime.combine(start_dt.date(), datetime.min.time())
+            while day_start < end_dt:
+                start = max((start_dt - day_start).total_seconds() / 3600, 0.0)
+                end = min((end_dt - day_start).total_seconds() / 3600, 24.0)
+                key = (av.employee_id.id, day_start.date())
+                masks[key] = masks.get(key, 0) | covered_mask(start, end)
+                day_start += timedelta(days=1)
+        return masks
+
+    @api.model
+    def get_availability_grid(self, sports_center_id, date_from, date_to, trainer_id=None, training_type_id=None):
+        """Сетка свободного времени центра: корты × дни × интервалы, за один проход.
+
+        Занятость всех кортов на весь период читается одним запросом, доступность
+        тренера — вторым, поэтому недельный календарь строится одним RPC.
+        Интервалы идут с шагом расписания центра (slot_minutes);
+        grid[i][j][k] = 1, если корт courts[i] свободен в день days[j] с times[k].
+        С training_type_id дополнительно возвращается цена часа (с надбавкой тренера).
+        """
+        date_from = fields.Date.to_date(date_from)
+        date_to = fields.Date.to_date(date_to)
+        center = self.env['sports.center'].browse(sports_center_id).exists()
+        if not center or not date_from or not date_to or date_to < date_from:
+            return {}
+
+        courts = self._get_bookable_courts(center)
+        days = [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+        step = self._get_slot_step(center)
+        first = math.ceil(center.work_start_time * OCCUPANCY_SLOTS_PER_HOUR)
+        last = math.floor(center.work_end_time * OCCUPANCY_SLOTS_PER_HOUR)
+        columns = list(range(first, last - step + 1, step))
+        occupancy = self._get_period_occupancy(courts.ids, date_from, date_to)
+        availability = busy = None
+        if trainer_id:
+            availability = self._get_trainer_availability_masks([trainer_id], center.id, date_from, date_to)
+            busy = self._get_busy_masks(date_from, date_to, trainer_ids=[trainer_id])
+
         today = fields.Date.today()
-        current_hour = None
-        
-        # Если выбранная дата - сегодня, получаем текущий час
-        if booking_date == today:
-            now = datetime.now()
-            current_hour = now.hour
-        
-        for hour in range(start_hour, end_hour):
-            # Пропускаем прошедшие часы для сегодняшней даты
-            if current_hour is not None and hour < current_hour:
-                continue
-            available_times.append({
-                'value': hour,
-                'label': f"{hour:02d}:00"
+        past = self._get_past_mask(step)
+        need = (1 << step) - 1
+        grid = []
+        for court in courts:
+            # Свободным считается только время работы самого корта, как в book_slot и _check_court_availability
+            work = covered_mask(court.work_start_time, court.work_end_time)
+            court_rows = []
+            for day in days:
+                if day < today:
+                    court_rows.append([0] * len(columns))
+                    continue
+                free = work & ~occupancy.get((court.id, day), 0)
+                if availability is not None:
+                    free &= availability.get((trainer_id, day), 0) & ~busy.get(('trainer', trainer_id, day), 0)
+                if day == today:
+                    free &= ~past
+                court_rows.append([1 if (free >> index) & need == need else 0 for index in columns])
+            grid.append(court_rows)
+
+        result = {
+            'courts': [{'id': court.id, 'name': court.name} for court in courts],
+            'days': [fields.Date.to_string(day) for day in days],
+            'slot_minutes': center._get_slot_minutes(),
+            'times': [index / OCCUPANCY_SLOTS_PER_HOUR for index in columns],
+            'grid': grid,
+        }
+        if training_type_id:
+            # Цена считается теми же вычисляемыми полями, что и у записи
+            probe = self.new({
+                'sports_center_id': center.id,
+                'training_type_id': training_type_id,
+                'trainer_id': trainer_id or False,
             })
-        
-        # Получаем занятые времена
-        occupied_bookings = self.search([
-            ('court_id', '=', court_id),
-            ('booking_date', '=', booking_date),
-            ('state', 'in', ['confirmed', 'in_progress'])
-        ])
-        
-        occupied_times = set()
-        for booking in occupied_bookings:
-            # Добавляем все занятые времена (шаг 1 час)
-            current_time = int(booking.start_time)  # Округляем до целого часа
-            end_time_int = int(booking.end_time) if booking.end_time else current_time + 1
-            while current_time < end_time_int:
-                occupied_times.add(float(current_time))
-                current_time += 1  # 1 час
-        
-        # Базовые свободные времена (только по занятости корта)
-        free_times = [time for time in available_times if time['value'] not in occupied_times]
+            result['price_per_hour'] = probe.final_price_per_hour
+        return result
 
-        # Если указан тренер и спортцентр — пересекаем с его доступностью на этот день
-        if trainer_id and sports_center_id:
-            Avail = self.env['trainer.availability']
-            # Берём доступности, которые пересекаются с выбранным днём
-            day_start = datetime.combine(booking_date, datetime.min.time())
-            day_end = datetime.combine(booking_date, datetime.max.time())
-            availabilities = Avail.search([
-                ('employee_id', '=', trainer_id),
-                ('sports_center_id', '=', sports_center_id),
-                ('start_datetime', '<=', day_end),
-                ('end_datetime', '>=', day_start),
-            ])
-
-            if not availabilities:
-                return []
-
-            allowed_values = set()
-            for av in availabilities:
-                start_dt = max(av.start_datetime, day_start)
-                end_dt = min(av.end_datetime, day_end)
-                # Переведём в шаг 1 час как float-значения часов
-                current = start_dt
-                while current < end_dt:
-                    hour_float = current.hour  # Только целые часы
-                    allowed_values.add(float(hour_float))
-                    current += timedelta(hours=1)  # Шаг 1 час
-
-            free_times = [t for t in free_times if t['value'] in allowed_values]
-        
-        return free_times
+    @api.model
+    def find_free_slots(self, sports_center_id, training_type_id, date_from, date_to, trainer_id=False,
+                        time_from=False, time_to=False, limit=5, customer_id=False):
+        """Ближайшие свободные сочетания (корт, тренер, начало) для типа тренировки.
+
+        Занятость кортов и доступность всех тренеров центра за период читаются
+        двумя запросами, дальше слоты подбираются пересечением битовых масок.
+        Длительность берётся из типа тренировки; time_from/time_to ограничивают
+        время суток. Предпочтительный тренер (trainer_id) идёт первым, остальные —
+        следом; внутри — по дате и времени начала. Для каждого (дата, начало,
+        тренер) возвращается один корт. Тренеры, занятые на других кортах, и время,
+        когда клиент (customer_id) уже записан, исключаются.
+        """
+        date_from = fields.Date.to_date(date_from)
+        date_to = fields.Date.to_date(date_to)
+        center = self.env['sports.center'].browse(sports_center_id).exists()
+        training_type = self.env['training.type'].browse(training_type_id).exists()
+        if not center or not training_type or not date_from or not date_to or date_to < date_from:
+            return []
+        today = fields.Date.today()
+        date_from = max(date_from, today)
+        if date_to < date_from:
+            return []
+        limit = max(1, min(int(limit or 5), 50))
+
+        duration = training_type.duration_hours or 1.0
+        length = math.ceil(duration * OCCUPANCY_SLOTS_PER_HOUR)
+        step = self._get_slot_step(center)
+        # Начала идут по сетке центра от начала рабочего дня, внутри запрошенной части суток
+        first = math.ceil(center.work_start_time * OCCUPANCY_SLOTS_PER_HOUR)
+        last = math.floor(center.work_end_time * OCCUPANCY_SLOTS_PER_HOUR)
+        if time_from:
+            first += max(0, math.ceil((float(time_from) * OCCUPANCY_SLOTS_PER_HOUR - first) / step)) * step
+        if time_to:
+            last = min(last, math.floor(float(time_to) * OCCUPANCY_SLOTS_PER_HOUR))
+        if first + length > last:
+            return []
+
+        courts = self._get_bookable_courts(center)
+        trainers = self.env['hr.employee'].sudo().search_fetch([
+            ('sports_center_id', '=', center.id),
+            ('position', '=', 'trainer'),
+        ], ['name'])
+        if not courts or not trainers:
+            return []
+        occupancy = self._get_period_occupancy(courts.ids, date_from, date_to)
+        availability = self._get_trainer_availability_masks(trainers.ids, center.id, date_from, date_to)
+        busy = self._get_busy_masks(date_from, date_to, trainers.ids, [customer_id] if customer_id else [])
+
+        past = self._get_past_mask(step)
+        need = (1 << length) - 1
+        # Корт подходит, только если слот целиком внутри его собственного времени работы (как в book_slot)
+        court_work = {court.id: covered_mask(court.work_start_time, court.work_end_time) for court in courts}
+        found = []
+        for (employee_id, day), allowed in availability.items():
+            if day < date_from or day > date_to:
+                continue
+            allowed &= ~busy.get(('trainer', employee_id, day), 0) & ~busy.get(('partner', customer_id, day), 0)
+            if day == today:
+                allowed &= ~past
+            for index in free_starts(allowed, first, last, step, length):
+                mask = need << index
+                court = next((
+                    c for c in courts
+                    if court_work[c.id] & mask == mask and not occupancy.get((c.id, day), 0) & mask
+                ), None)
+                if court:
+                    found.append((employee_id != trainer_id, day, index / OCCUPANCY_SLOTS_PER_HOUR, employee_id, court))
+
+        found.sort(key=lambda item: item[:3])
+        trainer_names = {trainer.id: trainer.name for trainer in trainers}
+        return [
+            {
+                'booking_date': fields.Date.to_string(day),
+                'start_time': start,
+                'end_time': start + duration,
+                'start_time_display': self._format_time_value(start),
+                'end_time_display': self._format_time_value(start + duration),
+                'court_id': court.id,
+                'court': court.name,
+                'trainer_id': trainer,
+                'trainer': trainer_names.get(trainer, ''),
+            }
+            for _preferred, day, start, trainer, court in found[:limit]
+        ]
+
+    @api.model
+    def _lock_court(self, court_id):
+        """Блокирует корт до конца транзакции для последовательного бронирования.
+
+        Строка корта изменяется, а не только блокируется: под REPEATABLE READ
+        запрос, снимок которого сделан до фиксации параллельной записи на этот
+        корт, получает ошибку сериализации, и Odoo повторяет его с новым снимком,
+        в котором занятость уже видна.
+        """
+        self.env.cr.execute("UPDATE tennis_court SET write_date = write_date WHERE id = %s", (court_id,))
+
+    @api.model
+    def book_slot(self, sports_center_id, court_id, booking_date, start_time, end_time,
+                  customer_id, training_type_id, trainer_id=False):
+        """Атомарно бронирует слот: проверяет доступность, создаёт запись,
+        списывает баланс и подтверждает её в одной транзакции.
+
+        Перед проверкой занятости запрос блокирует корт (см. _lock_court), поэтому
+        два запроса на один корт выполняются по очереди, даже если ограничение
+        исключения training_booking_court_overlap_excl в базе не создано.
+        Ограничение остаётся второй линией защиты: нарушение даёт 'slot_taken'.
+        Возвращает словарь с 'success' и данными записи либо 'error_code'/'error'.
+        """
+        def failure(code, message):
+            return {'success': False, 'error_code': code, 'error': message}
+
+        slot_taken = _('Выбранное время уже занято. Выберите другое время.')
+        if isinstance(booking_date, str):
+            try:
+                booking_date = fields.Date.from_string(booking_date)
+            except (ValueError, TypeError):
+                return failure('invalid', _('Неверная дата'))
+        start_time = float(start_time)
+        end_time = float(end_time)
+        if not booking_date or end_time <= start_time:
+            return failure('invalid', _('Неверное время тренировки'))
+        customer = self.env['res.partner'].browse(customer_id).exists()
+        if not customer:
+            return failure('customer_not_found', _('Клиент не найден'))
+
+        court = self.env['tennis.court'].browse(court_id).exists()
+        if not court:
+            return failure('invalid', _('Корт не найден'))
+        self._lock_court(court.id)
+        need = occupancy_mask(start_time, end_time)
+        if self._get_free_mask(court, booking_date, trainer_id, sports_center_id) & need != need:
+            return failure('slot_taken', slot_taken)
+
+        try:
+            with self.env.cr.savepoint():
+                booking = self.create({
+                    'sports_center_id': sports_center_id,
+                    'customer_id': customer.id,
+                    'training_type_id': training_type_id,
+                    'court_id': court_id,
+                    'booking_date': booking_date,
+                    'start_time': start_time,
+                    'end_time': end_time,
+                    'trainer_id': trainer_id or False,
+                    'state': 'draft',
+                })
+                booking.action_confirm()
+        except (CourtOverlapError, psycopg2.errors.ExclusionViolation):
+            # savepoint сбрасывает изменения в базу при выходе, поэтому ограничение срабатывает здесь
+            return failure('slot_taken', slot_taken)
+        except (UserError, ValidationError) as e:
+            return failure('rejected', e.args[0] if e.args else str(e))
+
+        return {
+            'success': True,
+            'booking_id': booking.id,
+            'name': booking.name,
+            'booking_date': fields.Date.to_string(booking.booking_date),
+            'start_time': booking.start_time,
+            'end_time': booking.end_time,
+            'start_time_display': booking.start_time_display,
+            'end_time_display': booking.end_time_display,
+            'court': booking.court_id.name,
+            'trainer': booking.trainer_id.name or '',
+            'total_price': booking.total_price,
+            'balance': customer.balance,
+            'state': booking.state,
+        }
 
     @api.constrains('booking_date', 'start_time', 'end_time', 'trainer_id', 'sports_center_id')
     def _check_trainer_availability(self):
-        """Запретить запись вне интервалов доступности тренера"""
-        Avail = self.env['trainer.availability']
-        for booking in self:
-            if not booking.trainer_id or not booking.sports_center_id:
-                continue
-            # Построим datetime начала/окончания из даты и float-часов
-            start_hour = int(booking.start_time)
-            start_min = int((booking.start_time - start_hour) * 60)
-            end_hour = int(booking.end_time)
-            end_min = int((booking.end_time - end_hour) * 60)
-            start_dt = datetime.combine(booking.booking_date, datetime.min.time()).replace(hour=start_hour, minute=start_min, second=0)
-            end_dt = datetime.combine(booking.booking_date, datetime.min.time()).replace(hour=end_hour, minute=end_min, second=0)
-
-            avail = Avail.search_count([
-                ('employee_id', '=', booking.trainer_id.id),
-                ('sports_center_id', '=', booking.sports_center_id.id),
-                ('start_datetime', '<=', start_dt),
-                ('end_datetime', '>=', end_dt),
-            ])
-            if avail == 0:
-                raise ValidationError(_(
-                    'Выбранное время не входит в доступность тренера. Выберите время внутри зелёных интервалов.'
-                ))
+        """Запретить запись вне интервалов доступности тренера.
+
+        Все записи набора проверяются одним запросом: ищется запись, для которой
+        нет интервала доступности тренера, целиком покрывающего время тренировки.
+        """
+        if not self:
+            return
+        self.flush_model(['booking_date', 'start_time', 'end_time', 'trainer_id', 'sports_center_id'])
+        self.env['trainer.availability'].flush_model(['employee_id', 'sports_center_id', 'start_datetime', 'end_datetime'])
+        self.env.cr.execute("""
+            SELECT b.id
+              FROM training_booking b
+             WHERE b.id IN %s
+               AND b.trainer_id IS NOT NULL
+               AND b.sports_center_id IS NOT NULL
+               AND NOT EXISTS (
+                    SELECT 1
+                      FROM trainer_availability a
+                     WHERE a.employee_id = b.trainer_id
+                       AND a.sports_center_id = b.sports_center_id
+                       AND a.start_datetime <= b.booking_date + make_interval(
+                               hours => floor(b.start_time)::int,
+                               mins => floor((b.start_time - floor(b.start_time)) * 60)::int)
+                       AND a.end_datetime >= b.booking_date + make_interval(
+                               hours => floor(b.end_time)::int,
+                               mins => floor((b.end_time - floor(b.end_time)) * 60)::int)
+               )
+             LIMIT 1
+        """, (tuple(self.ids),))
+        if self.env.cr.fetchone():
+            raise ValidationError(_(
+                'Выбранное время не входит в доступность тренера. Выберите время внутри зелёных интервалов.'
+            ))
 
     
     @api.onchange('trainer_id', 'sports_center_id')
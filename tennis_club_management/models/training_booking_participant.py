@@ -13,6 +13,7 @@ class TrainingBookingParticipant(models.Model):
         'training.booking',
         string='Запись на тренировку',
         required=True,
+        index=True,
         ondelete='cascade',
         help='Запись на тренировку'
     )
@@ -21,6 +22,7 @@ class TrainingBookingParticipant(models.Model):
         'res.partner',
         string='Участник',
         required=True,
+        index=True,
         domain=[('is_company', '=', False), ('is_employee', '=', False), ('telegram_chat_id', '!=', False)],
         help='Участник тренировки'
     )
@@ -254,6 +256,11 @@ class TrainingBookingParticipant(models.Model):
         
         return participants
     
+    @api.constrains('booking_id', 'participant_id')
+    def _check_participant_conflicts(self):
+        """Участник не может быть записан на две тренировки в одно время"""
+        self.booking_id._check_person_conflicts()
+
     @api.constrains('booking_id', 'participant_id')
     def _check_participants_limit(self):
         """Проверяет лимит участников для типа тренировки"""
@@ -94,6 +94,16 @@ class TrainingGroup(models.Model):
                     )
                 )
     
+    @api.constrains('participant_ids')
+    def _check_participant_conflicts(self):
+        """Новые участники группы не должны быть заняты во время её будущих тренировок"""
+        bookings = self.env['training.booking'].search([
+            ('group_id', 'in', self.ids),
+            ('state', 'in', ['confirmed', 'in_progress']),
+            ('booking_date', '>=', fields.Date.today()),
+        ])
+        bookings._check_person_conflicts()
+
     def write(self, vals):
         """Переопределяем write для отправки уведомлений при добавлении участников"""
         # Получаем старые участники до изменения
@@ -3,6 +3,9 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
 
+# Поля типа, влияющие на матрицу цен записей (цена и категория надбавки тренера)
+PRICE_MATRIX_FIELDS = {'price_per_hour', 'category', 'code', 'name', 'active'}
+
 
 class TrainingType(models.Model):
     _name = 'training.type'
@@ -147,6 +150,24 @@ class TrainingType(models.Model):
                     _('Минимальное количество участников не может быть больше максимального')
                 )
     
+    @api.model_create_multi
+    def create(self, vals_list):
+        training_types = super().create(vals_list)
+        # Цена и категория типа входят в кэшируемую матрицу цен записей
+        self.env.registry.clear_cache()
+        return training_types
+
+    def write(self, vals):
+        result = super().write(vals)
+        if PRICE_MATRIX_FIELDS.intersection(vals):
+            self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env.registry.clear_cache()
+        return result
+
     @api.constrains('price_per_hour')
     def _check_price(self):
         """Проверяет корректность цены"""
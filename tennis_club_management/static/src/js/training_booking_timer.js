@@ -2,26 +2,37 @@
 
 import { patch } from "@web/core/utils/patch";
 import { useService } from "@web/core/utils/hooks";
-import { Component, onMounted, onWillUnmount } from "@odoo/owl";
+import { onMounted, onWillUnmount } from "@odoo/owl";
 import { FormController } from "@web/views/form/form_controller";
 
 /**
- * Патч для FormController - обновляет таймеры тренировок в реальном времени
+ * Тип уведомления шины о смене статуса тренировок (см. training.booking._notify_state_change)
+ */
+const BOOKING_STATE_NOTIFICATION = "tennis_club_management/booking_state";
+
+/**
+ * Патч для FormController - обновляет таймеры тренировок в реальном времени.
+ *
+ * Статус меняет только сервер (cron auto_update_training_states), форма лишь
+ * показывает обратный отсчёт и перечитывает запись по уведомлению из шины.
  */
 patch(FormController.prototype, {
     setup() {
         super.setup();
         this.timerInterval = null;
-        this.orm = useService("orm");
-        this.stateChangeInProgress = false; // Флаг для предотвращения повторных изменений
         
         // Проверяем, это ли форма training.booking
         if (this.props.resModel === 'training.booking') {
+            this.busService = useService("bus_service");
+            this.onBookingStateNotification = (payload) => this.reloadOnStateChange(payload);
+            
             onMounted(() => {
+                this.busService.subscribe(BOOKING_STATE_NOTIFICATION, this.onBookingStateNotification);
                 this.startTimerUpdates();
             });
             
             onWillUnmount(() => {
+                this.busService.unsubscribe(BOOKING_STATE_NOTIFICATION, this.onBookingStateNotification);
                 this.stopTimerUpdates();
             });
         }
@@ -44,7 +55,19 @@ patch(FormController.prototype, {
         }
     },
     
-    async updateTimers() {
+    async reloadOnStateChange(payload) {
+        const record = this.model.root;
+        if (!record || !record.resId || !payload?.ids?.includes(record.resId)) {
+            return;
+        }
+        // Несохранённые изменения пользователя не затираем: новый статус подтянется при сохранении
+        if (await record.isDirty()) {
+            return;
+        }
+        await record.load();
+    },
+    
+    updateTimers() {
         const record = this.model.root;
         if (!record || !record.resId || !record.data) {
             return;
@@ -65,7 +88,6 @@ patch(FormController.prototype, {
         }
         
         const now = new Date();
-        const today = new Date(now.getFullYear(), now.getMonth(), now.getDate());
         const bookingDateObj = new Date(bookingDate);
         bookingDateObj.setHours(0, 0, 0, 0);
         
@@ -75,26 +97,8 @@ patch(FormController.prototype, {
             const startMin = Math.round((startTime - startHour) * 60);
             const startDateTime = new Date(bookingDateObj);
             startDateTime.setHours(startHour, startMin, 0, 0);
-            
-            if (startDateTime > now) {
-                const delta = startDateTime - now;
-                const totalSeconds = Math.floor(delta / 1000);
-                const hours = Math.floor(totalSeconds / 3600);
-                const minutes = Math.floor((totalSeconds % 3600) / 60);
-                const seconds = totalSeconds % 60;
-                
-                // Обновляем значение напрямую в DOM для мгновенного отображения
-                const hoursStr = String(hours).padStart(2, '0');
-                const minutesStr = String(minutes).padStart(2, '0');
-                const secondsStr = String(seconds).padStart(2, '0');
-                this.updateTimerDisplay('time_until_start', `${hoursStr}:${minutesStr}:${secondsStr}`);
-            } else if (!this.stateChangeInProgress) {
-                // Время начала наступило - переключаем статус на "в процессе"
-                this.updateTimerDisplay('time_until_start', '00:00:00');
-                this.stateChangeInProgress = true;
-                await this.changeStateToInProgress(record);
-                this.stateChangeInProgress = false;
-            }
+            // После начала показываем нули до уведомления сервера о смене статуса
+            this.updateTimerDisplay('time_until_start', this.formatCountdown(startDateTime - now));
         }
         
         // Обновляем таймер до окончания для тренировок в процессе
@@ -103,69 +107,19 @@ patch(FormController.prototype, {
             const endMin = Math.round((endTime - endHour) * 60);
             const endDateTime = new Date(bookingDateObj);
             endDateTime.setHours(endHour, endMin, 0, 0);
-            
-            if (endDateTime > now) {
-                const delta = endDateTime - now;
-                const totalSeconds = Math.floor(delta / 1000);
-                const hours = Math.floor(totalSeconds / 3600);
-                const minutes = Math.floor((totalSeconds % 3600) / 60);
-                const seconds = totalSeconds % 60;
-                
-                // Обновляем значение напрямую в DOM для мгновенного отображения
-                const hoursStr = String(hours).padStart(2, '0');
-                const minutesStr = String(minutes).padStart(2, '0');
-                const secondsStr = String(seconds).padStart(2, '0');
-                this.updateTimerDisplay('time_until_end', `${hoursStr}:${minutesStr}:${secondsStr}`);
-            } else if (!this.stateChangeInProgress) {
-                // Время окончания наступило - переключаем статус на "завершена"
-                this.updateTimerDisplay('time_until_end', '00:00:00');
-                this.stateChangeInProgress = true;
-                await this.changeStateToCompleted(record);
-                this.stateChangeInProgress = false;
-            }
+            this.updateTimerDisplay('time_until_end', this.formatCountdown(endDateTime - now));
         }
     },
     
-    async changeStateToInProgress(record) {
-        try {
-            // Проверяем текущий статус перед изменением
-            if (record.data?.state !== 'confirmed') {
-                return;
-            }
-            
-            await this.orm.write(
-                'training.booking',
-                [record.resId],
-                {'state': 'in_progress'}
-            );
-            // Перезагружаем запись для обновления отображения
-            await record.load();
-            console.log('[Timer] Статус автоматически изменен на "в процессе"');
-        } catch (error) {
-            console.error('[Timer] Ошибка при изменении статуса на "в процессе":', error);
-            this.stateChangeInProgress = false;
-        }
-    },
-    
-    async changeStateToCompleted(record) {
-        try {
-            // Проверяем текущий статус перед изменением
-            if (record.data?.state !== 'in_progress') {
-                return;
-            }
-            
-            await this.orm.write(
-                'training.booking',
-                [record.resId],
-                {'state': 'completed'}
-            );
-            // Перезагружаем запись для обновления отображения
-            await record.load();
-            console.log('[Timer] Статус автоматически изменен на "завершена"');
-        } catch (error) {
-            console.error('[Timer] Ошибка при изменении статуса на "завершена":', error);
-            this.stateChangeInProgress = false;
-        }
+    formatCountdown(delta) {
+        const totalSeconds = Math.max(0, Math.floor(delta / 1000));
+        const hours = Math.floor(totalSeconds / 3600);
+        const minutes = Math.floor((totalSeconds % 3600) / 60);
+        const seconds = totalSeconds % 60;
+        const hoursStr = String(hours).padStart(2, '0');
+        const minutesStr = String(minutes).padStart(2, '0');
+        const secondsStr = String(seconds).padStart(2, '0');
+        return `${hoursStr}:${minutesStr}:${secondsStr}`;
     },
     
     updateTimerDisplay(fieldName, value) {
@@ -4,5 +4,6 @@ from . import trainer_availability_wizard
 from . import trainer_revenue_report_wizard
 from . import sports_center_analytics_wizard
 from . import full_analytics_wizard
+from . import training_recurrence_wizard
 
 
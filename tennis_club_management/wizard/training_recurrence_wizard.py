@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+
+RECURRENCE_STATUSES = [
+    ('ok', 'Свободно'),
+    ('court_busy', 'Корт занят'),
+    ('trainer_unavailable', 'Тренер недоступен'),
+    ('trainer_busy', 'Тренер занят'),
+    ('participant_busy', 'Участник занят'),
+    ('past', 'Дата в прошлом'),
+]
+
+
+class TrainingRecurrenceWizard(models.TransientModel):
+    _name = 'training.recurrence.wizard'
+    _description = 'Предпросмотр постоянных занятий'
+
+    booking_id = fields.Many2one('training.booking', string='Исходная запись', required=True, ondelete='cascade')
+    start_time = fields.Float(string='Время начала', required=True)
+    end_time = fields.Float(string='Время окончания', required=True)
+    line_ids = fields.One2many('training.recurrence.wizard.line', 'wizard_id', string='Занятия')
+    selected_count = fields.Integer(string='Будет создано', compute='_compute_counts')
+    conflict_count = fields.Integer(string='Конфликтов', compute='_compute_counts')
+
+    @api.depends('line_ids.selected', 'line_ids.status')
+    def _compute_counts(self):
+        for wizard in self:
+            wizard.selected_count = len(wizard.line_ids.filtered(lambda l: l.selected and l.status == 'ok'))
+            wizard.conflict_count = len(wizard.line_ids.filtered(lambda l: l.status != 'ok'))
+
+    def action_create(self):
+        """Создаёт все выбранные занятия серии одним create(vals_list).
+
+        Перед созданием даты ещё раз проверяются пакетно: пока открыт
+        предпросмотр, корт или тренер могли оказаться заняты.
+        """
+        self.ensure_one()
+        booking = self.booking_id
+        dates = [line.booking_date for line in self.line_ids if line.selected and line.status == 'ok']
+        if not dates:
+            raise UserError(_('Не выбрано ни одного свободного занятия.'))
+        problems = booking._check_recurrence_dates(dates, self.start_time, self.end_time)
+        if problems:
+            for line in self.line_ids:
+                if line.booking_date in problems:
+                    line.write({'status': problems[line.booking_date], 'selected': False})
+            # Показываем обновлённый предпросмотр вместо частичного создания
+            return {
+                'type': 'ir.actions.act_window',
+                'name': _('Постоянные занятия'),
+                'res_model': self._name,
+                'res_id': self.id,
+                'view_mode': 'form',
+                'target': 'new',
+            }
+        vals_list = [booking._prepare_recurrence_vals(day, self.start_time, self.end_time) for day in dates]
+        created = self.env['training.booking'].create(vals_list)
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Созданные занятия'),
+            'res_model': 'training.booking',
+            'view_mode': 'list,form',
+            'domain': [('id', 'in', created.ids)],
+            'target': 'current',
+        }
+
+
+class TrainingRecurrenceWizardLine(models.TransientModel):
+    _name = 'training.recurrence.wizard.line'
+    _description = 'Занятие в предпросмотре серии'
+    _order = 'booking_date'
+
+    wizard_id = fields.Many2one('training.recurrence.wizard', required=True, ondelete='cascade')
+    booking_date = fields.Date(string='Дата', required=True)
+    weekday = fields.Char(string='День недели', compute='_compute_weekday')
+    status = fields.Selection(RECURRENCE_STATUSES, string='Статус', required=True, default='ok')
+    selected = fields.Boolean(string='Создать', default=True)
+
+    @api.depends('booking_date')
+    def _compute_weekday(self):
+        names = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+        for line in self:
+            line.weekday = names[line.booking_date.weekday()] if line.booking_date else ''